@@ -1,8 +1,8 @@
-import sys, asyncio, csv, random, re, traceback, threading, queue, os, time
-from typing import List, Callable, Dict, Any
+import sys, os, time, sqlite3, atexit
+from contextlib import closing
+from pathlib import Path
 import streamlit as st
 import subprocess
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 try:
     import pandas as pd
 except Exception:
@@ -11,6 +11,7 @@ except Exception:
 # Ensure Playwright browsers (Chromium) are installed once
 import subprocess, os, sys, streamlit as st
 
+@st.cache_resource(show_spinner="Checking Chromium…")  # once per server process, not on every rerun
 def ensure_playwright():
     cache_dir = os.path.expanduser("~/.cache/ms-playwright")
     # already have a chromium* folder?
@@ -48,292 +49,46 @@ def ensure_playwright():
 
 ensure_playwright()
 
-
+from kijiji_scraper import (
+    ASSET_CACHE_DIR, BROWSER_RECYCLE_LISTINGS, BROWSER_RSS_LIMIT_MB, CATEGORIES, DETAIL_CONCURRENCY, FLUSH_EVERY, MAX_DETAIL_CONCURRENCY,
+    MAX_SHARD_WORKERS, PHONE_CONCURRENCY, PREVIEW_ROWS, SEEN_DB, SEEN_TTL_SECS, SHARD_PAGES, BrowserServer, JobManager,
+    output_path, stage_percentile,
+)
 
 # =========================
-# Config
+# UI config
 # =========================
-DEFAULT_URL = "https://www.kijiji.ca/b-cars-trucks/canada/c174l0?for-sale-by=ownr&view=list"
 DEFAULT_CSV = "kijiji_cars.csv"
-
-FLUSH_EVERY = 10           # write/refresh every N rows
 UI_REFRESH_SECS = 5        # auto-update UI every N seconds while running
 LOG_SCROLL_HEIGHT = 320    # px height for scrollable log once >20 lines
+# Streamlit 1.52+ takes a callable as download data and only calls it on click
+LAZY_DOWNLOADS = tuple(int(v) for v in st.__version__.split(".")[:2]) >= (1, 52)
 
-UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-      "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
-
-# ---- Windows: Proactor loop (supports subprocesses for Playwright) ----
-if sys.platform.startswith("win"):
-    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-
-# =========================
-# Helpers
-# =========================
-def safe_for_excel(value):
-    if isinstance(value, str):
-        v = value.strip()
-        if v and (v.startswith("-") or v.startswith("+")):
-            return " " + v
-        return v
-    return value
-
-async def human_pause(a=0.8, b=1.8):
-    await asyncio.sleep(random.uniform(a, b))
-
-async def with_retries(coro_fn, attempts=3, base_delay=1.5):
-    last_exc = None
-    for i in range(attempts):
-        try:
-            return await coro_fn()
-        except PlaywrightTimeoutError as e:
-            last_exc = e
-            await asyncio.sleep(base_delay * (2 ** i) + random.uniform(0.0, 0.8))
-    if last_exc:
-        raise last_exc
-
-async def create_context(p, *, headless: bool):
-    browser = await p.chromium.launch(
-        headless=headless,
-        args=[
-            "--disable-blink-features=AutomationControlled",
-            "--no-sandbox",
-            "--disable-dev-shm-usage",
-        ],
-    )
-    context = await browser.new_context(
-        user_agent=UA,
-        viewport={"width": random.randint(1280, 1600), "height": random.randint(800, 950)},
-        locale="en-CA",
-        timezone_id="America/Toronto",
-        extra_http_headers={"Accept-Language": "en-CA,en;q=0.9"},
-    )
-    await context.add_init_script(
-        "Object.defineProperty(navigator, 'webdriver', { get: () => undefined });"
-    )
-    # block heavy assets (keep CSS/JS)
-    await context.route(
-        "**/*",
-        lambda route: (
-            route.abort() if route.request.resource_type in {"image", "media", "font"} else route.continue_()
-        ),
-    )
-    context.set_default_navigation_timeout(90_000)
-    context.set_default_timeout(20_000)
-    return browser, context
-
-async def fetch_listing(context, href, referer_url: str, log: Callable[[str], None]) -> Dict[str, Any]:
-    data = {
-        'Duration Posted': '-', 'Listing Link': href, 'Name': '-', 'Price': '-',
-        'Location': '-', 'Seller Name': '-', 'Phone': '-',
-        'Seats': '-', 'Kilometres': '-', 'Body Style': '-', 'Doors': '-',
-        'Transmission': '-', 'Model': '-', 'Extra Info': '-', 'Fuel': '-'
-    }
-    page = await context.new_page()
-    try:
-        await human_pause(0.3, 1.0)
-
-        async def go():
-            return await page.goto(href, timeout=60_000, wait_until='domcontentloaded', referer=referer_url)
-        await with_retries(go, attempts=3, base_delay=1.2)
-
-        # Duration
-        tag = await page.query_selector('[data-testid="listing-date"]')
-        if tag:
-            raw = await tag.text_content()
-            if raw:
-                data['Duration Posted'] = " ".join(raw.split())
-
-        # Basic fields
-        name = await page.query_selector('h1')
-        if name:
-            data['Name'] = (await name.inner_text()).strip()
-
-        price = await page.query_selector('p[data-testid="vip-price"]')
-        if price:
-            data['Price'] = safe_for_excel((await price.inner_text()).strip())
+@st.cache_resource
+def job_manager():
+    """One job table per server process: crawls outlive the session that started them."""
+    return JobManager()
 
-        loc = await page.query_selector('[data-testid="seller-profile"] [data-testid*="location"], .bEMmoW .iCgpsX button')
-        if loc:
-            data['Location'] = (await loc.inner_text()).strip()
-
-        seller = await page.query_selector('h3 a, [data-testid="seller-profile"] h3 a')
-        if seller:
-            data['Seller Name'] = (await seller.inner_text()).strip()
-
-        # Phone: 3–6s pause then reveal
-        try:
-            await asyncio.sleep(random.uniform(3, 6))
-            reveal_btn = await page.query_selector('button:has-text("Reveal")') \
-                        or await page.query_selector("button:has(p[aria-label='Reveal phone number'])")
-            if reveal_btn:
-                try: await reveal_btn.scroll_into_view_if_needed()
-                except: pass
-                await reveal_btn.click()
-                await page.wait_for_selector('a[href^="tel:"]', timeout=5000)
-
-            phone_a = await page.query_selector('a[href^="tel:"]')
-            if phone_a:
-                data['Phone'] = safe_for_excel((await phone_a.inner_text()).strip())
-            else:
-                phone_p = await page.query_selector('p:has-text("+1-"), p:has-text("+1 ")')
-                if phone_p:
-                    data['Phone'] = safe_for_excel((await phone_p.inner_text()).strip())
-        except:
-            pass
-
-        # Vehicle details (light)
-        detail_divs = await page.query_selector_all(
-            'div.sc-eb45309b-0.iNzWBi, [data-testid="attributes"] div, [data-testid="attribute-row"]'
-        )
-        for div in detail_divs:
-            try:
-                label_tag = await div.query_selector('p.sc-82669b63-0.cqjWkX, p')
-                value_tags = await div.query_selector_all('p.sc-991ea11d-0.fgtvkm, p')
-                label = (await label_tag.inner_text()).strip() if label_tag else ''
-                values = [ (await v.inner_text()).strip() for v in value_tags ][1:] if value_tags else []
-                if label == 'Seats':
-                    data['Seats'] = safe_for_excel(', '.join(values))
-                elif label == 'Kilometres':
-                    data['Kilometres'] = safe_for_excel(', '.join(values))
-                elif label == 'Body Style':
-                    if values: data['Body Style'] = safe_for_excel(values[0])
-                    if len(values) > 1: data['Doors'] = safe_for_excel(values[1])
-                elif label == 'Transmission':
-                    data['Transmission'] = safe_for_excel(', '.join(values))
-                elif label == 'Model':
-                    if values: data['Model'] = safe_for_excel(values[0])
-                    if len(values) > 1: data['Extra Info'] = safe_for_excel(', '.join(values[1:]))
-                elif label == 'Fuel':
-                    data['Fuel'] = safe_for_excel(', '.join(values))
-            except:
-                continue
-
-    except PlaywrightTimeoutError:
-        log(f"Timeout while loading {href}")
-    except Exception as e:
-        log(f"Error scraping {href}: {e}")
-    finally:
-        await page.close()
-    return data
-
-async def scrape_kijiji(url: str, max_pages: int, csv_name: str,
-                        log: Callable[[str], None],
-                        stop_event: threading.Event,
-                        out_q: queue.Queue):
+@st.cache_resource(show_spinner="Starting Chromium…")
+def browser_server():
     """
-    Runs inside a background thread (asyncio in that thread).
-    Buffers rows and flushes CSV every FLUSH_EVERY rows (and at end).
-    Sends events to UI via out_q: {'type': 'log'|'flush'|'done'|'error', ...}
+    A warm Chromium shared by every job of this server process; each job opens
+    its own context in it. None (cached too, so reruns don't retry) if it won't start.
     """
-    total_rows = 0
-    header: List[str] = []
-    buffer: List[Dict[str, Any]] = []
-
-    def flush_to_csv(final=False):
-        nonlocal header, buffer, total_rows
-        if not buffer:
-            return
-        write_header = (not os.path.exists(csv_name)) or (total_rows == 0)
-        mode = "w" if write_header else "a"
-        with open(csv_name, mode, newline="", encoding="utf-8") as f:
-            if not header:
-                header = list(buffer[0].keys())
-            w = csv.DictWriter(f, fieldnames=header)
-            if write_header:
-                w.writeheader()
-            w.writerows(buffer)
-        total_rows += len(buffer)
-        buffer.clear()
-        out_q.put({"type": "flush", "total": total_rows, "final": final})
-
     try:
-        async with async_playwright() as p:
-            browser, context = await create_context(p, headless=True)
-
-            page = await context.new_page()
-            await page.goto(url, wait_until="domcontentloaded")
-            await page.wait_for_selector(
-                "[data-testid='srp-search-list'] section, .vAthl .vAthl div section", timeout=30_000
-            )
-
-            current_page_url = url
-            page_count = 1
-
-            while current_page_url and page_count <= max_pages and not stop_event.is_set():
-                out_q.put({"type": "log", "msg": f"Scraping Page {page_count}: {current_page_url}"})
-                await with_retries(
-                    lambda: page.goto(current_page_url, wait_until="domcontentloaded", timeout=45_000), attempts=2
-                )
-                await page.wait_for_selector(
-                    "[data-testid='srp-search-list'] section, .vAthl .vAthl div section", timeout=30_000
-                )
-
-                first_containers = await page.query_selector_all(".vAthl .vAthl div section")
-                other_containers = await page.query_selector_all("[data-testid='srp-search-list'] section")
-                all_containers = first_containers + other_containers
-                out_q.put({"type": "log", "msg": f"Found {len(all_containers)} listings on this page"})
-
-                hrefs: List[str] = []
-                for container in all_containers:
-                    if stop_event.is_set(): break
-                    try:
-                        duration_tag = await container.query_selector('[data-testid="listing-date"]')
-                        duration_text = (await duration_tag.text_content()).strip() if duration_tag else "-"
-                        link_tag = await container.query_selector('a[data-testid="listing-link"]')
-                        href = await link_tag.get_attribute("href") if link_tag else None
-                        if href and href.startswith("/"):
-                            href = "https://www.kijiji.ca" + href
-                        if href and any(u in duration_text for u in ["hrs", "hr", "mins", "min", "seconds", "sec"]):
-                            hrefs.append(href)
-                    except:
-                        continue
-
-                for idx, href in enumerate(hrefs, 1):
-                    if stop_event.is_set(): break
-                    out_q.put({"type": "log", "msg": f"  • Listing {idx}/{len(hrefs)}"})
-                    row = await fetch_listing(context, href, url, lambda m: out_q.put({"type":"log","msg":m}))
-                    buffer.append(row)
-
-                    if len(buffer) >= FLUSH_EVERY:
-                        flush_to_csv(final=False)
-
-                    await human_pause(1.0, 2.0)
-
-                if page_count >= max_pages or stop_event.is_set():
-                    break
-
-                # Pagination
-                try:
-                    next_a = await page.query_selector('li[data-testid="pagination-next-link"] a') \
-                             or await page.query_selector('nav[aria-label="Search Pagination"] a:has-text("Next")')
-                    if next_a:
-                        next_href = await next_a.get_attribute("href")
-                        if next_href:
-                            if next_href.startswith("/"):
-                                next_href = "https://www.kijiji.ca" + next_href
-                            m = re.search(r"/page-(\d+)/", next_href)
-                            if m and int(m.group(1)) > max_pages:
-                                current_page_url = None
-                            else:
-                                current_page_url = next_href
-                                page_count += 1
-                        else:
-                            current_page_url = None
-                    else:
-                        current_page_url = None
-                except:
-                    current_page_url = None
-
-            # final flush
-            flush_to_csv(final=True)
-            await context.close()
-            await browser.close()
-
-        out_q.put({"type": "done", "total": total_rows})
-
+        server = BrowserServer().start()
     except Exception:
-        out_q.put({"type": "error", "trace": traceback.format_exc()})
+        return None
+    atexit.register(server.stop)
+    return server
+
+def warm_browser_url():
+    """The warm browser's CDP URL (restarted if it died), or None to let jobs launch their own."""
+    server = browser_server()
+    if server and not server.alive():
+        browser_server.clear()
+        server = browser_server()
+    return server.cdp_url if server else None
 
 # =========================
 # Streamlit UI (polished)
@@ -421,19 +176,46 @@ textarea[aria-label="Log"] {
 </style>
 """, unsafe_allow_html=True)
 
+# --- Session state ---
+if "running" not in st.session_state: st.session_state["running"] = False
+if "log_lines" not in st.session_state: st.session_state["log_lines"] = []
+if "job_id" not in st.session_state: st.session_state["job_id"] = st.query_params.get("job")
+if "event_seq" not in st.session_state: st.session_state["event_seq"] = 0  # last job event read
+if "total_rows" not in st.session_state: st.session_state["total_rows"] = 0
+if "metrics" not in st.session_state: st.session_state["metrics"] = None
+if "pool_stats" not in st.session_state: st.session_state["pool_stats"] = None
+if "rate_stats" not in st.session_state: st.session_state["rate_stats"] = None
+if "net_stats" not in st.session_state: st.session_state["net_stats"] = None
+if "memory_stats" not in st.session_state: st.session_state["memory_stats"] = None
+if "preview_rows" not in st.session_state: st.session_state["preview_rows"] = []
+
+def attach_job(job_id):
+    """Follow job_id in this session (also via ?job=<id>, so a reload or another browser can reattach)."""
+    st.session_state["job_id"] = job_id
+    st.session_state["event_seq"] = 0  # replay the job's backlog
+    st.session_state["log_lines"] = []
+    st.session_state["total_rows"] = job_manager().get(job_id).rows
+    st.session_state["metrics"] = None
+    st.session_state["pool_stats"] = None
+    st.session_state["rate_stats"] = None
+    st.session_state["net_stats"] = None
+    st.session_state["memory_stats"] = None
+    st.session_state["preview_rows"] = []
+    st.query_params["job"] = job_id
+
+def attached_job():
+    return job_manager().get(st.session_state["job_id"])
+
 # --- Top bar with brand + status + KPIs ---
 with st.container():
     st.markdown('<div class="topbar">', unsafe_allow_html=True)
-    top_cols = st.columns([3, 2, 2, 2, 2])
+    top_cols = st.columns([3, 8])
     with top_cols[0]:
         st.markdown("**<span class='brand'>Kijiji Cars Scraper</span>**<br>"
                     "<span class='subtle'>Fast, reliable, CSV-ready</span>",
                     unsafe_allow_html=True)
-    # placeholders for status + KPIs (filled below)
-    status_box = top_cols[1].empty()
-    kpi_pages = top_cols[2].container()
-    kpi_rows  = top_cols[3].container()
-    kpi_rate  = top_cols[4].container()
+    # status + KPIs are drawn by the topbar_live() fragment below
+    topbar_box = top_cols[1].container()
     st.markdown("</div>", unsafe_allow_html=True)
 
 # --- Sidebar (controls) ---
@@ -457,11 +239,7 @@ with st.sidebar:
     st.markdown("### 🔍 Search")
 
     # category options
-    category_options = {
-        "Cars & Trucks": "https://www.kijiji.ca/b-cars-trucks/canada/c174l0?for-sale-by=ownr&view=list",
-        "Motorcycles": "https://www.kijiji.ca/b-motorcycles/canada/c30l0?for-sale-by=ownr&view=list",
-        "Heavy Equipment": "https://www.kijiji.ca/b-heavy-equipment/canada/c301l0?for-sale-by=ownr&view=list"
-    }
+    category_options = {label: cat_url for label, cat_url in CATEGORIES.values()}
 
     # dropdown instead of free text URL
     selected_category = st.selectbox(
@@ -476,210 +254,465 @@ with st.sidebar:
     # user can still set pages & CSV file
     max_pages = st.number_input("Max pages", min_value=1, max_value=200, value=45, step=1)
     csv_name = st.text_input("CSV file name", value=DEFAULT_CSV)
+    cards_csv_name = os.path.splitext(csv_name)[0] + "_cards.csv"
+    concurrency = st.number_input(
+        "Concurrent listings", min_value=1, max_value=MAX_DETAIL_CONCURRENCY, value=DETAIL_CONCURRENCY, step=1,
+        help="Listing pages fetched in parallel. Requests to kijiji.ca stay spaced out either way.",
+    )
+
+    engine_choice = st.radio(
+        "Engine", ["Browser (Playwright)", "HTTP fast path"], index=0,
+        help="HTTP fast path parses pages from their HTML over a keep-alive connection pool "
+             "and only opens Chromium to reveal phone numbers.",
+    )
+    engine = "http" if engine_choice.startswith("HTTP") else "browser"
+
+    phone_choice = st.radio(
+        "Phone numbers", ["Reveal inline", "Second pass", "Skip"], index=0,
+        help="Revealing costs a 3–6s wait per listing. 'Second pass' writes rows first, then "
+             "revisits parsed listings with its own slower pacing and fills phones into the CSV.",
+    )
+    phones = {"Reveal inline": "inline", "Second pass": "deferred", "Skip": "off"}[phone_choice]
+    if phones == "deferred":
+        phone_concurrency = st.number_input("Phone pass workers", min_value=1, max_value=MAX_DETAIL_CONCURRENCY,
+                                            value=PHONE_CONCURRENCY, step=1)
+
+    skip_seen = st.checkbox(
+        "Skip listings scraped recently", value=False,
+        help=f"Keeps an index of scraped listing IDs in {SEEN_DB} across runs.",
+    )
+    if skip_seen:
+        seen_hours = st.number_input("…re-scrape after (hours)", min_value=0.5, max_value=168.0,
+                                     value=SEEN_TTL_SECS / 3600, step=0.5)
+
+    incremental = st.checkbox(
+        "Incremental (only new since last run)", value=False,
+        help="Skips listings older than the newest one the last completed run saw, "
+             "and stops paging once a results page has nothing new.",
+    )
+
+    save_cards = st.checkbox(
+        "Also save search-card CSV", value=False,
+        help="Writes every results card (title, price, location, age) to <csv>_cards.csv, "
+             "including listings that aren't opened.",
+    )
+
+    extra_outputs = st.multiselect(
+        "Also write", ["jsonl", "parquet", "sqlite"], default=[],
+        help="Typed copies of the rows next to the CSV (price in cents, kilometres as integers, "
+             "posting timestamp). Parquet is written one row group per flush and is readable once the run ends. "
+             "SQLite keeps one row per listing across runs, with a price_history table of changes.",
+    )
+
+    with st.expander("Network filter"):
+        block_rules = st.text_area(
+            "Also block", value="", height=80,
+            help="One per line: a domain (ads.example.com), a URL wildcard (*/tracker/*) or "
+                 "type:<resource type> (type:stylesheet). Ads, analytics, images, fonts and media "
+                 "are blocked already.",
+        )
+        allow_rules = st.text_area(
+            "Always allow", value="", height=80,
+            help="Domains or URL wildcards that are never blocked, even if a rule above matches.",
+        )
+
+    with st.expander("Browser"):
+        warm_browser = st.checkbox(
+            "Reuse a warm browser", value=True,
+            help="Jobs open a fresh context in one long-lived Chromium instead of launching their own, "
+                 "so short runs start scraping right away. Sharded runs still launch one per worker.",
+        )
+        cache_assets = st.checkbox(
+            "Cache JS/CSS on disk", value=True,
+            help=f"Kijiji's scripts and stylesheets are kept in {ASSET_CACHE_DIR}/ and reused across runs "
+                 "while their cache headers allow, instead of downloading them on every listing page.",
+        )
+        recycle_listings = st.number_input(
+            "Relaunch Chromium after (page visits)", min_value=0, max_value=100_000,
+            value=BROWSER_RECYCLE_LISTINGS, step=50, help="0 = never. The crawl carries on where it was.",
+        )
+        recycle_rss_mb = st.number_input(
+            "…or when browser memory passes (MB)", min_value=0, max_value=64_000,
+            value=BROWSER_RSS_LIMIT_MB, step=100, help="0 = no limit. Keep it well under the container's memory cap.",
+        )
+
+    run_mode = st.radio("Execution mode", ["Single browser", "Sharded (multi-process)"], index=0)
+    sharded = run_mode.startswith("Sharded")
+    if sharded:
+        shard_categories = st.multiselect(
+            "Categories to shard", options=list(category_options.keys()), default=[selected_category],
+        )
+        shard_workers = st.number_input(
+            "Worker processes", min_value=1, max_value=MAX_SHARD_WORKERS, value=min(4, MAX_SHARD_WORKERS), step=1,
+            help="Each worker runs its own Chromium. Concurrent listings applies per worker; "
+                 "the server caps workers at its browser limit.",
+        )
+        shard_pages = st.number_input("Pages per shard", min_value=1, max_value=200, value=SHARD_PAGES, step=1)
+        st.caption("Max pages applies per category. Parts are merged into the CSV when the run ends.")
 
     st.markdown("---")
     c1, c2 = st.columns(2)
     btn_start = c1.button("Start", type="primary", use_container_width=True)
     btn_stop  = c2.button("Stop", use_container_width=True)
+    job = attached_job()
+    ckpt = job.checkpoint() if job else None
+    btn_resume = False
+    if ckpt:
+        btn_resume = st.button("Resume", use_container_width=True,
+                               help=f"Continue job {job.id}: pending listings first, then the next results page.")
+        st.caption(f"Checkpoint: {ckpt['rows_written']} rows written, {len(ckpt['pending'])} listings pending"
+                   + (f", next page {ckpt['next_page']}" if ckpt["next_url"] else "")
+                   + (f", {len(ckpt['phone_todo'])} phones to reveal" if ckpt["phone_todo"] else "")
+                   + f" — saved {time.strftime('%H:%M', time.localtime(ckpt['saved_at']))}")
+
+    st.markdown("---")
+    st.markdown("### 🗂️ Jobs")
+    manager = job_manager()
+    jobs = manager.list()
+    if jobs:
+        job_ids = [j.id for j in jobs]
+        picked = st.selectbox(
+            "Follow job", job_ids, index=job_ids.index(job.id) if job else None, placeholder="Pick a job",
+            format_func=lambda i: f"{i} · {manager.jobs[i].label} · {manager.jobs[i].status} · {manager.jobs[i].rows} rows",
+            help="Every crawl on this server, newest first. Jobs keep running when their tab is closed.",
+        )
+        if picked and picked != st.session_state["job_id"]:
+            attach_job(picked)
+            job = attached_job()
+    active = [j for j in jobs if j.active]
+    st.caption(f"{sum(j.status == 'running' for j in active)} running, {sum(j.status == 'queued' for j in active)} queued"
+               f" · browsers {manager.browsers_in_use()}/{manager.max_browsers}")
 
     st.markdown("---")
     st.caption("While running, the UI auto-updates every "
                f"**{UI_REFRESH_SECS}s**. You can download partial CSV any time.")
 
-# --- Session state ---
-if "running" not in st.session_state: st.session_state["running"] = False
-if "log_lines" not in st.session_state: st.session_state["log_lines"] = []
-if "events_q" not in st.session_state: st.session_state["events_q"] = queue.Queue()
-if "stop_event" not in st.session_state: st.session_state["stop_event"] = threading.Event()
-if "thread" not in st.session_state: st.session_state["thread"] = None
-if "total_rows" not in st.session_state: st.session_state["total_rows"] = 0
-if "pages_done" not in st.session_state: st.session_state["pages_done"] = 0  # we’ll derive loosely from logs
+# --- Preview / download helpers (no file reads on a plain auto-refresh) ---
+def file_key(*paths):
+    """(size, mtime) of each path: changes exactly when a flush writes to it."""
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            key.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def csv_preview(path, key):
+    return pd.read_csv(path, nrows=PREVIEW_ROWS, dtype=str, keep_default_na=False)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def sqlite_preview(path, key):
+    with closing(sqlite3.connect(path, timeout=5)) as conn:
+        return pd.read_sql_query(
+            "SELECT name, price, kilometres, location, category, phone, href FROM listings"
+            " ORDER BY last_seen DESC LIMIT ?", conn, params=(PREVIEW_ROWS,))
+
+def download_file(path, label, key, mime, help=None):
+    """A download button that reads `path` when clicked rather than on every rerun."""
+    name = os.path.basename(path)
+    if LAZY_DOWNLOADS:
+        st.download_button(label, data=lambda: Path(path).read_bytes(), file_name=name, mime=mime,
+                           key=key, help=help, on_click="ignore")
+    # older Streamlit wants the bytes up front: read them only on request
+    elif st.button(f"{label} (prepare)", key=f"{key}_prep", help=help):
+        st.download_button(label, data=Path(path).read_bytes(), file_name=name, mime=mime, key=key)
+
+# the warm browser starts with the page, so the first crawl doesn't wait for it
+if warm_browser:
+    warm_browser_url()
 
-# --- Tabs ---
-tabs = st.tabs(["Overview", "Logs", "Settings"])
+# --- Start/Stop buttons ---
+if btn_start:
+    crawl_opts = {"concurrency": int(concurrency), "incremental": incremental, "engine": engine, "phones": phones,
+                  "recycle_listings": int(recycle_listings), "recycle_rss_mb": float(recycle_rss_mb)}
+    if phones == "deferred":
+        crawl_opts["phone_concurrency"] = int(phone_concurrency)
+    if save_cards:
+        crawl_opts["cards_csv"] = cards_csv_name
+    if skip_seen:
+        crawl_opts.update(seen_db=SEEN_DB, seen_ttl=float(seen_hours) * 3600)
+    if block_rules.strip() or allow_rules.strip():
+        crawl_opts.update(block=block_rules.split(), allow=allow_rules.split())
+    if extra_outputs:
+        crawl_opts["outputs"] = ["csv", *extra_outputs]
+        if "sqlite" in extra_outputs:
+            # the SQLite store accumulates across runs (that's where price history lives), so it stays shared
+            crawl_opts["output_db"] = output_path(csv_name, "sqlite")
+    # shards run side by side, each on its own Chromium
+    cdp_url = warm_browser_url() if warm_browser and not sharded else None
+    if cdp_url:
+        crawl_opts["cdp_url"] = cdp_url
+    if cache_assets:
+        crawl_opts["asset_cache"] = ASSET_CACHE_DIR
+    # each job writes into its own directory, so concurrent crawls never share files
+    if sharded:
+        job = job_manager().submit({c: category_options[c] for c in shard_categories}, int(max_pages), csv_name,
+                                   workers=int(shard_workers), shard_pages=int(shard_pages), **crawl_opts)
+    else:
+        job = job_manager().submit({selected_category: url}, int(max_pages), csv_name, **crawl_opts)
+    attach_job(job.id)
+elif btn_resume and job and not job.active:
+    job_manager().resume(job.id)
+
+if btn_stop and job:
+    job_manager().stop(job.id)
+
+# --- Live view: fragments that redraw on their own while a crawl runs ---
+# Only these reruns every UI_REFRESH_SECS (not the whole page); with no crawl running nothing refreshes.
+job = attached_job()
+st.session_state["running"] = bool(job and job.active)
+LIVE_REFRESH = UI_REFRESH_SECS if st.session_state["running"] else None
+
+def drain_events():
+    """Move the attached job's new events into session state. True if this drain saw the run end."""
+    job = attached_job()
+    was_running = st.session_state["running"]
+    if job is None:
+        st.session_state["running"] = False
+        return was_running
+    seq, events = job.events_since(st.session_state["event_seq"])
+    st.session_state["event_seq"] = seq
+    for evt in events:
+        et = evt.get("type")
+        if et == "log":
+            msg = evt["msg"]
+            st.session_state["log_lines"].append(msg)
+        elif et == "flush":
+            st.session_state["total_rows"] = evt["total"]
+            if evt.get("rows"):
+                st.session_state["preview_rows"] = (st.session_state["preview_rows"] + evt["rows"])[-PREVIEW_ROWS:]
+        elif et == "pool":
+            st.session_state["pool_stats"] = evt
+        elif et == "rate":
+            st.session_state["rate_stats"] = evt
+        elif et == "net":
+            st.session_state["net_stats"] = evt
+        elif et == "memory":
+            st.session_state["memory_stats"] = evt
+        elif et == "metrics":
+            st.session_state["metrics"] = evt
+        elif et == "done":
+            st.session_state["total_rows"] = evt["total"]
+        elif et == "error":
+            st.session_state["log_lines"].append("ERROR:\n" + evt["trace"])
+    st.session_state["running"] = job.active
+
+    # cap log memory
+    st.session_state["log_lines"] = st.session_state["log_lines"][-400:]
+    return was_running and not st.session_state["running"]
 
-# Overview tab
-with tabs[0]:
+def sync_events():
+    # every fragment drains first (whichever runs first gets the events);
+    # the end of a run reruns the whole page so the sidebar buttons and refresh timer reset
+    if drain_events():
+        st.rerun()
+
+def render_logs():
+    logs = "\n".join(st.session_state["log_lines"])
+    if len(st.session_state["log_lines"]) <= 20:
+        st.code(logs or "—")
+    else:
+        st.text_area(
+            "Log",
+            logs,
+            height=LOG_SCROLL_HEIGHT,
+            label_visibility="collapsed",
+            disabled=True,  # readonly
+        )
+
+def render_download():
+    job = attached_job()
+    if job is None:
+        return
+    if os.path.exists(job.csv) and st.session_state["total_rows"] > 0:
+        download_file(
+            job.csv,
+            label=f"⬇️ Download CSV (rows: {st.session_state['total_rows']})",
+            key="dl_btn",  # stable key; only one button per rerun
+            mime="text/csv",
+            help=f"Updates every {FLUSH_EVERY} rows while scraping.",
+        )
+    # typed outputs are offered once the run is over (Parquet has no footer until then)
+    if not st.session_state["running"]:
+        for fmt in job.spec["crawl_opts"].get("outputs", ["csv"])[1:]:
+            path = job.output(fmt)
+            if os.path.exists(path):
+                download_file(path, label=f"⬇️ Download {fmt.upper()}", key=f"dl_{fmt}",
+                              mime="application/octet-stream")
+
+def render_progress():
+    if st.session_state["running"]:
+        st.progress(50, text=f"Scraping… rows flushed: {st.session_state['total_rows']} (auto-updates every {UI_REFRESH_SECS}s)")
+    elif st.session_state["total_rows"] > 0:
+        st.progress(100, text=f"Finished / Stopped — rows: {st.session_state['total_rows']}")
+    else:
+        st.progress(0, text="Idle")
+
+def render_preview():
+    job = attached_job()
+    if job is None or st.session_state["total_rows"] == 0:
+        return
+    rows = st.session_state["preview_rows"]
+    # while running: the rows the crawler just flushed, straight from its events
+    if st.session_state["running"] and rows:
+        st.caption(f"Preview ({len(rows)} most recently flushed rows):")
+        st.dataframe(rows[::-1], use_container_width=True, height=410)
+        return
+    # otherwise read the outputs once per change (cached on size + mtime)
+    preview_db = job.output("sqlite")
+    if "sqlite" in job.spec["crawl_opts"].get("outputs", []) and os.path.exists(preview_db):
+        st.caption(f"Preview ({PREVIEW_ROWS} most recently scraped listings):")
+        try:
+            st.dataframe(sqlite_preview(preview_db, file_key(preview_db, preview_db + "-wal")),
+                         use_container_width=True, height=410)
+        except Exception:
+            st.info("Database written. Preview unavailable while it is busy.")
+    elif os.path.exists(job.csv):
+        st.caption(f"Preview (first {PREVIEW_ROWS} rows):")
+        try:
+            st.dataframe(csv_preview(job.csv, file_key(job.csv)), use_container_width=True, height=410)
+        except Exception:
+            st.info("CSV written. Preview unavailable due to encoding or read error.")
+
+def render_pool_stats():
+    ps = st.session_state["pool_stats"]
+    if ps:
+        st.write(
+            f"- **Page pool:** {ps['open']}/{ps['size']} pages, {ps['checkouts']} checkouts, "
+            f"{ps['recycles']} recycles, avg wait {ps['avg_wait_ms']:.0f} ms"
+        )
+
+def render_net_stats():
+    ns = st.session_state["net_stats"]
+    if ns and ns["pages"]:
+        st.write(
+            f"- **Network:** {ns['blocked']} requests blocked, {ns['loaded']} loaded, "
+            f"{ns['bytes'] / 1e6:.1f} MB ({'in-browser' if ns['mode'] == 'browser' else 'route'} filtering)"
+        )
+    if ns and "cache_hits" in ns:
+        st.write(
+            f"- **Asset cache:** {ns['cache_hits']} hits, {ns['cache_revalidated']} revalidated, "
+            f"{ns['cache_misses']} misses, {ns['cache_bytes_saved'] / 1e6:.1f} MB not downloaded"
+        )
+
+def render_metrics():
+    ms = st.session_state["metrics"]
+    if not ms or not ms["stages"]:
+        return
+    lines = []
+    for name, s in sorted(ms["stages"].items(), key=lambda kv: -kv[1]["secs"]):
+        problems = ", ".join(f"{n} {o}" for o, n in sorted(s["outcomes"].items()) if o != "ok")
+        lines.append(f"  - `{name}`: {s['count']} × avg {s['secs'] / s['count']:.2f}s, "
+                     f"p95 {stage_percentile(s, 95):.2f}s, max {s['max_secs']:.1f}s" + (f" ({problems})" if problems else ""))
+    st.markdown("- **Time per stage** (total, slowest first):\n" + "\n".join(lines))
+
+def render_memory_stats():
+    ms = st.session_state["memory_stats"]
+    if ms:
+        st.write(
+            f"- **Memory:** app {ms['rss_mb']:.0f} MB, browser {ms['children_mb']:.0f} MB "
+            f"({ms['children']} processes), {ms['recycles']} browser relaunches"
+        )
+
+@st.fragment(run_every=LIVE_REFRESH)
+def topbar_live():
+    sync_events()
+    status_col, _, _, rate_col = st.columns(4)
+    # status chip
+    state_cls = "running" if st.session_state["running"] else "idle"
+    job = attached_job()
+    state_txt = job.status.capitalize() if job else "Idle"
+    status_col.markdown(
+        f"<span class='status {state_cls}'>{state_txt}</span>"
+        + (f"<br><span class='subtle'>job {job.id}</span>" if job else ""),
+        unsafe_allow_html=True
+    )
+    rs = st.session_state["rate_stats"]
+    if rs:
+        rate_col.metric(
+            "Req/min", rs["rpm"],
+            help=f"Workers {rs['limit']}/{rs['max_concurrency']}, gap {rs['delay']:.1f}s, "
+                 f"{rs['timeouts']} timeouts, {rs['throttled']} throttled",
+        )
+
+@st.fragment(run_every=LIVE_REFRESH)
+def overview_live():
+    sync_events()
     # KPI tiles
     k1, k2, k3 = st.columns(3)
+    ms = st.session_state["metrics"]
     with k1:
-        st.markdown("<div class='kpi'><div class='label'>Pages (approx)</div>"
-                    f"<div class='value'>{st.session_state['pages_done']}</div></div>", unsafe_allow_html=True)
+        st.markdown("<div class='kpi'><div class='label'>Results pages</div>"
+                    f"<div class='value'>{ms['pages'] if ms else 0}</div></div>", unsafe_allow_html=True)
     with k2:
         st.markdown("<div class='kpi'><div class='label'>Rows flushed</div>"
                     f"<div class='value'>{st.session_state['total_rows']}</div></div>", unsafe_allow_html=True)
     with k3:
-        # Fake success rate as a simple function of rows (you can wire a real metric if you want)
-        rate = "OK" if st.session_state["total_rows"] > 0 else "-"
-        st.markdown("<div class='kpi'><div class='label'>Status</div>"
-                    f"<div class='value'>{rate}</div></div>", unsafe_allow_html=True)
-
-    # Download placeholder
-    dl_placeholder = st.empty()
+        rows_per_min = f"{ms['rows_per_min']:.1f}" if ms and ms["rows"] else "-"
+        st.markdown("<div class='kpi'><div class='label'>Rows/min</div>"
+                    f"<div class='value'>{rows_per_min}</div></div>", unsafe_allow_html=True)
     st.markdown("")
+    render_download()
+    render_progress()
+    render_preview()
+
+@st.fragment(run_every=LIVE_REFRESH)
+def logs_live():
+    sync_events()
+    render_logs()
+
+@st.fragment(run_every=LIVE_REFRESH)
+def settings_live():
+    sync_events()
+    render_pool_stats()
+    render_net_stats()
+    render_memory_stats()
+    render_metrics()
+
+with topbar_box:
+    topbar_live()
 
-    # Progress
-    progress = st.progress(0, text="Idle")
+# --- Tabs ---
+tabs = st.tabs(["Overview", "Logs", "Settings"])
 
-    # Recent preview (lazy: show file exists)
-    if os.path.exists(csv_name) and st.session_state["total_rows"] > 0:
-        st.caption("Preview (first 50 rows):")
-        try:
-            import pandas as pd
-            df_prev = pd.read_csv(csv_name, nrows=50)
-            st.dataframe(df_prev, use_container_width=True, height=410)
-        except Exception:
-            st.info("CSV written. Preview unavailable due to encoding or read error.")
+# Overview tab
+with tabs[0]:
+    overview_live()
 
 # Logs tab
 with tabs[1]:
     st.caption("Live run log")
-    log_box = st.empty()  # we render as code or textarea depending on length
+    logs_live()
 
 # Settings tab
 with tabs[2]:
     st.caption("Tuning")
     st.write(f"- **Flush every:** {FLUSH_EVERY} rows")
     st.write(f"- **UI refresh:** every {UI_REFRESH_SECS}s")
-    st.write("- **Assets blocked:** images, fonts, media")
+    st.write(f"- **Skip recently scraped:** "
+             f"{f'yes, within {seen_hours:g}h ({SEEN_DB})' if skip_seen else 'no'}")
+    st.write(f"- **Engine:** {engine_choice}")
+    st.write(f"- **Phone numbers:** {phone_choice}")
+    st.write(f"- **Incremental:** {'yes' if incremental else 'no'}")
+    st.write(f"- **Search cards CSV:** {cards_csv_name if save_cards else 'off'}")
+    st.write(f"- **Outputs:** CSV{''.join(', ' + f.upper() for f in extra_outputs)}")
+    st.write(f"- **Concurrent listings:** up to {int(concurrency)} "
+             f"(adaptive: fewer workers and longer gaps on timeouts/429s)")
+    st.write("- **Requests blocked:** ads, analytics, trackers, images, fonts, media"
+             + (" (+ custom rules)" if block_rules.strip() or allow_rules.strip() else ""))
     st.write("- **Headless:** True")
     st.write("- **Masked webdriver:** Yes")
     st.write("- **Timeouts:** nav=90s, default=20s")
-
-# --- Event handling / Rendering ---
-def render_status_and_kpis():
-    # status chip
-    state_cls = "running" if st.session_state["running"] else "idle"
-    state_txt = "Running" if st.session_state["running"] else "Idle"
-    status_box.markdown(
-        f"<span class='status {state_cls}'>{state_txt}</span>",
-        unsafe_allow_html=True
-    )
-
-def render_download():
-    if os.path.exists(csv_name) and st.session_state["total_rows"] > 0:
-        with open(csv_name, "rb") as f:
-            tabs[0].download_button(
-                label=f"⬇️ Download CSV (rows: {st.session_state['total_rows']})",
-                data=f.read(),
-                file_name=csv_name,
-                mime="text/csv",
-                key="dl_btn",  # stable key; only one button per rerun
-                help=f"Updates every {FLUSH_EVERY} rows while scraping.",
-            )
-
-
-def drain_events_and_render_logs():
-    q = st.session_state["events_q"]
-    updated = False
-    # drain
-    try:
-        while True:
-            evt = q.get_nowait()
-            et = evt.get("type")
-            if et == "log":
-                msg = evt["msg"]
-                st.session_state["log_lines"].append(msg)
-                # naive page count increment when we see page starts
-                if msg.startswith("Scraping Page "):
-                    try:
-                        n = int(msg.split("Scraping Page ")[1].split(":")[0].strip())
-                        st.session_state["pages_done"] = max(st.session_state["pages_done"], n)
-                    except:
-                        pass
-            elif et == "flush":
-                st.session_state["total_rows"] = evt["total"]
-                updated = True
-            elif et == "done":
-                st.session_state["running"] = False
-                st.session_state["total_rows"] = evt["total"]
-                updated = True
-            elif et == "error":
-                st.session_state["log_lines"].append("ERROR:\n" + evt["trace"])
-                st.session_state["running"] = False
-                updated = True
-    except queue.Empty:
-        pass
-
-    # cap log memory & display
-    st.session_state["log_lines"] = st.session_state["log_lines"][-400:]
-    logs = "\n".join(st.session_state["log_lines"])
-    if len(st.session_state["log_lines"]) <= 20:
-        log_box.code(logs or "—")
-    else:
-        log_box.text_area(
-            "Log",
-            logs,
-            height=LOG_SCROLL_HEIGHT,
-            label_visibility="collapsed",
-            disabled=True,  # readonly
-        )
-    # refresh download on flush/done
-    # if updated:
-    #     render_download()
-
-# --- Start/Stop buttons ---
-if btn_start and not st.session_state["running"]:
-    # reset for fresh run
-    st.session_state["log_lines"] = []
-    st.session_state["total_rows"] = 0
-    st.session_state["pages_done"] = 0
-    st.session_state["events_q"] = queue.Queue()
-    st.session_state["stop_event"] = threading.Event()
-    if os.path.exists(csv_name):
-        try: os.remove(csv_name)
-        except: pass
-    st.session_state["running"] = True
-
-    def thread_target(url_, pages_, csv_, stop_evt, out_q):
-        try:
-            asyncio.run(
-                scrape_kijiji(
-                    url_, pages_, csv_,
-                    lambda m: out_q.put({"type":"log","msg":m}),
-                    stop_evt, out_q
-                )
-            )
-        except Exception:
-            out_q.put({"type": "error", "trace": traceback.format_exc()})
-
-    t = threading.Thread(
-        target=thread_target,
-        args=(url, max_pages, csv_name, st.session_state["stop_event"], st.session_state["events_q"]),
-        daemon=True,
-    )
-    st.session_state["thread"] = t
-    t.start()
-
-if btn_stop and st.session_state["running"]:
-    st.session_state["stop_event"].set()
-
-# --- Draw UI bits that change ---
-render_status_and_kpis()
-drain_events_and_render_logs()
-render_download()
-
-# --- Progress + footer + auto-rerun ---
-with tabs[0]:
-    if st.session_state["running"]:
-        progress.progress(50, text=f"Scraping… rows flushed: {st.session_state['total_rows']} (auto-updates every {UI_REFRESH_SECS}s)")
-    else:
-        if st.session_state["total_rows"] > 0:
-            progress.progress(100, text=f"Finished / Stopped — rows: {st.session_state['total_rows']}")
-        else:
-            progress.progress(0, text="Idle")
+    settings_live()
 
 st.markdown(
-    "<div class='footer'>Tip: keep the app open while scraping. You can download partial CSV any time — the scraper keeps running in the background.</div>",
+    "<div class='footer'>Tip: crawls run on the server — close the tab and pick the job under Jobs (or open ?job=&lt;id&gt;) to reattach. You can download partial CSV any time.</div>",
     unsafe_allow_html=True,
 )
 
-# gentle auto-rerun while running so UI keeps updating
-if st.session_state["running"]:
-    time.sleep(UI_REFRESH_SECS)
-    try: st.rerun()
-    except Exception: st.experimental_rerun()
-
 st.markdown(
     """
     <style>
@@ -0,0 +1 @@
+"""Offline benchmarks: a mock kijiji.ca (mock_server) and the throughput runner (run)."""
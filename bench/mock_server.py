@@ -0,0 +1,128 @@
+"""
+Local stand-in for kijiji.ca: results pages and listing pages rendered from
+the HTML in bench/fixtures, with per-request latency and injected errors.
+Paths follow the real site (/b-<category>/<region>[/page-N]/<code>?... and
+/v-<category>/<city>/<slug>/<id>), so the crawler runs unchanged once
+KIJIJI_BASE_URL points here.
+
+    python -m bench.mock_server --port 8800 --latency-ms 150 --error-rate 0.02
+"""
+import argparse, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from string import Template
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+FIXTURES = Path(__file__).with_name("fixtures")
+PER_PAGE = 40              # cards per results page, like the live site
+TOTAL_PAGES = 100          # results pages before "Next" disappears
+LISTING_ID_BASE = 1800000000
+MODELS = ["Honda Civic", "Toyota Corolla", "Ford F-150", "Mazda 3", "Hyundai Elantra", "Subaru Outback"]
+CITIES = [("Toronto", "ON"), ("Calgary", "AB"), ("Ottawa", "ON"), ("Halifax", "NS"), ("Winnipeg", "MB"), ("Kelowna", "BC")]
+
+def _template(name: str) -> Template:
+    return Template((FIXTURES / name).read_text(encoding="utf-8"))
+
+class MockSite:
+    """Renders the fixtures and keeps request/error counters (thread-safe)."""
+    def __init__(self, latency_ms: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0,
+                 error_status: int = 503, per_page: int = PER_PAGE, total_pages: int = TOTAL_PAGES, seed: int = 1):
+        self.latency_ms, self.jitter = latency_ms, jitter
+        self.error_rate, self.error_status = error_rate, error_status
+        self.per_page, self.total_pages = per_page, total_pages
+        self.search_t, self.card_t, self.listing_t = _template("search.html"), _template("card.html"), _template("listing.html")
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"search": 0, "listing": 0, "other": 0, "errors": 0}
+
+    def _listing_values(self, lid: int) -> Dict[str, str]:
+        n = lid - LISTING_ID_BASE
+        model, (city, province) = MODELS[n % len(MODELS)], CITIES[n % len(CITIES)]
+        year = 2008 + n % 15
+        return {
+            "id": str(lid), "title": f"{year} {model}", "price": f"${8000 + (n * 137) % 30000:,}.00",
+            "location": f"{city}, {province}", "age": f"{1 + n % 50} mins ago", "seller": f"Owner {n}",
+            "km": f"{40000 + (n * 911) % 180000:,} km",
+            "href": f"/v-cars-trucks/{city.lower()}/{year}-{model.lower().replace(' ', '-')}/{lid}",
+        }
+
+    def search_page(self, path: str, query: str) -> str:
+        m = re.search(r"/page-(\d+)/", path)
+        page = int(m.group(1)) if m else 1
+        base = re.sub(r"/page-\d+/", "/", path)
+        head, code = base.rsplit("/", 1)
+        link = lambda n: f"{head}/page-{n}/{code}" + (f"?{query}" if query else "")
+        first = LISTING_ID_BASE + (page - 1) * self.per_page
+        cards = "\n".join(self.card_t.substitute(self._listing_values(lid))
+                          for lid in range(first, first + self.per_page))
+        nxt = f'<a href="{link(page + 1)}">Next</a>' if page < self.total_pages else ""
+        return self.search_t.substitute(cards=cards, next=nxt, prev=link(max(1, page - 1)), page=page)
+
+    def listing_page(self, lid: int) -> str:
+        return self.listing_t.substitute(self._listing_values(lid))
+
+    def handle(self, raw_path: str) -> Tuple[int, str]:
+        parts = urlsplit(raw_path)
+        with self.lock:
+            delay = self.latency_ms * (1 + self.jitter * (2 * self.rng.random() - 1)) / 1000
+            failed = self.rng.random() < self.error_rate
+        time.sleep(max(0.0, delay))
+        kind = "search" if parts.path.startswith("/b-") else "listing" if parts.path.startswith("/v-") else "other"
+        with self.lock:
+            self.counts[kind] += 1
+            if failed and kind != "other":
+                self.counts["errors"] += 1
+        if kind == "other":
+            return 404, "not found"
+        if failed:
+            return self.error_status, "<html><body>Service unavailable</body></html>"
+        if kind == "search":
+            return 200, self.search_page(parts.path, parts.query)
+        m = re.search(r"/(\d{5,})/?$", parts.path)
+        return (200, self.listing_page(int(m.group(1)))) if m else (404, "not found")
+
+def serve(site: MockSite, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the server on a daemon thread; its URL is http://host:server.server_port."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real site
+
+        def do_GET(self):
+            status, body = site.handle(self.path)
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the benchmark fixtures as a mock kijiji.ca")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean delay before each response")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread, as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of page requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--per-page", type=int, default=PER_PAGE)
+    parser.add_argument("--total-pages", type=int, default=TOTAL_PAGES)
+    args = parser.parse_args(argv)
+    site = MockSite(args.latency_ms, args.jitter, args.error_rate, args.error_status, args.per_page, args.total_pages)
+    server = serve(site, args.host, args.port)
+    print(f"KIJIJI_BASE_URL=http://{args.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
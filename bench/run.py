@@ -0,0 +1,150 @@
+"""
+Offline throughput benchmark: crawls bench.mock_server once per concurrency
+setting, each in a fresh process, and reports listings/sec, p50/p95
+per-listing latency (fetch_listing wall time) and peak RSS of the crawler
+process and of its browser (every process below it, sampled while it runs).
+
+    python -m bench.run --engine http --concurrency 1 2 4 8 --latency-ms 150
+    python -m bench.run --engine browser --no-pacing --json bench.json
+
+--no-pacing zeroes the crawler's politeness delays (human pauses, the rate
+controller's request gap) so the numbers reflect the pipeline itself.
+"""
+import argparse, asyncio, json, math, os, resource, subprocess, sys, tempfile, threading, time
+from typing import Any, Dict, List
+
+from kijiji_scraper.memory import memory_stats
+
+from .mock_server import MockSite, serve
+
+MEMORY_SAMPLE_SECS = 0.25  # how often the child samples its process tree
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+class PeakMemory:
+    """
+    Samples memory_stats() on a thread while the block runs and keeps the
+    peaks: browser_mb, the summed RSS of every descendant (Playwright driver,
+    Chromium and its renderers) at one instant, and total_mb, that plus this
+    process. RUSAGE_CHILDREN can't give either: it only knows exited
+    children, one at a time.
+    """
+    def __init__(self, interval: float = MEMORY_SAMPLE_SECS):
+        self.interval = interval
+        self.browser_mb = self.total_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        mem = memory_stats()
+        if mem:
+            self.browser_mb = max(self.browser_mb, mem["children_mb"])
+            self.total_mb = max(self.total_mb, mem["rss_mb"] + mem["children_mb"])
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def child(cfg: Dict[str, Any]):
+    """One crawl in this process (KIJIJI_BASE_URL already set); prints its measurements as JSON."""
+    from kijiji_scraper import scraper
+    from kijiji_scraper.cli import run_crawl
+
+    latencies: List[float] = []
+    fetch_name = "fetch_listing_http" if cfg["engine"] == "http" else "fetch_listing"
+    fetch = getattr(scraper, fetch_name)
+
+    async def timed_fetch(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fetch(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - t0)
+    setattr(scraper, fetch_name, timed_fetch)
+
+    if cfg["no_pacing"]:
+        async def no_pause(a=0, b=0):
+            await asyncio.sleep(0)
+        rate_controller = scraper.RateController
+        scraper.human_pause = no_pause
+        scraper.RateController = lambda n, **kw: rate_controller(n, start_delay=0.0, min_delay=0.0, **kw)
+
+    with tempfile.TemporaryDirectory() as tmp, PeakMemory() as peak:
+        stats = run_crawl({"bench": scraper.CATEGORIES["cars"][1]}, cfg["pages"], os.path.join(tmp, "bench.csv"),
+                          concurrency=cfg["concurrency"], engine=cfg["engine"], phones="off")
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "status": stats["status"], "error": stats.get("error"), "rows": stats["rows"],
+        "elapsed_secs": stats["elapsed_secs"], "latencies": latencies,
+        "rss_mb": self_kb / 1024, "browser_rss_mb": peak.browser_mb, "total_rss_mb": peak.total_mb,
+    }))
+
+def run_one(base_url: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    env = {**os.environ, "KIJIJI_BASE_URL": base_url}
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "bench.run", "--child", json.dumps(cfg)],
+                          env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"benchmark child failed:\n{proc.stderr[-2000:]}")
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    lat = out.pop("latencies")
+    return {
+        **cfg, **out, "wall_secs": round(wall, 2),
+        "listings_per_sec": round(out["rows"] / out["elapsed_secs"], 2) if out["elapsed_secs"] else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 1), "p95_ms": round(percentile(lat, 95) * 1000, 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against a local mock kijiji.ca")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", choices=["browser", "http"], default="http")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages", type=int, default=2, help="results pages per run")
+    parser.add_argument("--per-page", type=int, default=20, help="listings per results page")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="mock server delay per response")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--no-pacing", action="store_true", help="drop the crawler's politeness delays")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+    if args.child:
+        child(json.loads(args.child))
+        return
+
+    site = MockSite(args.latency_ms, args.jitter, args.error_rate, per_page=args.per_page)
+    server = serve(site)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    results = []
+    print(f"{'engine':8} {'conc':>4} {'rows':>5} {'secs':>7} {'list/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'RSS MB':>7} {'browser':>8} {'total':>7}  status")
+    for conc in args.concurrency:
+        r = run_one(base_url, {"engine": args.engine, "concurrency": conc, "pages": args.pages,
+                               "no_pacing": args.no_pacing})
+        results.append(r)
+        print(f"{r['engine']:8} {conc:>4} {r['rows']:>5} {r['elapsed_secs']:>7.1f} {r['listings_per_sec']:>7.2f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['rss_mb']:>7.0f} {r['browser_rss_mb']:>8.0f} {r['total_rss_mb']:>7.0f}  {r['status']}",
+              flush=True)
+    server.shutdown()
+    summary = {"server": {**vars(args), "requests": site.counts}, "results": results}
+    summary["server"].pop("child")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
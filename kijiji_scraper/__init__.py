@@ -0,0 +1,46 @@
+"""
+Kijiji listings scraper (Playwright), used by the Streamlit app in app.py and
+the command line (python -m kijiji_scraper). Names are imported from their
+submodule on first use, so importing the package (or running the CLI's --help)
+doesn't load Playwright and pandas.
+"""
+import importlib
+
+_EXPORTS = {
+    "scraper": [
+        "BROWSER_RECYCLE_LISTINGS", "BROWSER_RSS_LIMIT_MB", "DEFAULT_URL", "DETAIL_CONCURRENCY", "FLUSH_EVERY",
+        "MAX_DETAIL_CONCURRENCY", "PHONE_CONCURRENCY", "PREVIEW_ROWS", "BrowserHost", "collect_phones",
+        "create_context", "fetch_listing", "category_of", "is_recent", "page_url", "reveal_phone", "scrape_kijiji",
+    ],
+    "sharding": ["MAX_SHARD_WORKERS", "SHARD_PAGES", "merge_csv_parts", "plan_shards", "run_sharded"],
+    "categories": ["BASE_URL", "CATEGORIES"],
+    "cli": ["run_crawl"],
+    "browser_server": ["BrowserServer"],
+    "asset_cache": ["ASSET_CACHE_DIR", "AssetCache"],
+    "jobs": ["JOBS_DIR", "MAX_BROWSERS", "Job", "JobManager"],
+    "metrics": ["STAGE_BUCKETS", "StageMetrics", "merge_snapshots", "prometheus_text", "stage_percentile"],
+    "memory": ["memory_stats"],
+    "netfilter": ["NetFilter"],
+    "rate": ["RateController", "Throttled"],
+    "record": ["CSV_COLUMNS", "Listing", "to_frame"],
+    "sinks": [
+        "OUTPUT_FORMATS", "CsvSink", "JsonlSink", "ParquetSink", "SqliteSink", "backfill_phones", "open_sinks",
+        "output_path", "safe_for_excel",
+    ],
+    "checkpoint": ["checkpoint_path", "clear_checkpoint", "load_checkpoint", "save_checkpoint"],
+    "seen": ["SEEN_DB", "SEEN_TTL_SECS", "SeenIndex", "listing_id"],
+    "http_engine": ["HttpEngine", "parse_listing_html", "parse_search_html"],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+__all__ = list(_MODULE_OF)
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# guarded: spawned shard workers import the parent's __main__ too
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+On-disk cache for the JS and CSS that browser pages load. Every crawl
+starts from an empty browser cache, so without this each run downloads
+Kijiji's script bundles again; they are most of a listing page's bytes
+once images are blocked. AssetCache routes only those requests through
+Python: a fresh entry (per Cache-Control max-age or Expires) is served from
+disk, a stale one is revalidated with its ETag/Last-Modified, anything else
+is fetched and stored if the headers allow it. Entries are keyed by URL
+and shared by every crawl and process using the same directory.
+"""
+import hashlib, json, os, re, tempfile, time
+from contextlib import suppress
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+ASSET_CACHE_DIR = os.environ.get("KIJIJI_ASSET_CACHE", ".kijiji_asset_cache")
+ASSET_CACHE_MAX_MB = 256   # oldest entries are dropped beyond this when a cache is opened
+STATIC_URL = re.compile(r"\.(?:js|mjs|css)(?:[?#]|$)", re.IGNORECASE)
+STATIC_TYPES = {"script", "stylesheet"}
+# not stored or replayed: Playwright hands over the decoded body, the rest is per connection or per user
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie"}
+
+def freshness_secs(headers: Dict[str, str]) -> Optional[float]:
+    """Seconds a response may be reused without asking the server; None if it must not be stored."""
+    directives = {}
+    for part in headers.get("cache-control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]))
+        except ValueError:
+            return 0.0
+    if "expires" in headers:
+        try:
+            date = parsedate_to_datetime(headers["date"]).timestamp() if "date" in headers else time.time()
+            return max(0.0, parsedate_to_datetime(headers["expires"]).timestamp() - date)
+        except (TypeError, ValueError):
+            return 0.0  # an invalid Expires means already expired
+    return None
+
+def _replay_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() not in DROP_HEADERS}
+
+class AssetCache:
+    """
+    One instance per crawl: attach() it to each browser context and read the
+    hit/miss/revalidated/stored counters with stats(). Requests `net` would
+    block are left to it.
+    """
+    def __init__(self, root: str = ASSET_CACHE_DIR, max_mb: float = ASSET_CACHE_MAX_MB, net=None):
+        self.root, self.max_bytes, self.net = root, max_mb * 1024 * 1024, net
+        os.makedirs(root, exist_ok=True)
+        self.hits = self.misses = self.revalidated = self.stored = self.bytes_saved = 0
+        self.prune()
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = os.path.join(self.root, hashlib.sha256(url.encode("utf-8")).hexdigest())
+        return key + ".json", key + ".body"
+
+    def load(self, url: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return (meta, body) if meta.get("url") == url else None
+
+    def save(self, url: str, status: int, headers: Dict[str, str], body: bytes, fresh_secs: float):
+        # body first, then its metadata: a reader never sees metadata without the body it describes
+        meta_path, body_path = self._paths(url)
+        meta = json.dumps({"url": url, "status": status, "headers": headers, "expires": time.time() + fresh_secs})
+        for path, data in ((body_path, body), (meta_path, meta.encode("utf-8"))):
+            # a temp file of its own: crawls on other threads or in other processes may store the same URL
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                with suppress(OSError):
+                    os.remove(tmp)
+                raise
+
+    def _try_save(self, *args) -> bool:
+        """save(), where a failure (full disk, permissions) costs the entry but not the request."""
+        try:
+            self.save(*args)
+        except Exception:
+            return False
+        return True
+
+    def prune(self):
+        """Drop the least recently stored entries until the cache fits in max_mb."""
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith(".body"):
+                path = os.path.join(self.root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for p in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+
+    async def attach(self, context):
+        """
+        Route the context's JS/CSS requests through the cache. STATIC_URL is
+        handed to Playwright as a regex, so the driver does the matching and
+        other requests never reach Python (a callable would see every one).
+        """
+        await context.route(STATIC_URL, self._route)
+
+    async def _route(self, route):
+        req = route.request
+        if (req.method != "GET" or req.resource_type not in STATIC_TYPES
+                or (self.net and self.net.should_block(req.url, req.resource_type))):
+            await route.fallback()
+            return
+        entry = self.load(req.url)
+        if entry and entry[0]["expires"] > time.time():
+            meta, body = entry
+            self.hits += 1
+            self.bytes_saved += len(body)
+            await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+            return
+        headers = dict(req.headers)
+        if entry:
+            # stale: ask whether it changed
+            cached = entry[0]["headers"]
+            if "etag" in cached:
+                headers["if-none-match"] = cached["etag"]
+            if "last-modified" in cached:
+                headers["if-modified-since"] = cached["last-modified"]
+        try:
+            resp = await route.fetch(headers=headers)
+        except Exception:
+            await route.fallback()
+            return
+        if resp.status == 304 and entry:
+            meta, body = entry
+            merged = {**meta["headers"], **_replay_headers(resp.headers)}
+            self.revalidated += 1
+            self.bytes_saved += len(body)
+            self._try_save(req.url, meta["status"], merged, body, freshness_secs(merged) or 0.0)
+            await route.fulfill(status=meta["status"], headers=merged, body=body)
+            return
+        self.misses += 1
+        body = await resp.body()
+        replay = _replay_headers(resp.headers)
+        fresh = freshness_secs(resp.headers)
+        # worth keeping if it can be reused as is, or at least revalidated cheaply
+        if (resp.status == 200 and fresh is not None and (fresh > 0 or "etag" in replay or "last-modified" in replay)
+                and self._try_save(req.url, resp.status, replay, body, fresh)):
+            self.stored += 1
+        await route.fulfill(status=resp.status, headers=replay, body=body)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.hits, "cache_misses": self.misses, "cache_revalidated": self.revalidated,
+            "cache_stored": self.stored, "cache_bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,80 @@
+"""
+A long-lived headless Chromium that crawls connect to over CDP
+(scrape_kijiji(cdp_url=...)) instead of launching their own. Each run opens
+a fresh context in it and closes only that, so a short run starts without
+paying for a browser launch. The app keeps one per server process;
+`python -m kijiji_scraper browser` runs one for the CLI and cron.
+"""
+import os, shutil, subprocess, tempfile, time, urllib.request
+from typing import List, Optional
+
+SERVER_START_TIMEOUT = 20.0  # seconds to wait for the DevTools endpoint
+SERVER_ARGS = [
+    "--headless=new",
+    "--remote-debugging-address=127.0.0.1",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+]
+
+def chromium_executable() -> str:
+    """The Chromium build `playwright install chromium` put in place."""
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        return p.chromium.executable_path
+
+class BrowserServer:
+    """
+    Chromium started with --remote-debugging-port in its own throwaway
+    profile. start() returns once cdp_url answers; stop() ends the process
+    and removes the profile. port=0 lets Chromium pick a free port.
+    """
+    def __init__(self, port: int = 0, executable: Optional[str] = None, extra_args: Optional[List[str]] = None):
+        self.port, self.executable, self.extra_args = port, executable, list(extra_args or [])
+        self.proc: Optional[subprocess.Popen] = None
+        self.profile: Optional[str] = None
+
+    @property
+    def cdp_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self) -> "BrowserServer":
+        self.profile = tempfile.mkdtemp(prefix="kijiji-chromium-")
+        self.proc = subprocess.Popen(
+            [self.executable or chromium_executable(), *SERVER_ARGS, *self.extra_args,
+             f"--remote-debugging-port={self.port}", f"--user-data-dir={self.profile}", "about:blank"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        port_file = os.path.join(self.profile, "DevToolsActivePort")
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                self.stop()
+                raise RuntimeError("Chromium exited before its DevTools endpoint came up")
+            try:
+                # Chromium writes the port it actually bound (useful with port=0)
+                with open(port_file, encoding="ascii") as f:
+                    self.port = int(f.readline())
+                with urllib.request.urlopen(self.cdp_url + "/json/version", timeout=1):
+                    return self
+            except (OSError, ValueError):
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"Chromium's DevTools endpoint did not answer within {SERVER_START_TIMEOUT:.0f}s")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        if self.profile:
+            shutil.rmtree(self.profile, ignore_errors=True)
+            self.profile = None
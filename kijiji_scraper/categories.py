@@ -0,0 +1,12 @@
+"""Search categories the app and CLI offer. Kept free of heavy imports so the CLI can list them cheaply."""
+import os
+
+# site root for search URLs and relative hrefs; bench/ points it at a local mock server
+BASE_URL = os.environ.get("KIJIJI_BASE_URL", "https://www.kijiji.ca").rstrip("/")
+
+# category key -> (label, owner-only list-view search URL)
+CATEGORIES = {
+    "cars": ("Cars & Trucks", f"{BASE_URL}/b-cars-trucks/canada/c174l0?for-sale-by=ownr&view=list"),
+    "motorcycles": ("Motorcycles", f"{BASE_URL}/b-motorcycles/canada/c30l0?for-sale-by=ownr&view=list"),
+    "heavy-equipment": ("Heavy Equipment", f"{BASE_URL}/b-heavy-equipment/canada/c301l0?for-sale-by=ownr&view=list"),
+}
@@ -0,0 +1,29 @@
+"""
+Crawl checkpoints: where the results-page walk is, which listings were
+queued but not yet written, and how many rows the outputs hold. Saved as
+JSON beside the CSV on every flush so a Stop or crash can be resumed.
+"""
+import json, os, time
+from typing import Any, Dict, Optional
+
+def checkpoint_path(csv_name: str) -> str:
+    """'kijiji_cars.csv' -> 'kijiji_cars.checkpoint.json'"""
+    return os.path.splitext(csv_name)[0] + ".checkpoint.json"
+
+def save_checkpoint(path: str, state: Dict[str, Any]):
+    """Write state atomically (tmp file + rename), so a crash mid-write keeps the previous one."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**state, "saved_at": time.time()}, f)
+    os.replace(tmp, path)
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def clear_checkpoint(path: str):
+    if os.path.exists(path):
+        os.remove(path)
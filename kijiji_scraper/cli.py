@@ -0,0 +1,242 @@
+"""
+Headless entry point: run_crawl() for library callers and the
+`python -m kijiji_scraper crawl ...` command for cron and job queues.
+Logs go to stderr, one JSON stats object to stdout; the exit code says
+how the run ended (see EXIT_CODES). The crawl modules are imported when
+a crawl starts, so --help and argument errors stay cheap.
+`python -m kijiji_scraper browser` keeps a warm Chromium for crawls to
+connect to (--browser-server), so frequent short runs skip the launch.
+"""
+import argparse, json, os, queue, signal, sys, threading, time, traceback
+from typing import Any, Callable, Dict, Optional
+
+from .asset_cache import ASSET_CACHE_DIR
+from .categories import CATEGORIES
+from .checkpoint import checkpoint_path
+from .metrics import prometheus_text, serve_prometheus, write_prometheus
+from .seen import SEEN_DB
+
+EXIT_CODES = {"completed": 0, "failed": 1, "stopped": 3, "partial": 4}  # 2: bad arguments (argparse)
+EVENT_POLL_SECS = 0.5
+
+def error_line(trace: str) -> str:
+    """The "SomeError: message" line of a formatted traceback, not whatever the message ends with."""
+    lines = trace.strip().splitlines()
+    frames = [i for i, line in enumerate(lines) if line.startswith("  File ")]
+    # after the innermost frame come its indented source/caret lines, then the exception
+    for line in lines[frames[-1] + 1 if frames else 0:]:
+        if line and not line[0].isspace():
+            return line
+    return lines[-1] if lines else ""
+
+def run_crawl(urls: Dict[str, str], max_pages: int, csv_name: str, *,
+              workers: int = 0, shard_pages: Optional[int] = None,
+              stop_event: Optional[threading.Event] = None,
+              on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+              **crawl_opts) -> Dict[str, Any]:
+    """
+    Crawl {label: search URL} into csv_name and block until it ends. One URL
+    and workers=0 runs scrape_kijiji in a thread; otherwise the URLs are
+    sharded across `workers` processes (run_sharded). crawl_opts go to
+    scrape_kijiji. Every event is passed to on_event; setting stop_event
+    stops the crawl like the app's Stop button. Returns the run's stats:
+    status (completed/stopped/failed/partial), rows, elapsed_secs, the
+    output paths, a leftover checkpoint and the last rate/pool/net/metrics/
+    memory events.
+    """
+    import asyncio
+    from .scraper import page_url, scrape_kijiji
+    from .sharding import MAX_SHARD_WORKERS, SHARD_PAGES, plan_shards, run_sharded
+    from .sinks import output_path
+
+    stop_event = stop_event or threading.Event()
+    out_q: queue.Queue = queue.Queue()
+    sharded = workers > 0 or len(urls) > 1
+    shards = plan_shards(urls, max_pages, shard_pages or SHARD_PAGES) if sharded else []
+
+    def target():
+        if sharded:
+            run_sharded(shards, csv_name, min(workers or MAX_SHARD_WORKERS, len(shards)), stop_event, out_q, **crawl_opts)
+            return
+        url = next(iter(urls.values()))
+        if crawl_opts.get("first_page"):
+            url = page_url(url, crawl_opts["first_page"])  # scrape_kijiji starts on the URL it's given
+        try:
+            asyncio.run(scrape_kijiji(url, max_pages, csv_name, lambda m: out_q.put({"type": "log", "msg": m}),
+                                      stop_event, out_q, **crawl_opts))
+        except Exception:
+            out_q.put({"type": "error", "trace": traceback.format_exc()})
+
+    started = time.time()
+    stats: Dict[str, Any] = {"status": "completed", "rows": 0, "csv": csv_name}
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    while t.is_alive() or not out_q.empty():
+        try:
+            evt = out_q.get(timeout=EVENT_POLL_SECS)
+        except queue.Empty:
+            continue
+        et = evt["type"]
+        if et in ("flush", "done"):
+            stats["rows"] = evt["total"]
+        elif et in ("rate", "pool", "net", "metrics", "memory"):
+            stats[et] = {k: v for k, v in evt.items() if k not in ("type", "shard")}
+        elif et == "error":
+            stats["status"] = "failed"
+            stats["error"] = error_line(evt["trace"])
+        if et == "done" and evt.get("failed_shards"):
+            stats["failed_shards"] = evt["failed_shards"]
+            stats["status"] = "failed" if evt["failed_shards"] == len(shards) else "partial"
+        if on_event:
+            on_event(evt)
+
+    ckpt = checkpoint_path(csv_name)
+    if stats["status"] == "completed" and (stop_event.is_set() or os.path.exists(ckpt)):
+        stats["status"] = "stopped"
+    stats["elapsed_secs"] = round(time.time() - started, 1)
+    stats["outputs"] = {fmt: crawl_opts.get("output_db") if fmt == "sqlite" and crawl_opts.get("output_db")
+                        else output_path(csv_name, fmt)
+                        for fmt in crawl_opts.get("outputs", ("csv",))}
+    stats["checkpoint"] = ckpt if os.path.exists(ckpt) else None
+    return stats
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m kijiji_scraper", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    crawl = sub.add_parser("crawl", help="scrape one or more categories into CSV (and other outputs)")
+    what = crawl.add_mutually_exclusive_group()
+    what.add_argument("--category", action="append", choices=list(CATEGORIES),
+                      help="category to crawl (repeat to shard several); default: cars")
+    what.add_argument("--url", help="any Kijiji search-results URL instead of a category")
+    crawl.add_argument("--pages", type=int, default=45, help="results pages per category (default: 45)")
+    crawl.add_argument("--first-page", type=int, help="start at this results page (single-browser runs)")
+    crawl.add_argument("--out", default="kijiji_cars.csv", help="CSV path; other outputs go beside it")
+    crawl.add_argument("--format", action="append", choices=["jsonl", "parquet", "sqlite"], dest="formats",
+                       help="also write this format (repeatable)")
+    crawl.add_argument("--db", help="SQLite file for --format sqlite (default: beside the CSV)")
+    crawl.add_argument("--concurrency", type=int, help="listing pages in flight per browser")
+    crawl.add_argument("--engine", choices=["browser", "http"], help="listing fetcher (default: browser)")
+    crawl.add_argument("--phones", choices=["inline", "deferred", "off"], help="phone reveal mode (default: inline)")
+    crawl.add_argument("--phone-concurrency", type=int, help="workers for the deferred phone pass")
+    crawl.add_argument("--skip-seen", type=float, metavar="HOURS",
+                       help="skip listings scraped in the last HOURS (seen index)")
+    crawl.add_argument("--seen-db", help=f"seen-index SQLite file (default: {SEEN_DB})")
+    crawl.add_argument("--incremental", action="store_true", help="only listings newer than the last completed run")
+    crawl.add_argument("--cards", action="store_true", help="also write every results card to <out>_cards.csv")
+    crawl.add_argument("--block", action="append", default=[], metavar="RULE",
+                       help="extra network block rule: domain, URL wildcard or type:<resource type>")
+    crawl.add_argument("--allow", action="append", default=[], metavar="RULE", help="never block this domain/wildcard")
+    crawl.add_argument("--resume", action="store_true", help="continue from the CSV's checkpoint")
+    crawl.add_argument("--recycle-after", type=int, metavar="N",
+                       help="relaunch Chromium after N page visits (0: never)")
+    crawl.add_argument("--recycle-rss-mb", type=float, metavar="MB",
+                       help="relaunch Chromium once its processes use MB of RSS (0: no limit)")
+    crawl.add_argument("--browser-server", default=os.environ.get("KIJIJI_BROWSER_SERVER"), metavar="URL",
+                       help="connect to a warm Chromium (see the browser command) instead of launching one; "
+                            "default: $KIJIJI_BROWSER_SERVER")
+    crawl.add_argument("--asset-cache", nargs="?", const=ASSET_CACHE_DIR, metavar="DIR",
+                       help=f"serve JS/CSS from an on-disk cache shared across runs (default DIR: {ASSET_CACHE_DIR})")
+    crawl.add_argument("--workers", type=int, default=0,
+                       help="shard across this many worker processes (0: single browser)")
+    crawl.add_argument("--shard-pages", type=int, help="results pages per shard")
+    crawl.add_argument("--quiet", action="store_true", help="no log lines on stderr")
+    crawl.add_argument("--stats", metavar="PATH", help="also write the JSON stats to PATH")
+    crawl.add_argument("--metrics", metavar="PATH",
+                       help="keep Prometheus text metrics in PATH (node_exporter textfile collector)")
+    crawl.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus metrics at :PORT/metrics")
+
+    browser = sub.add_parser("browser", help="keep a warm headless Chromium that crawls connect to (--browser-server)")
+    browser.add_argument("--port", type=int, default=9222, help="DevTools port on 127.0.0.1 (default: 9222)")
+    return parser
+
+def crawl_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Only the options given on the command line; scrape_kijiji's defaults cover the rest."""
+    opts: Dict[str, Any] = {"incremental": args.incremental}
+    for name in ("concurrency", "engine", "phones", "phone_concurrency", "first_page"):
+        if getattr(args, name) is not None:
+            opts[name] = getattr(args, name)
+    if args.recycle_after is not None:
+        opts["recycle_listings"] = args.recycle_after
+    if args.recycle_rss_mb is not None:
+        opts["recycle_rss_mb"] = args.recycle_rss_mb
+    if args.formats:
+        opts["outputs"] = ["csv", *dict.fromkeys(args.formats)]
+    if args.db:
+        opts["output_db"] = args.db
+    if args.skip_seen is not None:
+        opts["seen_db"] = args.seen_db or SEEN_DB
+        opts["seen_ttl"] = args.skip_seen * 3600
+    if args.cards:
+        opts["cards_csv"] = os.path.splitext(args.out)[0] + "_cards.csv"
+    if args.block or args.allow:
+        opts.update(block=args.block, allow=args.allow)
+    if args.resume:
+        opts["resume"] = True
+    if args.browser_server:
+        opts["cdp_url"] = args.browser_server
+    if args.asset_cache:
+        opts["asset_cache"] = args.asset_cache
+    return opts
+
+def serve_browser(port: int) -> int:
+    """Run a BrowserServer until SIGINT/SIGTERM; 1 if Chromium exits on its own."""
+    from .browser_server import BrowserServer
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    server = BrowserServer(port).start()
+    print(f"KIJIJI_BROWSER_SERVER={server.cdp_url}", flush=True)
+    try:
+        while server.alive() and not stop_event.wait(EVENT_POLL_SECS):
+            pass
+    finally:
+        server.stop()
+    return 0 if stop_event.is_set() else 1
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "browser":
+        return serve_browser(args.port)
+    urls = ({"url": args.url} if args.url
+            else {CATEGORIES[c][0]: CATEGORIES[c][1] for c in dict.fromkeys(args.category or ["cars"])})
+    sharded = args.workers > 0 or len(urls) > 1
+    if sharded and (args.resume or args.first_page):
+        parser.error("--resume and --first-page apply to single-browser runs only")
+
+    stop_event = threading.Event()
+    def request_stop(signum, frame):
+        # first signal: stop cleanly (outputs flushed, checkpoint kept); second: give up
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        stop_event.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    latest = {"text": ""}
+    server = serve_prometheus(args.metrics_port, lambda: latest["text"]) if args.metrics_port else None
+
+    def on_event(evt):
+        if evt["type"] == "metrics":
+            latest["text"] = prometheus_text(evt, {"output": os.path.basename(args.out)})
+            if args.metrics:
+                write_prometheus(args.metrics, latest["text"])
+        if args.quiet:
+            return
+        if evt["type"] == "log":
+            print(evt["msg"], file=sys.stderr, flush=True)
+        elif evt["type"] == "error":
+            print(evt["trace"], file=sys.stderr, flush=True)
+
+    stats = run_crawl(urls, args.pages, args.out, workers=args.workers, shard_pages=args.shard_pages,
+                      stop_event=stop_event, on_event=on_event, **crawl_options(args))
+    if server:
+        server.shutdown()
+    line = json.dumps(stats)
+    print(line, flush=True)
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            f.write(line + "\n")
+    return EXIT_CODES[stats["status"]]
@@ -0,0 +1,311 @@
+"""
+Browserless fast path: fetch search and listing HTML over one pooled
+keep-alive HTTP client and parse it into the same shapes the Playwright
+path produces (SEARCH_PAGE_JS cards, LISTING_JS fields). Parsing is pure
+functions over HTML strings, so saved pages can be checked offline.
+"""
+import asyncio, json, random, re, time
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import List, Dict, Any, Optional
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+from .metrics import StageMetrics
+from .rate import THROTTLE_STATUSES, RateController
+from .seen import listing_id
+
+HTTP_MAX_CONNECTIONS = 8
+HTTP_TIMEOUT_SECS = 30
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Apollo attribute canonical names -> the labels fetch_listing keys on
+CANONICAL_LABELS = {
+    "numberofseats": "Seats", "carseats": "Seats",
+    "carmileageinkms": "Kilometres", "mileage": "Kilometres",
+    "carbodytype": "Body Style", "bodytype": "Body Style",
+    "cardoors": "Doors", "numberofdoors": "Doors",
+    "cartransmission": "Transmission", "transmission": "Transmission",
+    "carmodel": "Model", "model": "Model",
+    "cartrim": "Extra Info", "trim": "Extra Info",
+    "carfueltype": "Fuel", "fueltype": "Fuel",
+}
+
+# =========================
+# Minimal DOM over html.parser
+# =========================
+_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+class Node:
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"]):
+        self.tag, self.attrs, self.children, self.parent = tag, attrs, [], parent
+
+    def text(self) -> str:
+        parts = []
+        for c in self.children:
+            parts.append(c if isinstance(c, str) else c.text())
+        return " ".join(" ".join(parts).split())
+
+    def iter(self):
+        for c in self.children:
+            if isinstance(c, Node):
+                yield c
+                yield from c.iter()
+
+    def find_all(self, tag: Optional[str] = None, testid: Optional[str] = None) -> List["Node"]:
+        return [n for n in self.iter()
+                if (tag is None or n.tag == tag)
+                and (testid is None or n.attrs.get("data-testid") == testid)]
+
+    def find(self, tag: Optional[str] = None, testid: Optional[str] = None) -> Optional["Node"]:
+        found = self.find_all(tag, testid)
+        return found[0] if found else None
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {}, None)
+        self.cur = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {k: v or "" for k, v in attrs}, self.cur)
+        self.cur.children.append(node)
+        if tag not in _VOID:
+            self.cur = node
+
+    def handle_endtag(self, tag):
+        n = self.cur
+        while n is not self.root and n.tag != tag:
+            n = n.parent
+        if n is not self.root:
+            self.cur = n.parent
+
+    def handle_data(self, data):
+        if self.cur.tag not in ("script", "style") and data.strip():
+            self.cur.children.append(data)
+
+def parse_html(html: str) -> Node:
+    b = _TreeBuilder()
+    b.feed(html)
+    b.close()
+    return b.root
+
+# =========================
+# Embedded state
+# =========================
+def next_data(html: str) -> Optional[Dict[str, Any]]:
+    m = re.search(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', html, re.S)
+    if not m:
+        return None
+    try:
+        return json.loads(m.group(1))
+    except ValueError:
+        return None
+
+def apollo_state(html: str) -> Dict[str, Any]:
+    data = next_data(html) or {}
+    props = data.get("props", {}).get("pageProps", {})
+    return props.get("__APOLLO_STATE__") or props.get("apolloState") or {}
+
+def _resolve(state: Dict[str, Any], value):
+    """Follow Apollo {'__ref': 'Type:id'} links."""
+    if isinstance(value, dict) and "__ref" in value:
+        return state.get(value["__ref"], {})
+    return value
+
+def posted_age_text(iso: Optional[str], now: Optional[datetime] = None) -> Optional[str]:
+    """'2024-05-01T10:00:00.000Z' -> '3 hrs ago' (the wording the site's listing-date uses)."""
+    if not iso:
+        return None
+    try:
+        ts = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    secs = ((now or datetime.now(timezone.utc)) - ts).total_seconds()
+    if secs < 60:
+        return f"{max(int(secs), 0)} seconds ago"
+    if secs < 3600:
+        return f"{int(secs // 60)} mins ago"
+    if secs < 86400:
+        return f"{int(secs // 3600)} hrs ago"
+    return f"{int(secs // 86400)} days ago"
+
+def format_price(price) -> Optional[str]:
+    """Apollo price {'amount': 1250000} (cents) -> '$12,500'."""
+    if isinstance(price, dict):
+        amount = price.get("amount")
+        if isinstance(amount, (int, float)):
+            return f"${amount / 100:,.0f}"
+    return None
+
+def _listing_objects(state: Dict[str, Any]):
+    for key, obj in state.items():
+        if isinstance(obj, dict) and re.match(r"^\w*Listing\w*:\d+$", key):
+            yield key, obj
+
+# =========================
+# Parsers
+# =========================
+def parse_search_html(html: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Results page HTML -> {'cards': [...], 'next': href} (same shape as SEARCH_PAGE_JS)."""
+    cards: List[Dict[str, Any]] = []
+    for _, obj in _listing_objects(apollo_state(html)):
+        href = obj.get("url") or obj.get("seoUrl")
+        if not href:
+            continue
+        loc = obj.get("location") or {}
+        cards.append({
+            "href": href,
+            "date": posted_age_text(obj.get("sortingDate") or obj.get("activationDate"), now),
+            "title": obj.get("title"),
+            "price": format_price(obj.get("price")),
+            "location": loc.get("name") if isinstance(loc, dict) else None,
+        })
+
+    doc = parse_html(html)
+    if not cards:
+        sections = doc.find_all("section")
+        for sec in sections:
+            a = sec.find("a", "listing-link")
+            if not a:
+                continue
+            date, title = sec.find(testid="listing-date"), sec.find(testid="listing-title")
+            price, loc = sec.find(testid="listing-price"), sec.find(testid="listing-location")
+            cards.append({
+                "href": a.attrs.get("href"),
+                "date": date.text() if date else None,
+                "title": title.text() if title else a.text(),
+                "price": price.text() if price else None,
+                "location": loc.text() if loc else None,
+            })
+
+    nxt = None
+    li = doc.find("li", "pagination-next-link")
+    a = li.find("a") if li else None
+    if a is None:
+        for nav in doc.find_all("nav"):
+            if nav.attrs.get("aria-label") == "Search Pagination":
+                a = next((x for x in nav.find_all("a") if "Next" in x.text()), None)
+                break
+    if a is not None:
+        nxt = a.attrs.get("href")
+    return {"cards": cards, "next": nxt}
+
+def parse_listing_html(html: str, href: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Listing page HTML -> fields in the LISTING_JS shape (for apply_listing_fields)."""
+    fields: Dict[str, Any] = {"date": None, "name": None, "price": None,
+                              "location": None, "seller": None, "attributes": []}
+    state = apollo_state(html)
+    lid = listing_id(href)
+    obj = next((o for k, o in _listing_objects(state) if lid and k.endswith(":" + lid)), None)
+    if obj:
+        loc = _resolve(state, obj.get("location")) or {}
+        poster = _resolve(state, obj.get("posterInfo")) or {}
+        fields.update(
+            date=posted_age_text(obj.get("sortingDate") or obj.get("activationDate"), now),
+            name=obj.get("title"),
+            price=format_price(_resolve(state, obj.get("price"))),
+            location=(loc.get("address") or loc.get("name")) if isinstance(loc, dict) else None,
+            seller=poster.get("sellerName") or poster.get("name") if isinstance(poster, dict) else None,
+        )
+        attrs = _resolve(state, obj.get("attributes")) or {}
+        for a in (attrs.get("all") if isinstance(attrs, dict) else attrs) or []:
+            a = _resolve(state, a)
+            label = a.get("name") or CANONICAL_LABELS.get((a.get("canonicalName") or "").lower())
+            values = a.get("values") or a.get("canonicalValues") or []
+            if label:
+                fields["attributes"].append({"label": label, "values": [str(v) for v in values]})
+        _merge_split_attributes(fields)
+        if fields["name"]:
+            return fields
+
+    # server-rendered markup: same selectors LISTING_JS uses, minus the hashed classes
+    doc = parse_html(html)
+    date, h1, price = doc.find(testid="listing-date"), doc.find("h1"), doc.find("p", "vip-price")
+    fields["date"] = date.text() if date else None
+    fields["name"] = h1.text() if h1 else None
+    fields["price"] = price.text() if price else None
+    profile = doc.find(testid="seller-profile")
+    if profile:
+        loc = next((n for n in profile.iter() if "location" in n.attrs.get("data-testid", "")), None)
+        h3 = profile.find("h3")
+        seller = h3.find("a") if h3 else None
+        fields["location"] = loc.text() if loc else None
+        fields["seller"] = seller.text() if seller else None
+    for row in doc.find_all(testid="attribute-row"):
+        ps = [p.text() for p in row.find_all("p")]
+        if ps:
+            fields["attributes"].append({"label": ps[0], "values": ps[1:]})
+    return fields
+
+def _merge_split_attributes(fields: Dict[str, Any]):
+    """The page shows Body Style+Doors and Model+trim as one row each; Apollo splits them."""
+    by_label = {a["label"]: a["values"] for a in fields["attributes"]}
+    merged = []
+    for a in fields["attributes"]:
+        if a["label"] == "Body Style":
+            merged.append({"label": "Body Style", "values": a["values"][:1] + by_label.get("Doors", [])[:1]})
+        elif a["label"] == "Model":
+            merged.append({"label": "Model", "values": a["values"][:1] + by_label.get("Extra Info", [])})
+        elif a["label"] not in ("Doors", "Extra Info"):
+            merged.append(a)
+    fields["attributes"] = merged
+
+# =========================
+# Client
+# =========================
+class HttpEngine:
+    """One pooled httpx.AsyncClient (HTTP keep-alive) shared by the page walker and workers."""
+    def __init__(self, user_agent: str, max_connections: int = HTTP_MAX_CONNECTIONS,
+                 rate: Optional[RateController] = None, metrics: Optional[StageMetrics] = None):
+        self.rate = rate
+        self.metrics = metrics
+        if httpx is None:
+            raise RuntimeError("The HTTP engine needs httpx: pip install httpx")
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": user_agent, "Accept-Language": "en-CA,en;q=0.9",
+                     "Accept": "text/html,application/xhtml+xml"},
+            timeout=HTTP_TIMEOUT_SECS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+
+    async def get(self, url: str, referer: Optional[str] = None, attempts: int = 3, base_delay: float = 1.2) -> str:
+        headers = {"Referer": referer} if referer else None
+        for i in range(attempts):
+            t0 = time.monotonic()
+            try:
+                resp = await self.client.get(url, headers=headers)
+                if self.rate:
+                    self.rate.record(resp.status_code, time.monotonic() - t0)
+                if resp.status_code not in HTTP_RETRY_STATUSES:
+                    resp.raise_for_status()
+                    return resp.text
+                err: Exception = httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=resp.request, response=resp)
+            except httpx.TransportError as e:
+                if self.rate and isinstance(e, httpx.TimeoutException):
+                    self.rate.record(timeout=True)
+                err = e
+            if i == attempts - 1:
+                raise err
+            delay = self.rate.backoff(i, base_delay) if self.rate else base_delay * (2 ** i) + random.uniform(0.0, 0.8)
+            await asyncio.sleep(delay)
+            if self.metrics:
+                status = getattr(getattr(err, "response", None), "status_code", None)
+                self.metrics.observe("retry", delay, "throttled" if status in THROTTLE_STATUSES else
+                                     "timeout" if isinstance(err, httpx.TimeoutException) else "error")
+
+    async def search_page(self, url: str) -> Dict[str, Any]:
+        return parse_search_html(await self.get(url))
+
+    async def listing_fields(self, href: str, referer: str) -> Dict[str, Any]:
+        return parse_listing_html(await self.get(href, referer=referer), href)
+
+    async def aclose(self):
+        await self.client.aclose()
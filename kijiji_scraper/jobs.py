@@ -0,0 +1,275 @@
+"""
+Process-wide crawl jobs, for running the app as a shared service. Each job
+runs run_crawl() on its own thread with its own output directory
+(JOBS_DIR/<job id>/) and event log (events.jsonl there), so two crawls never
+write the same files and a crawl outlives the browser tab that started it:
+any session can follow a job by ID. A JobManager caps the Chromium browsers
+running across all jobs; jobs wait for a free slot in submission order.
+Jobs on the same browser server (cdp_url) share that server's slot.
+Job records (job.json) are reloaded when the process restarts.
+"""
+import json, os, secrets, threading, time, traceback
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from .checkpoint import checkpoint_path, load_checkpoint
+from .cli import run_crawl
+
+JOBS_DIR = os.environ.get("KIJIJI_JOBS_DIR", "kijiji_jobs")
+MAX_BROWSERS = int(os.environ.get("KIJIJI_MAX_BROWSERS", "2"))  # Chromium instances across all jobs
+JOB_EVENT_BACKLOG = 2000   # events per job kept in memory for sessions that (re)attach
+SLOT_POLL_SECS = 0.5       # how often a queued job checks for a free slot or Stop
+ACTIVE_STATUSES = ("queued", "running")
+STAT_EVENTS = ("pool", "rate", "net", "metrics", "memory")
+
+def _write_json(path: str, data: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+class Job:
+    """
+    One crawl: what to run (spec), where its files go, its status
+    (queued/running/completed/stopped/partial/failed/interrupted) and its
+    events. Events are numbered; events_since(seq) lets each attached UI read
+    from its own position, and `latest` keeps the newest stats event of each
+    kind in case older ones have left the backlog.
+    """
+    def __init__(self, job_id: str, job_dir: str, spec: Dict[str, Any]):
+        self.id, self.dir, self.spec = job_id, job_dir, spec
+        self.csv = os.path.join(job_dir, spec["csv_name"])
+        self.status = "queued"
+        self.created, self.started, self.finished = time.time(), None, None
+        self.rows = 0
+        self.stats: Dict[str, Any] = {}
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.stop_event = threading.Event()
+        self._events: deque = deque(maxlen=JOB_EVENT_BACKLOG)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._log = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    @property
+    def sharded(self) -> bool:
+        return self.spec["workers"] > 0 or len(self.spec["urls"]) > 1
+
+    @property
+    def browsers(self) -> int:
+        return self.spec["workers"] if self.sharded else 1
+
+    @property
+    def server(self) -> Optional[str]:
+        """The browser server this job opens its context in, if any (sharded runs launch their own)."""
+        return None if self.sharded else self.spec["crawl_opts"].get("cdp_url")
+
+    @property
+    def label(self) -> str:
+        return ", ".join(self.spec["urls"])
+
+    def output(self, fmt: str) -> str:
+        """Where this job writes `fmt` ("csv", "jsonl", "parquet", "sqlite"), as sinks.output_path names them."""
+        if fmt == "sqlite" and self.spec["crawl_opts"].get("output_db"):
+            return self.spec["crawl_opts"]["output_db"]
+        return self.csv if fmt == "csv" else os.path.splitext(self.csv)[0] + "." + fmt
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        return None if self.active or self.sharded else load_checkpoint(checkpoint_path(self.csv))
+
+    def record(self, evt: Dict[str, Any]):
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, evt))
+            if evt["type"] in STAT_EVENTS:
+                self.latest[evt["type"]] = evt
+            elif evt["type"] in ("flush", "done"):
+                self.rows = evt["total"]
+            if self._log is None:
+                self._log = open(os.path.join(self.dir, "events.jsonl"), "a", encoding="utf-8", buffering=1)
+            # the preview rows are already in the outputs
+            self._log.write(json.dumps({"ts": round(time.time(), 3),
+                                        **{k: v for k, v in evt.items() if k != "rows"}}) + "\n")
+
+    def events_since(self, seq: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(newest seq, events after `seq` still in the backlog)."""
+        with self._lock:
+            return self._seq, [evt for s, evt in self._events if s > seq]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "spec": self.spec, "status": self.status, "created": self.created,
+                "started": self.started, "finished": self.finished, "rows": self.rows, "stats": self.stats}
+
+    def save(self):
+        _write_json(os.path.join(self.dir, "job.json"), self.to_dict())
+
+    def close_log(self):
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+    @classmethod
+    def load(cls, job_dir: str) -> "Job":
+        """A job from an earlier process: whatever was still active then was cut off."""
+        with open(os.path.join(job_dir, "job.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        job = cls(data["id"], job_dir, data["spec"])
+        job.status = "interrupted" if data["status"] in ACTIVE_STATUSES else data["status"]
+        job.created, job.started, job.finished = data["created"], data["started"], data["finished"]
+        job.rows, job.stats = data["rows"], data["stats"]
+        try:
+            with open(os.path.join(job_dir, "events.jsonl"), encoding="utf-8") as f:
+                for line in deque(f, maxlen=JOB_EVENT_BACKLOG):
+                    evt = json.loads(line)
+                    job._seq += 1
+                    job._events.append((job._seq, evt))
+                    if evt["type"] in STAT_EVENTS:
+                        job.latest[evt["type"]] = evt
+        except (OSError, ValueError):
+            pass
+        return job
+
+class JobManager:
+    """
+    The job table for this process. submit() starts a job on its own thread
+    once `browsers` slots are free (a sharded job takes one per worker, and
+    its workers are capped at max_browsers); jobs on a browser server take
+    that server's one slot together, at most max_browsers contexts at a time.
+    stop() and resume() act on a job by ID. Thread-safe; the app keeps one
+    instance per server process.
+    """
+    def __init__(self, root: str = JOBS_DIR, max_browsers: int = MAX_BROWSERS):
+        self.root, self.max_browsers = root, max(1, max_browsers)
+        self.jobs: Dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._server_jobs: Dict[str, int] = {}   # running jobs per browser server
+        self._waiting: List[str] = []
+        os.makedirs(root, exist_ok=True)
+        for name in sorted(os.listdir(root)):
+            if os.path.exists(os.path.join(root, name, "job.json")):
+                try:
+                    job = Job.load(os.path.join(root, name))
+                except (OSError, ValueError, KeyError):
+                    continue
+                self.jobs[job.id] = job
+
+    def submit(self, urls: Dict[str, str], max_pages: int, csv_name: str = "kijiji_cars.csv", *,
+               workers: int = 0, shard_pages: Optional[int] = None, **crawl_opts) -> Job:
+        """Queue a crawl (run_crawl's arguments; csv_name is a file name inside the job's directory)."""
+        sharded = workers > 0 or len(urls) > 1
+        workers = min(workers or len(urls), self.max_browsers) if sharded else 0
+        job_id = time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(2)
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        if crawl_opts.get("cards_csv"):
+            crawl_opts["cards_csv"] = os.path.join(job_dir, os.path.basename(crawl_opts["cards_csv"]))
+        spec = {"urls": dict(urls), "max_pages": max_pages, "csv_name": os.path.basename(csv_name),
+                "workers": workers, "shard_pages": shard_pages, "crawl_opts": crawl_opts}
+        job = Job(job_id, job_dir, spec)
+        with self._cond:
+            self.jobs[job.id] = job
+        self._start(job, resume=False)
+        return job
+
+    def resume(self, job_id: str) -> Job:
+        """Continue a stopped or interrupted single-browser job from its checkpoint, in place."""
+        job = self.jobs[job_id]
+        if job.active:
+            raise ValueError(f"job {job_id} is still {job.status}")
+        if job.checkpoint() is None:
+            raise ValueError(f"job {job_id} has no checkpoint to resume from")
+        job.status, job.finished, job.stats = "queued", None, {}
+        job.stop_event = threading.Event()
+        self._start(job, resume=True)
+        return job
+
+    def stop(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job and job.active:
+            job.stop_event.set()
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        return self.jobs.get(job_id) if job_id else None
+
+    def list(self) -> List[Job]:
+        """Newest first."""
+        return sorted(self.jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def browsers_in_use(self) -> int:
+        return self._in_use
+
+    def _start(self, job: Job, resume: bool):
+        job.save()
+        # the job takes its place in line here: job threads may start in any order
+        with self._cond:
+            self._waiting.append(job.id)
+        threading.Thread(target=self._run, args=(job, resume), name=f"job-{job.id}", daemon=True).start()
+
+    def _need(self, job: Job) -> int:
+        """Browser slots starting `job` would take now (a server's slot is taken by its first job)."""
+        if job.server:
+            return 0 if self._server_jobs.get(job.server) else 1
+        return min(job.browsers, self.max_browsers)
+
+    def _fits(self, job: Job) -> bool:
+        if job.server and self._server_jobs.get(job.server, 0) >= self.max_browsers:
+            return False
+        return self._in_use + self._need(job) <= self.max_browsers
+
+    def _acquire(self, job: Job) -> bool:
+        """Wait until this job is first in line and its browsers fit; False if stopped while queued."""
+        with self._cond:
+            try:
+                while self._waiting[0] != job.id or not self._fits(job):
+                    if job.stop_event.is_set():
+                        return False
+                    self._cond.wait(SLOT_POLL_SECS)
+                self._in_use += self._need(job)
+                if job.server:
+                    self._server_jobs[job.server] = self._server_jobs.get(job.server, 0) + 1
+                return True
+            finally:
+                self._waiting.remove(job.id)
+                self._cond.notify_all()
+
+    def _release(self, job: Job):
+        with self._cond:
+            if job.server:
+                self._server_jobs[job.server] -= 1
+                if not self._server_jobs[job.server]:
+                    del self._server_jobs[job.server]
+            self._in_use -= self._need(job)
+            self._cond.notify_all()
+
+    def _run(self, job: Job, resume: bool):
+        with self._cond:
+            queued = self._waiting[0] != job.id or not self._fits(job)
+        if queued:
+            what = f"a context in {job.server}" if job.server else f"{job.browsers} of {self.max_browsers} browser slots"
+            job.record({"type": "log", "msg": f"Queued: waiting for {what}"})
+        if not self._acquire(job):
+            job.status, job.finished = "stopped", time.time()
+            job.record({"type": "log", "msg": "Stopped before it started"})
+            job.save()
+            job.close_log()
+            return
+        spec = job.spec
+        job.status, job.started = "running", time.time()
+        job.save()
+        try:
+            stats = run_crawl(spec["urls"], spec["max_pages"], job.csv, workers=spec["workers"],
+                              shard_pages=spec["shard_pages"], stop_event=job.stop_event, on_event=job.record,
+                              **spec["crawl_opts"], **({"resume": True} if resume else {}))
+        except Exception:
+            job.record({"type": "error", "trace": traceback.format_exc()})
+            stats = {"status": "failed"}
+        finally:
+            self._release(job)
+        job.status, job.stats, job.finished = stats["status"], stats, time.time()
+        job.save()
+        job.close_log()
@@ -0,0 +1,57 @@
+"""
+Resident memory of this process and everything it spawned (the Playwright
+driver and Chromium's browser, GPU and renderer processes), or of one
+browser's process tree, read from /proc
+without extra dependencies. Where /proc isn't available the readers return
+None and memory-based browser recycling is simply off.
+"""
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii", errors="replace") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+def _descendants(pid: int) -> List[int]:
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="ascii", errors="replace") as f:
+                stat = f.read()
+            # the command name sits in parentheses and may contain spaces
+            children[int(stat.rsplit(")", 1)[1].split()[1])].append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    found, todo = [], list(children.get(pid, ()))
+    while todo:
+        child = todo.pop()
+        found.append(child)
+        todo.extend(children.get(child, ()))
+    return found
+
+def memory_stats(pid: Optional[int] = None, root: Optional[int] = None) -> Optional[Dict[str, float]]:
+    """
+    {'rss_mb': this process, 'children_mb': all descendants, 'children': count}.
+    With `root` (a browser's pid), children_mb counts that process and its
+    descendants only, leaving out other browsers the process has spawned.
+    Chromium processes share pages, so children_mb overstates the true
+    footprint somewhat: a conservative number for an OOM guard.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    pid = pid or os.getpid()
+    kids = [root, *_descendants(root)] if root else _descendants(pid)
+    return {
+        "rss_mb": _rss_kb(pid) / 1024,
+        "children_mb": sum(_rss_kb(k) for k in kids) / 1024,
+        "children": len(kids),
+    }
@@ -0,0 +1,193 @@
+"""
+Per-stage crawl instrumentation: wall time and outcome counts for each step
+of a crawl (results pages, navigation, selector waits, extraction, phone
+reveals, retries, flushes). Call times also go into fixed histogram
+buckets, so shard snapshots merge exactly and percentiles come out of
+the merged counts. scrape_kijiji sends snapshots as "metrics" events;
+prometheus_text() renders one for a textfile collector or /metrics.
+"""
+import asyncio, os, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .rate import Throttled
+
+# stage -> what it times
+STAGES = {
+    "search_page": "one results page: navigation, wait and card extraction (or HTTP fetch + parse)",
+    "goto": "browser navigation to a results or listing page",
+    "selector_wait": "waiting for results cards to render",
+    "extract": "reading listing or card fields out of a loaded page",
+    "http_listing": "HTTP engine: listing fetch and parse",
+    "phone": "revealing a phone number (includes the deliberate pause)",
+    "retry": "backoff sleeps before a retry",
+    "listing": "one listing end to end",
+    "flush": "writing a batch of rows to every output",
+}
+# upper bounds (secs) of the per-stage duration buckets; the last one catches the rest
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, Throttled):
+        return "throttled"
+    # Playwright, httpx and asyncio timeouts, without importing the first two here
+    if isinstance(exc, asyncio.TimeoutError) or "Timeout" in type(exc).__name__:
+        return "timeout"
+    return "error"
+
+def _new_stage() -> Dict[str, Any]:
+    return {"count": 0, "secs": 0.0, "max_secs": 0.0, "outcomes": {}, "buckets": [0] * len(STAGE_BUCKETS)}
+
+def stage_percentile(stage: Dict[str, Any], pct: float) -> float:
+    """
+    Estimated pct-th percentile call time of a snapshot's stage, interpolated
+    within its bucket like Prometheus' histogram_quantile (and never above
+    the slowest call); 0.0 without calls.
+    """
+    if not stage["count"]:
+        return 0.0
+    rank = pct / 100 * stage["count"]
+    seen, lower = 0, 0.0
+    for upper, n in zip(STAGE_BUCKETS, stage["buckets"]):
+        if n and seen + n >= rank:
+            if upper == float("inf"):
+                return stage["max_secs"]
+            return min(stage["max_secs"], lower + (upper - lower) * (rank - seen) / n)
+        seen, lower = seen + n, upper
+    return stage["max_secs"]
+
+class StageMetrics:
+    """
+    Totals per stage: calls, seconds, slowest call, counts per outcome
+    (ok/timeout/error/...) and calls per STAGE_BUCKETS duration bucket.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, stage: str, secs: float, outcome: str = "ok"):
+        s = self.stages.setdefault(stage, _new_stage())
+        s["count"] += 1
+        s["buckets"][bisect_left(STAGE_BUCKETS, secs)] += 1
+        s["secs"] += secs
+        s["max_secs"] = max(s["max_secs"], secs)
+        s["outcomes"][outcome] = s["outcomes"].get(outcome, 0) + 1
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time the block; an exception counts as throttled, timeout or error and propagates."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.observe(stage, time.perf_counter() - t0, _outcome(e))
+            raise
+        self.observe(stage, time.perf_counter() - t0)
+
+    def snapshot(self, rows: int = 0) -> Dict[str, Any]:
+        elapsed = time.time() - self.started
+        pages = self.stages.get("search_page", {}).get("outcomes", {}).get("ok", 0)
+        return {
+            "elapsed_secs": elapsed, "rows": rows, "pages": pages,
+            "rows_per_min": 60 * rows / elapsed if elapsed > 0 else 0.0,
+            "stages": {k: {**v, "outcomes": dict(v["outcomes"]), "buckets": list(v["buckets"])}
+                       for k, v in self.stages.items()},
+        }
+
+def timed(metrics: Optional[StageMetrics], stage: str):
+    """metrics.stage(stage), or a no-op without metrics."""
+    return metrics.stage(stage) if metrics else nullcontext()
+
+def merge_snapshots(snaps: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum shard snapshots into one (elapsed is the longest shard's)."""
+    out: Dict[str, Any] = {"elapsed_secs": 0.0, "rows": 0, "pages": 0, "stages": {}}
+    for snap in snaps:
+        out["elapsed_secs"] = max(out["elapsed_secs"], snap["elapsed_secs"])
+        out["rows"] += snap["rows"]
+        out["pages"] += snap["pages"]
+        for name, s in snap["stages"].items():
+            m = out["stages"].setdefault(name, _new_stage())
+            m["count"] += s["count"]
+            m["buckets"] = [a + b for a, b in zip(m["buckets"], s["buckets"])]
+            m["secs"] += s["secs"]
+            m["max_secs"] = max(m["max_secs"], s["max_secs"])
+            for outcome, n in s["outcomes"].items():
+                m["outcomes"][outcome] = m["outcomes"].get(outcome, 0) + n
+    out["rows_per_min"] = 60 * out["rows"] / out["elapsed_secs"] if out["elapsed_secs"] > 0 else 0.0
+    return out
+
+def _label(name: str, value: Any) -> str:
+    """name="value" with the exposition format's escapes (backslash, double quote, newline)."""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{escaped}"'
+
+def _le(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+def prometheus_text(snap: Dict[str, Any], labels: Optional[Dict[str, str]] = None) -> str:
+    """Prometheus text exposition of a snapshot; `labels` go on every sample."""
+    base = ",".join(_label(k, v) for k, v in (labels or {}).items())
+
+    def sample(name, value, **extra):
+        lbl = ",".join(filter(None, [base, *(_label(k, v) for k, v in extra.items())]))
+        return f"{name}{{{lbl}}} {value}" if lbl else f"{name} {value}"
+
+    lines = [
+        "# HELP kijiji_rows_total Rows written to the outputs.", "# TYPE kijiji_rows_total counter",
+        sample("kijiji_rows_total", snap["rows"]),
+        "# HELP kijiji_pages_total Results pages read.", "# TYPE kijiji_pages_total counter",
+        sample("kijiji_pages_total", snap["pages"]),
+        "# HELP kijiji_rows_per_minute Rows per minute since the crawl started.", "# TYPE kijiji_rows_per_minute gauge",
+        sample("kijiji_rows_per_minute", round(snap["rows_per_min"], 3)),
+        "# HELP kijiji_elapsed_seconds Seconds since the crawl started.", "# TYPE kijiji_elapsed_seconds gauge",
+        sample("kijiji_elapsed_seconds", round(snap["elapsed_secs"], 3)),
+        "# HELP kijiji_stage_seconds_total Wall time spent per stage.", "# TYPE kijiji_stage_seconds_total counter",
+    ]
+    stages = sorted(snap["stages"].items())
+    lines += [sample("kijiji_stage_seconds_total", round(s["secs"], 6), stage=name) for name, s in stages]
+    lines += ["# HELP kijiji_stage_max_seconds Slowest single call per stage.", "# TYPE kijiji_stage_max_seconds gauge"]
+    lines += [sample("kijiji_stage_max_seconds", round(s["max_secs"], 6), stage=name) for name, s in stages]
+    lines += ["# HELP kijiji_stage_calls_total Calls per stage and outcome.", "# TYPE kijiji_stage_calls_total counter"]
+    lines += [sample("kijiji_stage_calls_total", n, stage=name, outcome=outcome)
+              for name, s in stages for outcome, n in sorted(s["outcomes"].items())]
+    lines += ["# HELP kijiji_stage_duration_seconds Call time per stage.",
+              "# TYPE kijiji_stage_duration_seconds histogram"]
+    for name, s in stages:
+        cumulative = 0
+        for bound, n in zip(STAGE_BUCKETS, s["buckets"]):
+            cumulative += n
+            lines.append(sample("kijiji_stage_duration_seconds_bucket", cumulative, stage=name, le=_le(bound)))
+        lines.append(sample("kijiji_stage_duration_seconds_sum", round(s["secs"], 6), stage=name))
+        lines.append(sample("kijiji_stage_duration_seconds_count", s["count"], stage=name))
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str, text: str):
+    """Replace `path` atomically (node_exporter's textfile collector reads it at any time)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def serve_prometheus(port: int, get_text: Callable[[], str], host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve get_text() at /metrics from a daemon thread until server.shutdown()."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = get_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
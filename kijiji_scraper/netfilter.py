@@ -0,0 +1,162 @@
+"""
+Request filtering for browser pages. Rules block by domain, URL wildcard
+pattern or resource type; an allowlist overrides them. On Chromium the
+rules go to the browser itself (CDP Network.setBlockedURLs), so requests
+never round-trip through Python; elsewhere a per-page route does the same
+check in Python.
+"""
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+# ads, analytics, tag managers, session replay, beacons
+BLOCK_DOMAINS = [
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "googletagservices.com",
+    "googletagmanager.com", "google-analytics.com", "adservice.google.com", "adnxs.com",
+    "amazon-adsystem.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "adsrvr.org", "rubiconproject.com", "pubmatic.com", "casalemedia.com", "openx.net",
+    "moatads.com", "scorecardresearch.com", "quantserve.com", "facebook.net", "connect.facebook.net",
+    "bat.bing.com", "clarity.ms", "hotjar.com", "optimizely.com", "segment.io", "segment.com",
+    "branch.io", "nr-data.net", "newrelic.com", "sentry.io", "tiqcdn.com", "demdex.net",
+    "omtrdc.net", "everesttech.net", "bounceexchange.com", "qualtrics.com", "tealiumiq.com",
+]
+# well-known tracker scripts when self-hosted (kept narrow: these also see page navigations)
+BLOCK_URL_PATTERNS = ["*/gtm.js*", "*/analytics.js*", "*/fbevents.js*", "*/beacon.min.js*"]
+BLOCK_RESOURCE_TYPES = {"image", "media", "font", "texttrack", "manifest"}
+
+# Chromium's URL blocking has no notion of resource type, so blocked types
+# are also expressed as URL patterns (extensions, image hosts) for it.
+TYPE_URL_PATTERNS = {
+    "image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*",
+              "*://i.ebayimg.com/*", "*://media.kijiji.ca/*"],
+    "media": ["*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*"],
+    "font": ["*.woff*", "*.ttf*", "*.otf*", "*.eot*"],
+    "texttrack": ["*.vtt*"],
+    "manifest": ["*.webmanifest*"],
+}
+
+def _is_pattern(rule: str) -> bool:
+    return "*" in rule or "/" in rule
+
+def _domain_patterns(domain: str) -> List[str]:
+    return [f"*://{domain}/*", f"*://*.{domain}/*"]
+
+def _host_matches(host: str, domain: str) -> bool:
+    return host == domain or host.endswith("." + domain)
+
+def _pattern_host(pattern: str) -> Optional[str]:
+    """'*://*.doubleclick.net/*' -> 'doubleclick.net'; None for patterns without a host ('*/ads/*')."""
+    if "://" not in pattern:
+        return None
+    host = pattern.split("://", 1)[1].split("/", 1)[0].split(":", 1)[0]
+    return host[2:] if host.startswith("*.") else host or None
+
+def _names_domain(pattern: str, domain: str) -> bool:
+    """The pattern's host is the domain, a subdomain of it or a parent of it."""
+    host = _pattern_host(pattern)
+    if not host:
+        return False
+    if "*" in host:
+        return fnmatchcase(domain, host)
+    return _host_matches(host, domain) or _host_matches(domain, host)
+
+class NetFilter:
+    """
+    Block rules are domains ("doubleclick.net"), URL wildcard patterns
+    ("*/ads/*") or resource types ("type:media"); `block` adds to the
+    defaults above. Allow rules (domains or patterns) win over any block
+    rule. One instance per crawl: attach() it to each page and read the
+    totals with stats().
+    """
+    def __init__(self, block: Optional[Iterable[str]] = None, allow: Optional[Iterable[str]] = None):
+        self.domains = set(BLOCK_DOMAINS)
+        self.patterns = list(BLOCK_URL_PATTERNS)
+        self.types = set(BLOCK_RESOURCE_TYPES)
+        for rule in (r.strip().lower() for r in block or () if r.strip()):
+            if rule.startswith("type:"):
+                self.types.add(rule[5:])
+            elif _is_pattern(rule):
+                self.patterns.append(rule)
+            else:
+                self.domains.add(rule)
+        allow = [r.strip().lower() for r in allow or () if r.strip()]
+        self.allow_domains = [r for r in allow if not _is_pattern(r)]
+        self.allow_patterns = [r for r in allow if _is_pattern(r)]
+        # an allowed domain also lifts any broader or narrower block on it
+        self.domains = {d for d in self.domains
+                        if not any(_host_matches(d, a) or _host_matches(a, d) for a in self.allow_domains)}
+        self.blocked = self.loaded = self.bytes = self.pages = 0
+        self.mode = None
+
+    def allowed(self, url: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        return (any(_host_matches(host, a) for a in self.allow_domains)
+                or any(fnmatchcase(url.lower(), p) for p in self.allow_patterns))
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if self.allowed(url):
+            return False
+        if resource_type in self.types:
+            return True
+        host = (urlsplit(url).hostname or "").lower()
+        if any(_host_matches(host, d) for d in self.domains):
+            return True
+        low = url.lower()
+        return any(fnmatchcase(low, p) for p in self.patterns)
+
+    def browser_patterns(self) -> List[str]:
+        """
+        The rules as Network.setBlockedURLs wildcards. Chromium has no
+        exceptions, so allow rules can only drop whole patterns: ones equal
+        to an allowed pattern or whose host is an allowed domain, a parent or
+        a subdomain of one (compared by host, so allowing "ads.com" keeps
+        "*://*.pubads.com/*").
+        """
+        urls: List[str] = []
+        for d in sorted(self.domains):
+            urls += _domain_patterns(d)
+        urls += self.patterns
+        for t in sorted(self.types):
+            urls += TYPE_URL_PATTERNS.get(t, [])
+        return [u for u in urls
+                if u not in self.allow_patterns and not any(_names_domain(u, a) for a in self.allow_domains)]
+
+    async def attach(self, page):
+        """Apply the rules to one page: in Chromium via CDP, otherwise via page.route."""
+        self.pages += 1
+        try:
+            cdp = await page.context.new_cdp_session(page)
+        except Exception:
+            cdp = None  # not Chromium: filter in Python instead
+        if cdp is not None:
+            self.mode = "browser"
+            cdp.on("Network.loadingFinished", self._on_finished)
+            cdp.on("Network.loadingFailed", self._on_failed)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.setBlockedURLs", {"urls": self.browser_patterns()})
+        else:
+            self.mode = "route"
+            await page.route("**/*", self._route)
+
+    def _on_finished(self, params: Dict[str, Any]):
+        self.loaded += 1
+        self.bytes += int(params.get("encodedDataLength") or 0)
+
+    def _on_failed(self, params: Dict[str, Any]):
+        if params.get("blockedReason") == "inspector":  # i.e. by setBlockedURLs
+            self.blocked += 1
+
+    async def _route(self, route):
+        req = route.request
+        if self.should_block(req.url, req.resource_type):
+            self.blocked += 1
+            await route.abort()
+        else:
+            self.loaded += 1
+            await route.fallback()  # on to any context route (AssetCache)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode, "pages": self.pages, "blocked": self.blocked,
+            "loaded": self.loaded, "bytes": self.bytes,
+        }
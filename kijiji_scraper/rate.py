@@ -0,0 +1,122 @@
+"""
+Adaptive pacing (AIMD): concurrency and per-domain request spacing grow
+while the site answers quickly, and are halved/doubled on timeouts,
+429/403/503 responses or very slow responses.
+"""
+import asyncio, random, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Any, Optional
+from urllib.parse import urlparse
+
+RATE_START_DELAY = 1.0     # secs between request starts on one domain, at launch
+RATE_MIN_DELAY = 0.3
+RATE_MAX_DELAY = 30.0
+RATE_DELAY_STEP = 0.1      # additive decrease of the gap per healthy window
+RATE_SLOW_SECS = 15.0      # a response slower than this counts as a bad signal
+RATE_COOLDOWN_SECS = 5.0   # at most one multiplicative cut per this long
+RATE_EMIT_SECS = 2.0       # how often the controller reports its state
+THROTTLE_STATUSES = {403, 429, 503}
+
+class Throttled(Exception):
+    """A navigation came back 403/429/503; retried like a timeout."""
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+class RateController:
+    """
+    Shared by every worker of a crawl. `slot(url)` bounds requests in flight
+    to the current limit and spaces request starts per domain by the current
+    delay; `space(url)` alone only spaces (the results-page walker, which
+    must not wait behind listings). `record(...)` feeds back each response.
+    A healthy window (2x limit good responses) adds one slot and trims the
+    delay; a bad signal halves the limit and doubles the delay, once per
+    cooldown.
+    """
+    def __init__(self, max_concurrency: int, start_delay: float = RATE_START_DELAY,
+                 min_delay: float = RATE_MIN_DELAY, max_delay: float = RATE_MAX_DELAY,
+                 emit: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = max(1, self.max_concurrency // 2)
+        self.delay = start_delay
+        self.min_delay, self.max_delay = min_delay, max_delay
+        self.emit = emit
+        self.ewma_latency: Optional[float] = None
+        self.requests = self.timeouts = self.throttled = 0
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._lock = asyncio.Lock()
+        self._next_at: Dict[str, float] = {}
+        self._ok_streak = 0
+        self._last_cut = 0.0
+        self._last_emit = 0.0
+        self._recent: deque = deque()  # completion times, last 60s
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            await self.space(url)
+            yield
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    async def space(self, url: str):
+        """Wait until this domain's next request start is due."""
+        domain = urlparse(url).netloc
+        async with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at.get(domain, 0.0))
+            self._next_at[domain] = start_at + self.delay * random.uniform(0.75, 1.25)
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    def record(self, status: Optional[int] = None, latency: Optional[float] = None, timeout: bool = False):
+        now = time.monotonic()
+        self.requests += 1
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if latency is not None:
+            self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+
+        throttled = status in THROTTLE_STATUSES
+        if timeout or throttled or (latency or 0) > RATE_SLOW_SECS:
+            if timeout:
+                self.timeouts += 1
+            if throttled:
+                self.throttled += 1
+            self._ok_streak = 0
+            # a burst of failures from one slowdown counts once
+            if now - self._last_cut > RATE_COOLDOWN_SECS:
+                self._last_cut = now
+                self.limit = max(1, self.limit // 2)
+                self.delay = min(self.max_delay, self.delay * 2)
+        else:
+            self._ok_streak += 1
+            if self._ok_streak >= 2 * self.limit:
+                self._ok_streak = 0
+                self.limit = min(self.max_concurrency, self.limit + 1)
+                self.delay = max(self.min_delay, self.delay - RATE_DELAY_STEP)
+
+        if self.emit and now - self._last_emit >= RATE_EMIT_SECS:
+            self._last_emit = now
+            self.emit(self.snapshot())
+
+    def backoff(self, attempt: int, base_delay: float) -> float:
+        """Retry sleep: exponential on top of the current (adaptive) gap."""
+        return max(base_delay, self.delay) * (2 ** attempt) + random.uniform(0.0, 0.8)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit, "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight, "delay": round(self.delay, 2),
+            "rpm": len(self._recent),
+            "latency_ms": round(1000 * self.ewma_latency) if self.ewma_latency is not None else None,
+            "requests": self.requests, "timeouts": self.timeouts, "throttled": self.throttled,
+        }
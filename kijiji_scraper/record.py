@@ -0,0 +1,68 @@
+"""
+Listing record filled by fetch_listing, and the batched normalization that
+turns a flush's worth of records into a typed DataFrame for the sinks.
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# attribute -> CSV column, in CSV order
+COLUMNS = {
+    "duration_posted": "Duration Posted", "href": "Listing Link", "name": "Name", "price": "Price",
+    "location": "Location", "seller": "Seller Name", "phone": "Phone",
+    "seats": "Seats", "kilometres": "Kilometres", "body_style": "Body Style", "doors": "Doors",
+    "transmission": "Transmission", "model": "Model", "extra_info": "Extra Info", "fuel": "Fuel",
+}
+CSV_COLUMNS = list(COLUMNS.values())
+CATEGORICAL_COLUMNS = ["Body Style", "Fuel"]
+TYPED_COLUMNS = ["Price Cents", "Km", "Posted At"]
+# first two letters of the age unit ("3 hrs ago", "25 mins ago", "2 days ago") -> seconds
+AGE_UNIT_SECS = {"se": 1, "mi": 60, "hr": 3600, "ho": 3600, "da": 86400, "we": 604800}
+
+class Listing:
+    """One scraped listing: text fields as the page shows them, None where missing."""
+    __slots__ = (*COLUMNS, "scraped_at")
+
+    def __init__(self, href: str, **fields: Optional[str]):
+        for attr in COLUMNS:
+            setattr(self, attr, None)
+        self.href = href
+        for attr, value in fields.items():
+            setattr(self, attr, value)
+        self.scraped_at = time.time()
+
+    @property
+    def ok(self) -> bool:
+        """The listing page was read (a failed visit only has its href)."""
+        return self.name is not None
+
+    def as_row(self) -> Dict[str, Any]:
+        """CSV-shaped dict, '-' for missing fields."""
+        return {col: getattr(self, attr) or '-' for attr, col in COLUMNS.items()}
+
+def to_frame(listings: List[Listing]) -> pd.DataFrame:
+    """
+    Records -> DataFrame with the CSV text columns (NA where missing;
+    Body Style/Fuel categorical) plus TYPED_COLUMNS parsed column-wise:
+    Price Cents and Km as nullable ints, Posted At as a UTC timestamp
+    (scrape time minus the "3 hrs ago" age).
+    """
+    attrs = list(COLUMNS)
+    df = pd.DataFrame([[getattr(l, a) for a in attrs] for l in listings], columns=CSV_COLUMNS, dtype="string")
+    df = df.replace({"-": pd.NA, "": pd.NA})
+
+    dollars = df["Price"].str.replace(",", "", regex=False).str.extract(r"\$\s*(\d+(?:\.\d+)?)", expand=False)
+    df["Price Cents"] = (pd.to_numeric(dollars) * 100).round().astype("Int64")
+    km = df["Kilometres"].str.replace(",", "", regex=False).str.extract(r"(\d+)", expand=False)
+    df["Km"] = pd.to_numeric(km).astype("Int64")
+
+    age = df["Duration Posted"].str.lower().str.extract(r"(\d+)\s*([a-z]{2})")
+    secs = pd.to_numeric(age[0]) * age[1].map(AGE_UNIT_SECS).astype("float64")
+    scraped = np.array([l.scraped_at for l in listings], dtype="float64")
+    df["Posted At"] = pd.to_datetime(scraped - secs.to_numpy(dtype="float64", na_value=np.nan), unit="s", utc=True)
+
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
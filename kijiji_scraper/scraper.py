@@ -0,0 +1,1048 @@
+"""
+Scraper core: browser setup, listing extraction and the pipelined crawl.
+No Streamlit in here so shard worker processes can import it.
+"""
+import sys, asyncio, csv, random, re, traceback, threading, queue, os, time
+from contextlib import asynccontextmanager
+from typing import List, Callable, Dict, Any, Optional, Sequence
+from urllib.parse import urlsplit, urlunsplit
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+from .asset_cache import AssetCache
+from .categories import BASE_URL, CATEGORIES
+from .checkpoint import checkpoint_path, clear_checkpoint, load_checkpoint, save_checkpoint
+from .http_engine import HttpEngine
+from .memory import memory_stats
+from .metrics import StageMetrics, timed
+from .netfilter import NetFilter
+from .rate import THROTTLE_STATUSES, RateController, Throttled
+from .record import CSV_COLUMNS, Listing, to_frame
+from .sinks import excel_row, open_sinks
+from .seen import SEEN_DB, SEEN_TTL_SECS, SeenIndex, listing_id
+
+# =========================
+# Config
+# =========================
+DEFAULT_URL = CATEGORIES["cars"][1]
+
+FLUSH_EVERY = 10           # write/refresh every N rows
+DETAIL_CONCURRENCY = 1     # listing pages in flight at once (1 = sequential)
+MAX_DETAIL_CONCURRENCY = 8
+HREF_QUEUE_MAX = 60        # hrefs the page walker may queue ahead of the listing workers
+STOP_POLL_SECS = 0.3       # how often the crawl checks the Stop button
+PHONE_CONCURRENCY = 2      # listing pages open at once during the phone pass
+PHONE_START_DELAY = 3.0    # phone pass: initial gap between request starts on one domain
+PHONE_MIN_DELAY = 2.0      # ...and the smallest gap it adapts down to
+PAGE_MAX_USES = 25         # recycle a pooled listing page after this many visits
+BROWSER_RECYCLE_LISTINGS = 400  # relaunch Chromium after this many page visits (0: never)
+BROWSER_RSS_LIMIT_MB = 1200     # ...or once the browser's processes hold this much RSS (0: no limit)
+MEMORY_CHECK_SECS = 10.0        # how often memory is sampled (and sent as a 'memory' event)
+PREVIEW_ROWS = 50          # newest rows sent with each 'flush' event for the app's preview
+RECENT_UNITS = ["hrs", "hr", "mins", "min", "seconds", "sec"]  # "listing-date" texts we keep
+
+# Runs in the results page: every card's link/date/title/price/location plus
+# the next-page href, so a results page costs one CDP round trip.
+SEARCH_PAGE_JS = """
+() => {
+  const text = (root, sel) => {
+    const el = root.querySelector(sel);
+    return el ? el.textContent.replace(/\\s+/g, ' ').trim() : null;
+  };
+  const sections = [
+    ...document.querySelectorAll('.vAthl .vAthl div section'),
+    ...document.querySelectorAll("[data-testid='srp-search-list'] section"),
+  ];
+  const cards = sections.map(s => {
+    const a = s.querySelector('a[data-testid="listing-link"]');
+    return {
+      href: a ? a.getAttribute('href') : null,
+      date: text(s, '[data-testid="listing-date"]'),
+      title: text(s, '[data-testid="listing-title"]') || (a ? a.textContent.replace(/\\s+/g, ' ').trim() : null),
+      price: text(s, '[data-testid="listing-price"]'),
+      location: text(s, '[data-testid="listing-location"]'),
+    };
+  });
+  let next = document.querySelector('li[data-testid="pagination-next-link"] a');
+  if (!next) {
+    next = [...document.querySelectorAll('nav[aria-label="Search Pagination"] a')]
+      .find(a => a.textContent.includes('Next')) || null;
+  }
+  return { cards, next: next ? next.getAttribute('href') : null };
+}
+"""
+CARD_FIELDS = ['Page', 'Listing Link', 'Title', 'Price', 'Location', 'Duration Posted']
+
+UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+      "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+
+# ---- Windows: Proactor loop (supports subprocesses for Playwright) ----
+if sys.platform.startswith("win"):
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+# =========================
+# Helpers
+# =========================
+def page_url(url: str, n: int) -> str:
+    """Kijiji results URL for page n: /b-cars-trucks/canada/page-3/c174l0?..."""
+    parts = urlsplit(url)
+    segs = [s for s in parts.path.rstrip("/").split("/") if not re.fullmatch(r"page-\d+", s)]
+    if n > 1:
+        segs.insert(len(segs) - 1, f"page-{n}")
+    return urlunsplit(parts._replace(path="/".join(segs)))
+
+def category_of(url: str) -> Optional[str]:
+    """'/b-cars-trucks/canada/page-2/c174l0' -> 'cars-trucks'"""
+    m = re.search(r"/b-([^/]+)/", urlsplit(url).path)
+    return m.group(1) if m else None
+
+def append_csv(path: str, rows: List[Dict[str, Any]], fieldnames: List[str]):
+    """Append rows to path (Excel-safe values), writing the header if the file is new."""
+    if not rows:
+        return
+    write_header = not os.path.exists(path)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames)
+        if write_header:
+            w.writeheader()
+        w.writerows(excel_row(r) for r in rows)
+
+def card_row(card: Dict[str, Any], page_no: int) -> Dict[str, Any]:
+    """Search-results card -> CARD_FIELDS row (recorded even if the listing isn't opened)."""
+    return {
+        'Page': page_no, 'Listing Link': card["href"],
+        'Title': card["title"] or '-', 'Price': card["price"] or '-',
+        'Location': card["location"] or '-', 'Duration Posted': card["date"] or '-',
+    }
+
+def is_recent(duration_text: str) -> bool:
+    return any(u in duration_text for u in RECENT_UNITS)
+
+async def human_pause(a=0.8, b=1.8):
+    await asyncio.sleep(random.uniform(a, b))
+
+async def with_retries(coro_fn, attempts=3, base_delay=1.5, rate: Optional[RateController] = None,
+                       metrics: Optional[StageMetrics] = None):
+    last_exc = None
+    for i in range(attempts):
+        try:
+            return await coro_fn()
+        except (PlaywrightTimeoutError, Throttled) as e:
+            last_exc = e
+            if i < attempts - 1:
+                delay = rate.backoff(i, base_delay) if rate else base_delay * (2 ** i) + random.uniform(0.0, 0.8)
+                await asyncio.sleep(delay)
+                if metrics:
+                    metrics.observe("retry", delay, "throttled" if isinstance(e, Throttled) else "timeout")
+    if last_exc:
+        raise last_exc
+
+async def goto_tracked(page, url: str, rate: Optional[RateController] = None,
+                       metrics: Optional[StageMetrics] = None, **kwargs):
+    """
+    page.goto(domcontentloaded) that reports latency/status to `rate` and
+    the "goto" stage to `metrics`; 403/429/503 raise Throttled.
+    """
+    with timed(metrics, "goto"):
+        t0 = time.monotonic()
+        try:
+            resp = await page.goto(url, wait_until="domcontentloaded", **kwargs)
+        except PlaywrightTimeoutError:
+            if rate:
+                rate.record(timeout=True)
+            raise
+        status = resp.status if resp else None
+        if rate:
+            rate.record(status, time.monotonic() - t0)
+        if status in THROTTLE_STATUSES:
+            raise Throttled(status)
+    return resp
+
+class PagePool:
+    """
+    Warm listing pages reused across visits instead of new_page()/close() per
+    listing. Pages are created lazily up to `size`, reset to about:blank on
+    return, and replaced after max_uses visits or any error to bound memory.
+    New pages get `net`'s request filtering before first use.
+    """
+    def __init__(self, context, size: int, max_uses: int = PAGE_MAX_USES, net: Optional[NetFilter] = None):
+        self.context = context
+        self.net = net
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._uses: Dict[Any, int] = {}
+        self._opening = 0  # slots reserved for pages still being created
+        self.checkouts = 0
+        self.recycles = 0
+        self._wait_total = 0.0
+
+    async def _new_page(self):
+        page = await self.context.new_page()
+        if self.net:
+            await self.net.attach(page)
+        return page
+
+    async def acquire(self):
+        t0 = time.monotonic()
+        if self._idle.empty() and len(self._uses) + self._opening < self.size:
+            # reserve the slot before awaiting, or concurrent acquires could all pass the check
+            self._opening += 1
+            try:
+                page = await self._new_page()
+            finally:
+                self._opening -= 1
+            self._uses[page] = 0
+        else:
+            page = await self._idle.get()
+        self._wait_total += time.monotonic() - t0
+        self.checkouts += 1
+        self._uses[page] += 1
+        return page
+
+    async def release(self, page, failed: bool = False):
+        if not failed and self._uses.get(page, 0) < self.max_uses:
+            try:
+                await page.goto("about:blank")
+                self._idle.put_nowait(page)
+                return
+            except Exception:
+                pass
+        # recycle: drop this page, keep the slot filled with a fresh one
+        self.recycles += 1
+        self._uses.pop(page, None)
+        self._opening += 1  # the slot stays taken while its replacement opens
+        try:
+            try:
+                await page.close()
+            except Exception:
+                pass
+            fresh = await self._new_page()
+        except Exception:
+            return  # context is going away; acquire() will refill the slot
+        finally:
+            self._opening -= 1
+        self._uses[fresh] = 0
+        self._idle.put_nowait(fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size, "open": len(self._uses),
+            "checkouts": self.checkouts, "recycles": self.recycles,
+            "avg_wait_ms": 1000 * self._wait_total / self.checkouts if self.checkouts else 0.0,
+        }
+
+    async def close(self):
+        for page in list(self._uses):
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._uses.clear()
+
+async def create_context(p, *, headless: bool, net: Optional[NetFilter] = None, cdp_url: Optional[str] = None):
+    """
+    Launch Chromium, or connect to a running one at cdp_url (BrowserServer),
+    and open a context. Without `net`, heavy assets are blocked by a
+    context-wide route; with it, filtering is per page (net.attach) and
+    nothing is routed through Python here. Closing a connected browser only
+    disconnects; the server keeps running.
+    """
+    if cdp_url:
+        browser = await p.chromium.connect_over_cdp(cdp_url)
+    else:
+        browser = await p.chromium.launch(
+            headless=headless,
+            args=[
+                "--disable-blink-features=AutomationControlled",
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+            ],
+        )
+    context = await browser.new_context(
+        user_agent=UA,
+        viewport={"width": random.randint(1280, 1600), "height": random.randint(800, 950)},
+        locale="en-CA",
+        timezone_id="America/Toronto",
+        extra_http_headers={"Accept-Language": "en-CA,en;q=0.9"},
+    )
+    await context.add_init_script(
+        "Object.defineProperty(navigator, 'webdriver', { get: () => undefined });"
+    )
+    if net is None:
+        # block heavy assets (keep CSS/JS)
+        await context.route(
+            "**/*",
+            lambda route: (
+                route.abort() if route.request.resource_type in {"image", "media", "font"} else route.continue_()
+            ),
+        )
+    context.set_default_navigation_timeout(90_000)
+    context.set_default_timeout(20_000)
+    return browser, context
+
+async def browser_pid(browser) -> Optional[int]:
+    """Pid of a launched Chromium's browser process, asked over CDP; None if it won't say."""
+    try:
+        cdp = await browser.new_browser_cdp_session()
+        try:
+            info = await cdp.send("SystemInfo.getProcessInfo")
+        finally:
+            await cdp.detach()
+    except Exception:
+        return None
+    return next((proc["id"] for proc in info.get("processInfo", ()) if proc.get("type") == "browser"), None)
+
+class BrowserHost:
+    """
+    The crawl's Chromium (browser, context and page pool), replaced as a unit
+    after `recycle_listings` page visits or once its processes (the browser
+    and everything under it) pass `recycle_rss_mb`; 0 turns a trigger
+    off. Work on the browser happens inside `async with host.use()`; a
+    recycle waits for those blocks to finish, so queued listings and the
+    page walk carry on in the new browser where they left off. Take any
+    rate slot before use(), never inside it: a block waiting on the rate
+    controller would hold up a recycle that the slot's owner waits on.
+    With cdp_url the host opens its context in a shared BrowserServer
+    instead (a recycle then swaps the context, not the browser), and falls
+    back to launching its own Chromium if the server doesn't answer; the
+    RSS trigger is off then, since the server's memory is every crawl's.
+    Memory is measured from the browser's own pid down, never the whole
+    process: the app runs several crawls (and a BrowserServer) as threads
+    of one process, and their Chromiums are no concern of this host's. If
+    that pid can't be found, there are no 'memory' events and no RSS trigger.
+    With `assets`, every context it opens serves JS/CSS through that AssetCache.
+    Chromium is launched by the first use(), so a crawl that never needs it
+    (HTTP engine with phones off) never starts one.
+    """
+    def __init__(self, p, pool_size: int, net: NetFilter, recycle_listings: int = BROWSER_RECYCLE_LISTINGS,
+                 recycle_rss_mb: float = BROWSER_RSS_LIMIT_MB, emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 cdp_url: Optional[str] = None, assets: Optional[AssetCache] = None):
+        self.p, self.pool_size, self.net, self.emit, self.cdp_url = p, pool_size, net, emit, cdp_url
+        self.assets = assets
+        self.recycle_listings, self.recycle_rss_mb = recycle_listings, recycle_rss_mb
+        self.browser = self.context = self.pool = None
+        self.browser_pid: Optional[int] = None
+        self.generation = self.recycles = 0
+        self._users = 0
+        self._recycling = False
+        self._cond = asyncio.Condition()
+        self._start_lock = asyncio.Lock()
+        self._last_check = 0.0
+        self.memory: Optional[Dict[str, float]] = None
+
+    async def start(self):
+        if self.cdp_url:
+            try:
+                self.browser, self.context = await create_context(self.p, headless=True, net=self.net,
+                                                                  cdp_url=self.cdp_url)
+            except Exception as e:
+                if self.emit:
+                    self.emit({"type": "log", "msg": f"Browser server at {self.cdp_url} unavailable ({e!r}); "
+                                                     "launching Chromium"})
+                self.cdp_url = None
+        if not self.cdp_url:
+            self.browser, self.context = await create_context(self.p, headless=True, net=self.net)
+            self.browser_pid = await browser_pid(self.browser)
+        if self.assets:
+            await self.assets.attach(self.context)
+        self.pool = PagePool(self.context, self.pool_size, net=self.net)
+        self.generation += 1
+
+    async def ensure_started(self):
+        if self.pool is None:
+            async with self._start_lock:
+                if self.pool is None:
+                    await self.start()
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+        if self.context:
+            await self.context.close()
+        if self.browser:
+            await self.browser.close()
+        self.browser = self.context = self.pool = None
+        self.browser_pid = None
+
+    @asynccontextmanager
+    async def use(self):
+        """Hold the current browser for one unit of work (a results page, a listing)."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._recycling)
+            self._users += 1
+        try:
+            await self.ensure_started()
+            yield self
+        finally:
+            async with self._cond:
+                self._users -= 1
+                self._cond.notify_all()
+
+    def browser_memory(self) -> Optional[Dict[str, float]]:
+        """memory_stats() of this host's own Chromium; None without one (not launched, shared or unknown)."""
+        return memory_stats(root=self.browser_pid) if self.browser_pid else None
+
+    def check_memory(self, force: bool = False) -> Optional[Dict[str, float]]:
+        """browser_memory() at most every MEMORY_CHECK_SECS (or now), sent out as a 'memory' event."""
+        now = time.monotonic()
+        if force or now - self._last_check >= MEMORY_CHECK_SECS:
+            self._last_check = now
+            self.memory = self.browser_memory()
+            if self.memory and self.emit:
+                self.emit({"type": "memory", **self.memory, **self.stats()})
+        return self.memory
+
+    def _due(self) -> Optional[str]:
+        visits = self.pool.checkouts if self.pool else 0
+        if self.recycle_listings and visits >= self.recycle_listings:
+            return f"{visits} page visits"
+        mem = self.check_memory()
+        # no figure on a shared server: its RSS isn't ours to bring down, swapping our context wouldn't
+        if self.recycle_rss_mb and mem and mem["children_mb"] >= self.recycle_rss_mb:
+            return f"browser RSS {mem['children_mb']:.0f} MB"
+        return None
+
+    async def maybe_recycle(self, log: Callable[[str], None]) -> bool:
+        """Recycle if a trigger has fired (call between units of work, outside use())."""
+        if self.pool is None:
+            return False  # nothing launched yet
+        reason = self._due()
+        if not reason or self._recycling:
+            return False
+        async with self._cond:
+            if self._recycling:
+                return False
+            self._recycling = True
+            await self._cond.wait_for(lambda: self._users == 0)
+        try:
+            log(f"Recycling browser ({reason})")
+            before = self.browser_memory()
+            await self.close()
+            await self.start()
+            self.recycles += 1
+            after = self.check_memory(force=True)
+            if before and after:
+                log(f"Browser recycled: {before['children_mb']:.0f} MB -> {after['children_mb']:.0f} MB")
+        finally:
+            async with self._cond:
+                self._recycling = False
+                self._cond.notify_all()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"generation": self.generation, "recycles": self.recycles,
+                "visits": self.pool.checkouts if self.pool else 0}
+
+# Runs in the listing page: every field fetch_listing stores (bar the phone),
+# in the same shape extract_listing_fields builds with per-element selectors.
+LISTING_JS = """
+() => {
+  const q = sel => document.querySelector(sel);
+  const inner = el => el ? el.innerText.trim() : null;
+  const date = q('[data-testid="listing-date"]');
+  const rows = document.querySelectorAll(
+    'div.sc-eb45309b-0.iNzWBi, [data-testid="attributes"] div, [data-testid="attribute-row"]'
+  );
+  const attributes = [...rows].map(div => {
+    const label = div.querySelector('p.sc-82669b63-0.cqjWkX, p');
+    const values = [...div.querySelectorAll('p.sc-991ea11d-0.fgtvkm, p')].map(p => p.innerText.trim());
+    return { label: label ? label.innerText.trim() : '', values: values.slice(1) };
+  });
+  return {
+    date: date ? date.textContent.replace(/\\s+/g, ' ').trim() : null,
+    name: inner(q('h1')),
+    price: inner(q('p[data-testid="vip-price"]')),
+    location: inner(q('[data-testid="seller-profile"] [data-testid*="location"], .bEMmoW .iCgpsX button')),
+    seller: inner(q('h3 a, [data-testid="seller-profile"] h3 a')),
+    attributes,
+  };
+}
+"""
+
+async def extract_listing_fields(page) -> Dict[str, Any]:
+    """Selector-by-selector fallback for LISTING_JS (one CDP call per element)."""
+    fields: Dict[str, Any] = {"date": None, "name": None, "price": None,
+                              "location": None, "seller": None, "attributes": []}
+    tag = await page.query_selector('[data-testid="listing-date"]')
+    if tag:
+        raw = await tag.text_content()
+        if raw:
+            fields["date"] = " ".join(raw.split())
+    for key, sel in (
+        ("name", 'h1'),
+        ("price", 'p[data-testid="vip-price"]'),
+        ("location", '[data-testid="seller-profile"] [data-testid*="location"], .bEMmoW .iCgpsX button'),
+        ("seller", 'h3 a, [data-testid="seller-profile"] h3 a'),
+    ):
+        el = await page.query_selector(sel)
+        if el:
+            fields[key] = (await el.inner_text()).strip()
+
+    detail_divs = await page.query_selector_all(
+        'div.sc-eb45309b-0.iNzWBi, [data-testid="attributes"] div, [data-testid="attribute-row"]'
+    )
+    for div in detail_divs:
+        try:
+            label_tag = await div.query_selector('p.sc-82669b63-0.cqjWkX, p')
+            value_tags = await div.query_selector_all('p.sc-991ea11d-0.fgtvkm, p')
+            label = (await label_tag.inner_text()).strip() if label_tag else ''
+            values = [ (await v.inner_text()).strip() for v in value_tags ][1:] if value_tags else []
+            fields["attributes"].append({"label": label, "values": values})
+        except Exception:
+            continue
+    return fields
+
+def apply_listing_fields(data: Listing, fields: Dict[str, Any]):
+    """Copy LISTING_JS / extract_listing_fields output into a fetch_listing record."""
+    if fields.get("date"):
+        data.duration_posted = fields["date"]
+    if fields.get("name") is not None:
+        data.name = fields["name"]
+    if fields.get("price") is not None:
+        data.price = fields["price"]
+    if fields.get("location") is not None:
+        data.location = fields["location"]
+    if fields.get("seller") is not None:
+        data.seller = fields["seller"]
+
+    # Vehicle details (light)
+    for attr in fields.get("attributes") or []:
+        label, values = attr["label"], attr["values"]
+        if label == 'Seats':
+            data.seats = ', '.join(values)
+        elif label == 'Kilometres':
+            data.kilometres = ', '.join(values)
+        elif label == 'Body Style':
+            if values: data.body_style = values[0]
+            if len(values) > 1: data.doors = values[1]
+        elif label == 'Transmission':
+            data.transmission = ', '.join(values)
+        elif label == 'Model':
+            if values: data.model = values[0]
+            if len(values) > 1: data.extra_info = ', '.join(values[1:])
+        elif label == 'Fuel':
+            data.fuel = ', '.join(values)
+
+async def reveal_phone_on(page) -> str:
+    """Click "Reveal" on an already-loaded listing page; '-' if no phone shows up."""
+    # Phone: 3–6s pause then reveal
+    try:
+        await asyncio.sleep(random.uniform(3, 6))
+        reveal_btn = await page.query_selector('button:has-text("Reveal")') \
+                    or await page.query_selector("button:has(p[aria-label='Reveal phone number'])")
+        if reveal_btn:
+            try: await reveal_btn.scroll_into_view_if_needed()
+            except Exception: pass
+            await reveal_btn.click()
+            await page.wait_for_selector('a[href^="tel:"]', timeout=5000)
+
+        phone_a = await page.query_selector('a[href^="tel:"]')
+        if phone_a:
+            return (await phone_a.inner_text()).strip()
+        phone_p = await page.query_selector('p:has-text("+1-"), p:has-text("+1 ")')
+        if phone_p:
+            return (await phone_p.inner_text()).strip()
+    except Exception:
+        pass
+    return '-'
+
+async def reveal_phone(context, href, referer_url: str, log: Callable[[str], None],
+                       pool: Optional[PagePool] = None, rate: Optional[RateController] = None,
+                       metrics: Optional[StageMetrics] = None) -> str:
+    """Open the listing in the browser only to click "Reveal" (HTTP engine, phone pass)."""
+    page = await pool.acquire() if pool else await context.new_page()
+    ok = False
+    try:
+        await with_retries(
+            lambda: goto_tracked(page, href, rate, metrics, timeout=60_000, referer=referer_url),
+            attempts=3, base_delay=1.2, rate=rate, metrics=metrics,
+        )
+        phone = await timed_reveal(page, metrics)
+        ok = True
+        return phone
+    except PlaywrightTimeoutError:
+        log(f"Timeout while revealing phone on {href}")
+    except Exception as e:
+        log(f"Error revealing phone on {href}: {e}")
+    finally:
+        if pool:
+            await pool.release(page, failed=not ok)
+        else:
+            await page.close()
+    return '-'
+
+async def timed_reveal(page, metrics: Optional[StageMetrics] = None) -> str:
+    """reveal_phone_on, recorded as the "phone" stage (outcome "none" when no number shows)."""
+    t0 = time.perf_counter()
+    phone = await reveal_phone_on(page)
+    if metrics:
+        metrics.observe("phone", time.perf_counter() - t0, "ok" if phone != '-' else "none")
+    return phone
+
+async def fetch_listing(context, href, referer_url: str, log: Callable[[str], None],
+                        rate: Optional[RateController] = None, reveal: bool = True,
+                        pool: Optional[PagePool] = None, metrics: Optional[StageMetrics] = None) -> Listing:
+    """
+    One listing -> record (only href set if the visit fails). With `rate`, pacing is the caller's rate.slot() and
+    navigation outcomes feed the controller; without it, a short human pause. Stage timings go to `metrics`.
+    """
+    data = Listing(href)
+    page = await pool.acquire() if pool else await context.new_page()
+    ok = False
+    try:
+        if rate is None:
+            await human_pause(0.3, 1.0)
+
+        async def go():
+            return await goto_tracked(page, href, rate, metrics, timeout=60_000, referer=referer_url)
+        await with_retries(go, attempts=3, base_delay=1.2, rate=rate, metrics=metrics)
+
+        with timed(metrics, "extract"):
+            # All text fields in one round trip; per-selector path if the script fails
+            try:
+                fields = await page.evaluate(LISTING_JS)
+            except PlaywrightTimeoutError:
+                raise
+            except Exception as e:
+                log(f"Batched extraction failed on {href} ({e}); using selectors")
+                fields = None
+            if not fields:
+                fields = await extract_listing_fields(page)
+        apply_listing_fields(data, fields)
+
+        if reveal:
+            data.phone = await timed_reveal(page, metrics)
+        ok = True
+
+    except PlaywrightTimeoutError:
+        log(f"Timeout while loading {href}")
+    except Exception as e:
+        log(f"Error scraping {href}: {e}")
+    finally:
+        if pool:
+            await pool.release(page, failed=not ok)
+        else:
+            await page.close()
+    return data
+
+async def fetch_listing_http(http: HttpEngine, host: "BrowserHost", href, referer_url: str,
+                             log: Callable[[str], None], rate: Optional[RateController] = None, reveal: bool = True,
+                             metrics: Optional[StageMetrics] = None) -> Listing:
+    """
+    HTTP engine: parse the listing from its HTML, then use the browser only for
+    the phone reveal. Falls back to fetch_listing if the page doesn't parse.
+    The host's browser is only held (and launched) for those two cases.
+    """
+    data = Listing(href)
+    try:
+        if rate is None:
+            await human_pause(0.3, 1.0)
+        with timed(metrics, "http_listing"):
+            fields = await http.listing_fields(href, referer_url)
+        apply_listing_fields(data, fields)
+    except Exception as e:
+        log(f"HTTP fetch failed for {href}: {e}")
+    if not data.name:
+        log(f"No parsable listing data in {href}; using the browser")
+        async with host.use():
+            return await fetch_listing(host.context, href, referer_url, log, rate, reveal, host.pool, metrics)
+    if reveal:
+        async with host.use():
+            data.phone = await reveal_phone(host.context, href, referer_url, log, host.pool, rate, metrics)
+    return data
+
+async def collect_phones(context, hrefs: List[str], referer_url: str, log: Callable[[str], None],
+                         found: Dict[str, str], concurrency: int = PHONE_CONCURRENCY,
+                         pool: Optional[PagePool] = None, emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         metrics: Optional[StageMetrics] = None):
+    """
+    Phone pass: reveal numbers for hrefs with its own worker count and its
+    own, slower-starting rate controller. Results land in `found` as they
+    arrive so a cancelled pass still keeps what it got.
+    """
+    rate = RateController(concurrency, start_delay=PHONE_START_DELAY, min_delay=PHONE_MIN_DELAY, emit=emit)
+    todo: asyncio.Queue = asyncio.Queue()
+    for href in hrefs:
+        todo.put_nowait(href)
+
+    async def worker():
+        while True:
+            try:
+                href = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with rate.slot(href):
+                found[href] = await reveal_phone(context, href, referer_url, log, pool, rate, metrics)
+            if len(found) % 10 == 0:
+                log(f"Phone pass: {len(found)}/{len(hrefs)}")
+
+    await asyncio.gather(*(worker() for _ in range(min(max(1, concurrency), len(hrefs)))))
+
+async def run_until_stopped(coro, stop_event: threading.Event) -> bool:
+    """Run coro as a task, cancelling it if stop_event gets set. True if it finished on its own."""
+    task = asyncio.create_task(coro)
+
+    async def wait_for_stop():
+        while not stop_event.is_set():
+            await asyncio.sleep(STOP_POLL_SECS)
+
+    stopper = asyncio.create_task(wait_for_stop())
+    await asyncio.wait({task, stopper}, return_when=asyncio.FIRST_COMPLETED)
+    if task.done():
+        stopper.cancel()
+        task.result()  # re-raise errors
+        return True
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return False
+
+async def scrape_kijiji(url: str, max_pages: int, csv_name: str,
+                        log: Callable[[str], None],
+                        stop_event: threading.Event,
+                        out_q: queue.Queue,
+                        concurrency: int = DETAIL_CONCURRENCY,
+                        first_page: int = 1,
+                        seen_db: Optional[str] = None,
+                        seen_ttl: float = SEEN_TTL_SECS,
+                        incremental: bool = False,
+                        cards_csv: Optional[str] = None,
+                        engine: str = "browser",
+                        phones: str = "inline",
+                        phone_concurrency: int = PHONE_CONCURRENCY,
+                        block: Optional[List[str]] = None,
+                        allow: Optional[List[str]] = None,
+                        outputs: Sequence[str] = ("csv",),
+                        output_db: Optional[str] = None,
+                        resume: bool = False,
+                        recycle_listings: int = BROWSER_RECYCLE_LISTINGS,
+                        recycle_rss_mb: float = BROWSER_RSS_LIMIT_MB,
+                        cdp_url: Optional[str] = None,
+                        asset_cache: Optional[str] = None,
+                        raise_watermark: bool = True):
+    """
+    Runs inside a background thread (asyncio in that thread).
+    Buffers rows and flushes them every FLUSH_EVERY rows (and at end) to the
+    CSV at csv_name plus any extra `outputs` ("jsonl", "parquet", "sqlite")
+    beside it; the SQLite sink upserts into output_db instead when given.
+    Pipelined: a producer task walks results pages and pushes hrefs onto an
+    asyncio.Queue while `concurrency` consumer tasks fetch listings from it,
+    so results-page navigation overlaps with detail scraping. Rows are
+    buffered in completion order. Setting stop_event cancels both sides.
+    `url` is results page `first_page`; the walk covers max_pages pages from there.
+    With seen_db, listings scraped within seen_ttl seconds (per the on-disk
+    SeenIndex) are skipped before fetch_listing, and rows are recorded there
+    once a flush has written them.
+    incremental=True only queues listings newer than the search's high-water
+    mark (newest listing ID of the last completed run) and stops paginating at
+    the first results page with nothing new; the mark is raised only when the
+    walk and its listings finish, not on Stop or error. With
+    raise_watermark=False (shards) the mark is left alone and the done event
+    carries `newest` instead, for run_sharded to raise once every shard is done.
+    With cards_csv, every results card (opened or not) is appended there.
+    engine="http" walks results pages and parses listings from their HTML over
+    a pooled HTTP client; Chromium is then only used for phone reveals.
+    phones: "inline" reveals each number during the listing visit (3–6s
+    each); "deferred" writes rows without phones, then runs a separate,
+    slower-paced phone pass over the parsed listings and backfills the outputs;
+    "off" skips phones entirely.
+    block/allow extend and override the NetFilter request blocklist (domains,
+    URL wildcards or "type:<resource type>") for every browser page.
+    Every flush saves a checkpoint beside the CSV: where the results-page walk
+    continues, listings queued but not yet written, rows written so far and
+    pending phone reveals. resume=True picks up from it (pending listings first,
+    outputs appended); the checkpoint is removed once a run completes.
+    Per-stage timings and outcome counts (StageMetrics) go out as 'metrics'
+    events with every flush and at the end.
+    Chromium is relaunched (BrowserHost) after recycle_listings page visits or
+    once its processes pass recycle_rss_mb; 'memory' events report RSS.
+    cdp_url connects to a warm BrowserServer instead of launching Chromium:
+    the run gets a fresh context there and leaves the browser running.
+    asset_cache is a directory for an on-disk JS/CSS cache (AssetCache) shared
+    across runs; its hit/miss counters ride along in 'net' events.
+    'flush' events carry the batch's last PREVIEW_ROWS rows as CSV text.
+    Sends events to UI via out_q:
+    {'type': 'log'|'flush'|'pool'|'rate'|'net'|'metrics'|'memory'|'done'|'error', ...}
+    """
+    total_rows = 0
+    host: Optional[BrowserHost] = None
+    net = NetFilter(block, allow)
+    assets = AssetCache(asset_cache, net=net) if asset_cache else None
+    metrics = StageMetrics()
+    buffer: List[Listing] = []
+    sinks: List[Any] = []
+    phone_todo: List[str] = []
+    # href -> [page_no, idx, n_on_page] for listings queued or in flight, not yet buffered
+    pending: Dict[str, List[int]] = {}
+    ckpt_path = checkpoint_path(csv_name)
+    ckpt = load_checkpoint(ckpt_path) if resume else None
+
+    def save_progress():
+        save_checkpoint(ckpt_path, {
+            "search": search_key, "last_page": last_page,
+            "next_url": walk["next_url"], "next_page": walk["next_page"], "newest": walk["newest"],
+            "pending": [[*pos, href] for href, pos in pending.items()],
+            "rows_written": total_rows, "phone_todo": phone_todo,
+        })
+
+    def flush_rows(final=False):
+        nonlocal total_rows
+        if not buffer:
+            return
+        # one column-wise parse per flush; every sink gets the same frame
+        with metrics.stage("flush"):
+            frame = to_frame(buffer)
+            for sink in sinks:
+                sink.write(frame)
+        # only once written: a crash before this flush must not leave its listings skipped for the TTL
+        if db:
+            for listing in buffer:
+                if listing.ok:
+                    db.mark(listing.href)
+        total_rows += len(buffer)
+        buffer.clear()
+        save_progress()
+        # the app previews these instead of re-reading the outputs
+        preview = frame[CSV_COLUMNS].tail(PREVIEW_ROWS).astype("string").fillna("-").to_dict("records")
+        out_q.put({"type": "flush", "total": total_rows, "final": final, "rows": preview})
+        if host and host.pool:
+            out_q.put({"type": "pool", **host.pool.stats()})
+        out_q.put({"type": "net", **net.stats(), **(assets.stats() if assets else {})})
+        out_q.put({"type": "metrics", **metrics.snapshot(total_rows)})
+
+    db = SeenIndex(seen_db or SEEN_DB, seen_ttl) if (seen_db or incremental) else None
+    seen = db if seen_db else None
+    search_key = page_url(url, 1)
+    high_water = db.get_watermark(search_key) if incremental else 0
+    last_page = first_page + max_pages - 1
+    walk = {"newest": high_water, "next_url": url, "next_page": first_page}
+
+    try:
+        if resume and ckpt is None:
+            out_q.put({"type": "log", "msg": "No checkpoint to resume from — starting from the first page"})
+        if ckpt:
+            if ckpt["search"] != search_key:
+                raise ValueError(f"{ckpt_path} is for another search ({ckpt['search']})")
+            total_rows, last_page, phone_todo[:] = ckpt["rows_written"], ckpt["last_page"], ckpt["phone_todo"]
+            walk.update(next_url=ckpt["next_url"], next_page=ckpt["next_page"], newest=ckpt["newest"])
+            pending.update((href, pos) for *pos, href in ckpt["pending"])
+            out_q.put({"type": "log", "msg": (
+                f"Resuming: {total_rows} rows written, {len(pending)} listings pending, "
+                + (f"walk continues at page {walk['next_page']}" if walk["next_url"] else "walk finished"))})
+            out_q.put({"type": "flush", "total": total_rows, "final": False})
+        sinks = open_sinks(csv_name, outputs, category_of(url), output_db, append=ckpt is not None)
+        async with async_playwright() as p:
+            n_workers = max(1, int(concurrency))
+            # adaptive pacing: up to n_workers listings in flight, fewer while the site struggles
+            emit_rate = lambda snap: out_q.put({"type": "rate", **snap})
+            rate = RateController(n_workers, emit=emit_rate)
+            http = HttpEngine(UA, max_connections=n_workers + 1, rate=rate, metrics=metrics) if engine == "http" else None
+            # bounded so the producer only runs a page or two ahead of the workers
+            href_q: asyncio.Queue = asyncio.Queue(maxsize=HREF_QUEUE_MAX)
+            reveal_inline = phones == "inline"
+            # warm listing pages, one per worker (the phone pass reuses them)
+            host = BrowserHost(p, max(n_workers, phone_concurrency if phones == "deferred" else 0), net,
+                               recycle_listings, recycle_rss_mb, emit=out_q.put, cdp_url=cdp_url,
+                               assets=assets)
+
+            async def produce():
+                page, page_gen = None, 0
+                try:
+                    # listings a checkpointed run queued but never wrote go first
+                    for href, (page_no, idx, n_on_page) in list(pending.items()):
+                        await href_q.put((page_no, idx, n_on_page, href))
+                    current_page_url = walk["next_url"]
+                    page_count = walk["next_page"]
+
+                    while current_page_url and page_count <= last_page:
+                        out_q.put({"type": "log", "msg": f"Scraping Page {page_count}: {current_page_url}"})
+                        with metrics.stage("search_page"):
+                            # spaced like every request to the site, but not counted against the listing
+                            # workers' slots: a listing in flight (phone reveal included) must not stall the walk
+                            await rate.space(current_page_url)
+                            if http:
+                                srp = await http.search_page(current_page_url)
+                            else:
+                                # released before the hrefs are queued: a full queue must not hold up a recycle
+                                async with host.use():
+                                    if page_gen != host.generation:
+                                        # first page, or the browser was recycled under the walk
+                                        page, page_gen = await host.context.new_page(), host.generation
+                                        await net.attach(page)
+                                    await with_retries(
+                                        lambda: goto_tracked(page, current_page_url, rate, metrics, timeout=45_000),
+                                        attempts=2, rate=rate, metrics=metrics,
+                                    )
+                                    with metrics.stage("selector_wait"):
+                                        await page.wait_for_selector(
+                                            "[data-testid='srp-search-list'] section, .vAthl .vAthl div section",
+                                            timeout=30_000,
+                                        )
+                                    # one round trip for every card on the page (+ the next-page link)
+                                    with metrics.stage("extract"):
+                                        srp = await page.evaluate(SEARCH_PAGE_JS)
+                        cards = srp["cards"]
+                        out_q.put({"type": "log", "msg": f"Found {len(cards)} listings on this page"})
+
+                        if incremental and page_count == first_page:
+                            out_q.put({"type": "log", "msg": f"Incremental: only listings newer than ID {high_water}"})
+
+                        hrefs: List[str] = []
+                        for card in cards:
+                            href = card["href"]
+                            if href and href.startswith("/"):
+                                href = card["href"] = BASE_URL + href
+                            lid = listing_id(href) if href else None
+                            if lid:
+                                walk["newest"] = max(walk["newest"], int(lid))
+                            if href and is_recent(card["date"] or "-"):
+                                if incremental and lid and int(lid) <= high_water:
+                                    continue
+                                hrefs.append(href)
+
+                        if cards_csv:
+                            append_csv(cards_csv, [card_row(c, page_count) for c in cards if c["href"]], CARD_FIELDS)
+
+                        if seen:
+                            fresh = [h for h in hrefs if not seen.is_fresh(h)]
+                            if len(fresh) < len(hrefs):
+                                out_q.put({"type": "log", "msg": f"Skipping {len(hrefs) - len(fresh)} listings scraped recently"})
+                            hrefs = fresh
+
+                        if incremental and not hrefs:
+                            out_q.put({"type": "log", "msg": f"No new listings on page {page_count} — stopping (incremental)"})
+                            walk["next_url"] = None
+                            break
+
+                        # Pagination: recorded before this page's hrefs are queued, so a
+                        # checkpoint never sends a resume back to a page it has pending
+                        next_href = srp["next"] if page_count < last_page else None
+                        if next_href:
+                            if next_href.startswith("/"):
+                                next_href = BASE_URL + next_href
+                            m = re.search(r"/page-(\d+)/", next_href)
+                            if m and int(m.group(1)) > last_page:
+                                next_href = None
+                        walk["next_url"], walk["next_page"] = next_href, page_count + 1
+                        for idx, href in enumerate(hrefs, 1):
+                            pending[href] = [page_count, idx, len(hrefs)]
+
+                        for idx, href in enumerate(hrefs, 1):
+                            # blocks while the queue is full: backpressure from the workers
+                            await href_q.put((page_count, idx, len(hrefs), href))
+
+                        current_page_url, page_count = next_href, page_count + 1
+                finally:
+                    if page and page_gen == host.generation:
+                        await page.close()
+
+            async def consume():
+                while True:
+                    item = await href_q.get()
+                    if item is None:
+                        return
+                    page_no, idx, n_on_page, href = item
+                    out_q.put({"type": "log", "msg": f"  • Page {page_no} listing {idx}/{n_on_page}"})
+                    log_ = lambda m: out_q.put({"type":"log","msg":m})
+                    async with rate.slot(href):
+                        t0 = time.perf_counter()
+                        if http:
+                            listing = await fetch_listing_http(http, host, href, url, log_, rate, reveal_inline, metrics)
+                        else:
+                            async with host.use():
+                                listing = await fetch_listing(host.context, href, url, log_, rate, reveal_inline,
+                                                              host.pool, metrics)
+                        metrics.observe("listing", time.perf_counter() - t0, "ok" if listing.ok else "error")
+                    if phones == "deferred" and listing.ok:
+                        phone_todo.append(href)
+                    # single event loop: no lock needed around the buffer
+                    buffer.append(listing)
+                    pending.pop(href, None)
+                    if len(buffer) >= FLUSH_EVERY:
+                        flush_rows(final=False)
+                    await host.maybe_recycle(log_)
+
+            async def run_pipeline():
+                producer = asyncio.create_task(produce())
+                consumers = [asyncio.create_task(consume()) for _ in range(n_workers)]
+                try:
+                    await producer
+                    for _ in consumers:
+                        await href_q.put(None)
+                    await asyncio.gather(*consumers)
+                finally:
+                    # on error or cancellation, take both sides down before returning
+                    for t in (producer, *consumers):
+                        t.cancel()
+                    await asyncio.gather(producer, *consumers, return_exceptions=True)
+
+            crawled = await run_until_stopped(run_pipeline(), stop_event)
+            if crawled:
+                if incremental and raise_watermark and walk["newest"] > high_water:
+                    db.set_watermark(search_key, walk["newest"])
+            else:
+                out_q.put({"type": "log", "msg": "Stop requested — cancelled page walk and listing workers"})
+
+            # final flush
+            flush_rows(final=True)
+            save_progress()
+            for sink in sinks:
+                sink.close()
+
+            if phone_todo and not stop_event.is_set():
+                out_q.put({"type": "log", "msg": f"Phone pass: revealing {len(phone_todo)} numbers"})
+                found: Dict[str, str] = {}
+                log_ = lambda m: out_q.put({"type":"log","msg":m})
+                # the pass runs in one browser: start it in a fresh one if a trigger is due
+                await host.maybe_recycle(log_)
+                await host.ensure_started()
+                await run_until_stopped(
+                    collect_phones(host.context, phone_todo, url, log_,
+                                   found, phone_concurrency, host.pool, emit_rate, metrics),
+                    stop_event,
+                )
+                for sink in sinks:
+                    n = sink.backfill_phones(found)
+                    out_q.put({"type": "log", "msg": f"Phone pass: backfilled {n} of {len(found)} revealed in {sink.path}"})
+                phone_todo[:] = [h for h in phone_todo if h not in found]
+            if crawled and not phone_todo:
+                clear_checkpoint(ckpt_path)
+            else:
+                save_progress()
+                out_q.put({"type": "log", "msg": f"Checkpoint saved to {ckpt_path} — Resume to continue"})
+            out_q.put({"type": "rate", **rate.snapshot()})
+            out_q.put({"type": "metrics", **metrics.snapshot(total_rows)})
+            if host.pool:
+                st_ = host.pool.stats()
+                out_q.put({"type": "pool", **st_})
+                out_q.put({"type": "log", "msg": (
+                    f"Page pool: {st_['checkouts']} checkouts, {st_['recycles']} recycles, "
+                    f"avg wait {st_['avg_wait_ms']:.0f} ms")})
+            ns = {**net.stats(), **(assets.stats() if assets else {})}
+            out_q.put({"type": "net", **ns})
+            if ns["pages"]:
+                out_q.put({"type": "log", "msg": (
+                    f"Network: {ns['blocked']} requests blocked, {ns['loaded']} loaded, "
+                    f"{ns['bytes'] / 1e6:.1f} MB")})
+            if assets:
+                out_q.put({"type": "log", "msg": (
+                    f"Asset cache: {ns['cache_hits']} hits, {ns['cache_revalidated']} revalidated, "
+                    f"{ns['cache_misses']} misses, {ns['cache_bytes_saved'] / 1e6:.1f} MB not downloaded")})
+            host.check_memory(force=True)
+            if host.recycles:
+                out_q.put({"type": "log", "msg": f"Browser recycled {host.recycles} times"})
+            if http:
+                await http.aclose()
+            await host.close()
+
+        done = {"type": "done", "total": total_rows}
+        if incremental and not raise_watermark and crawled:
+            done["newest"] = walk["newest"]
+        out_q.put(done)
+
+    except Exception:
+        out_q.put({"type": "error", "trace": traceback.format_exc()})
+    finally:
+        for sink in sinks:
+            sink.close()
+        if db:
+            db.close()
@@ -0,0 +1,67 @@
+"""
+On-disk index of listings already scraped, keyed by the numeric listing ID
+at the end of each href, so repeat runs skip detail pages fetched recently.
+Also holds per-search high-water marks for incremental crawls.
+"""
+import re, sqlite3, time
+from typing import Optional
+from urllib.parse import urlsplit
+
+SEEN_DB = "kijiji_seen.sqlite"
+SEEN_TTL_SECS = 6 * 3600   # re-scrape a listing once its entry is older than this
+
+def listing_id(href: str) -> Optional[str]:
+    """'/v-cars-trucks/calgary/2015-honda-civic/1712345678' -> '1712345678'"""
+    m = re.search(r"/(\d{5,})/?$", urlsplit(href).path)
+    return m.group(1) if m else None
+
+class SeenIndex:
+    """
+    SQLite table of listing_id -> last scrape time. WAL mode so shard
+    processes can share one file; each process opens its own connection.
+    """
+    def __init__(self, path: str = SEEN_DB, ttl: float = SEEN_TTL_SECS):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " listing_id TEXT PRIMARY KEY, href TEXT NOT NULL, scraped_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermark ("
+            " search_key TEXT PRIMARY KEY, listing_id INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def is_fresh(self, href: str) -> bool:
+        """True if this listing was scraped less than ttl seconds ago."""
+        lid = listing_id(href)
+        if not lid:
+            return False
+        row = self.conn.execute("SELECT scraped_at FROM seen WHERE listing_id = ?", (lid,)).fetchone()
+        return bool(row) and (time.time() - row[0]) < self.ttl
+
+    def mark(self, href: str):
+        lid = listing_id(href)
+        if lid:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO seen (listing_id, href, scraped_at) VALUES (?, ?, ?)",
+                (lid, href, time.time()),
+            )
+
+    def get_watermark(self, search_key: str) -> int:
+        """Newest listing ID recorded for this search by a previous completed run (0 if none)."""
+        row = self.conn.execute("SELECT listing_id FROM watermark WHERE search_key = ?", (search_key,)).fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, search_key: str, newest_id: int):
+        """Raise the mark; concurrent shards of one search only ever move it forward."""
+        self.conn.execute(
+            "INSERT INTO watermark (search_key, listing_id, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(search_key) DO UPDATE SET"
+            " listing_id = MAX(listing_id, excluded.listing_id), updated_at = excluded.updated_at",
+            (search_key, newest_id, time.time()),
+        )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,233 @@
+"""
+Sharded crawl: categories and /page-N/ ranges spread across worker processes,
+each with its own browser and CSV part file, merged at the end.
+"""
+import asyncio, csv, traceback, threading, queue, os, shutil, sys, types
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any
+
+from .checkpoint import checkpoint_path
+from .metrics import merge_snapshots
+from .scraper import STOP_POLL_SECS, page_url, scrape_kijiji
+from .seen import SEEN_DB, SeenIndex
+from .sinks import merge_parts, output_path
+
+SHARD_PAGES = 10           # results pages per shard in sharded mode
+MAX_SHARD_WORKERS = os.cpu_count() or 1
+_main_lock = threading.Lock()
+
+def plan_shards(category_urls: Dict[str, str], max_pages: int, pages_per_shard: int = SHARD_PAGES) -> List[Dict[str, Any]]:
+    """Split each category's 1..max_pages into /page-N/ ranges of pages_per_shard."""
+    shards = []
+    for label, url in category_urls.items():
+        for first in range(1, max_pages + 1, pages_per_shard):
+            pages = min(pages_per_shard, max_pages - first + 1)
+            shards.append({"label": label, "url": url, "first_page": first, "pages": pages})
+    return shards
+
+class _ShardQueue:
+    """Tags every event a shard emits with the shard's index before forwarding it."""
+    def __init__(self, q, idx: int):
+        self.q, self.idx = q, idx
+
+    def put(self, evt: Dict[str, Any]):
+        self.q.put({**evt, "shard": self.idx})
+
+def run_shard(idx: int, shard: Dict[str, Any], part_csv: str, stop_event, events_q, crawl_opts: Dict[str, Any]):
+    """Process-pool entry point: one shard, its own browser and its own part file."""
+    out_q = _ShardQueue(events_q, idx)
+    asyncio.run(
+        scrape_kijiji(
+            page_url(shard["url"], shard["first_page"]), shard["pages"], part_csv,
+            lambda m: out_q.put({"type": "log", "msg": m}),
+            stop_event, out_q,
+            first_page=shard["first_page"], raise_watermark=False, **crawl_opts,
+        )
+    )
+
+def shard_context():
+    """
+    Start method for shard workers: forkserver where the platform has it,
+    else spawn. Never fork: run_sharded is called from app and job threads,
+    and a forked child inherits their held locks, event loops and Playwright
+    pipes. Workers only need run_shard, which imports from this module.
+    """
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        # the fork server imports the crawler once; each worker then starts with it loaded
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return mp.get_context("spawn")
+
+@contextmanager
+def _workers_skip_main():
+    """
+    Hide the parent's __main__ from processes started inside the block.
+    spawn and forkserver children re-run the parent's main script before
+    anything else, and under `streamlit run` that is app.py: the whole UI,
+    job table and warm browser, once per worker. run_shard needs none of it.
+    """
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+def merge_csv_parts(part_paths: List[str], csv_name: str) -> int:
+    """Concatenate part files into csv_name (header once); returns data rows written."""
+    total = 0
+    with open(csv_name, "w", newline="", encoding="utf-8") as out:
+        header_written = False
+        for path in part_paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                header = f.readline()
+                if not header:
+                    continue
+                if not header_written:
+                    out.write(header)
+                    header_written = True
+                total += sum(1 for _ in csv.reader(f))
+                f.seek(0)
+                f.readline()
+                shutil.copyfileobj(f, out)
+    return total
+
+def raise_watermarks(shards: List[Dict[str, Any]], newest: Dict[int, int], seen_db: str, out_q: queue.Queue):
+    """Raise each search's mark to the newest ID its shards saw, if every shard finished its walk."""
+    unfinished = len(shards) - len(newest)
+    if unfinished:
+        out_q.put({"type": "log", "msg": f"Incremental: {unfinished} shards did not finish — high-water marks unchanged"})
+        return
+    marks: Dict[str, int] = {}
+    for i, sh in enumerate(shards):
+        key = page_url(sh["url"], 1)
+        marks[key] = max(marks.get(key, 0), newest[i])
+    db = SeenIndex(seen_db)
+    try:
+        for key, mark in marks.items():
+            db.set_watermark(key, mark)
+    finally:
+        db.close()
+
+def run_sharded(shards: List[Dict[str, Any]], csv_name: str, workers: int,
+                stop_event: threading.Event, out_q: queue.Queue,
+                **crawl_opts):
+    """
+    Runs shards across a ProcessPoolExecutor; each worker launches its own
+    Chromium via create_context and writes <csv stem>.partNNN.csv. Worker
+    events are relayed to out_q (flush totals and metrics summed across
+    shards) and the parts are merged into csv_name at the end, including
+    after a Stop. The done event carries failed_shards, the number of shards
+    that errored. An incremental run raises each search's high-water mark
+    here, once every shard has finished its walk: a shard that failed or was
+    stopped would otherwise lose its listings to a mark raised by the others.
+    crawl_opts (concurrency, seen_db, ...) are passed through to scrape_kijiji,
+    bar cdp_url: shards run side by side, so sharing one warm browser would
+    put them all on a single Chromium.
+    """
+    ctx = shard_context()
+    stem, _ = os.path.splitext(csv_name)
+    part_paths = [f"{stem}.part{i:03d}.csv" for i in range(len(shards))]
+    # card sidecar files get the same part/merge treatment as the main CSV
+    cards_csv = crawl_opts.pop("cards_csv", None)
+    if crawl_opts.pop("cdp_url", None):
+        out_q.put({"type": "log", "msg": "Sharded run: each worker launches its own Chromium, not the browser server"})
+    cards_stem = os.path.splitext(cards_csv)[0] if cards_csv else None
+    card_parts = [f"{cards_stem}.part{i:03d}.csv" for i in range(len(shards))] if cards_csv else []
+    # extra outputs (jsonl/parquet) sit beside each part CSV and are merged per format;
+    # SQLite is WAL-shared, so every shard upserts straight into the final file
+    extra_formats = [f for f in crawl_opts.get("outputs", ()) if f not in ("csv", "sqlite")]
+    if "sqlite" in crawl_opts.get("outputs", ()):
+        crawl_opts.setdefault("output_db", output_path(csv_name, "sqlite"))
+    extra_parts = {f: [output_path(p, f) for p in part_paths] for f in extra_formats}
+    all_parts = part_paths + card_parts + [p for paths in extra_parts.values() for p in paths]
+    # shards are not resumable on their own: their checkpoints go with the parts
+    all_parts += [checkpoint_path(p) for p in part_paths]
+    for path in all_parts:
+        if os.path.exists(path):
+            os.remove(path)
+    totals: Dict[int, int] = {}
+    failed = set()
+    newest: Dict[int, int] = {}   # shard -> newest listing ID, from shards whose walk finished
+    shard_metrics: Dict[int, Dict[str, Any]] = {}
+
+    def relay(evt):
+        i = evt.get("shard")
+        sh = shards[i]
+        tag = f"[{sh['label']} p{sh['first_page']}-{sh['first_page'] + sh['pages'] - 1}]"
+        et = evt.get("type")
+        if et == "log":
+            out_q.put({"type": "log", "msg": f"{tag} {evt['msg']}"})
+        elif et == "flush":
+            totals[i] = evt["total"]
+            out_q.put({"type": "flush", "total": sum(totals.values()), "final": False, "rows": evt.get("rows", [])})
+        elif et == "metrics":
+            shard_metrics[i] = evt
+            out_q.put({"type": "metrics", **merge_snapshots(shard_metrics.values())})
+        elif et == "done":
+            totals[i] = evt["total"]
+            if "newest" in evt:
+                newest[i] = evt["newest"]
+            out_q.put({"type": "log", "msg": f"{tag} shard finished ({evt['total']} rows)"})
+        elif et == "error":
+            failed.add(i)
+            out_q.put({"type": "log", "msg": f"{tag} shard failed:\n{evt['trace']}"})
+
+    try:
+        with _workers_skip_main():
+            manager = ctx.Manager()
+        with manager:
+            events_q = manager.Queue()
+            shard_stop = manager.Event()
+            with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx) as pool:
+                out_q.put({"type": "log", "msg": f"Sharded run: {len(shards)} shards on {workers} worker processes"})
+                # the pool starts its workers as shards are submitted
+                with _workers_skip_main():
+                    futures = [
+                        pool.submit(run_shard, i, sh, part_paths[i], shard_stop, events_q,
+                                    {**crawl_opts, "cards_csv": card_parts[i] if cards_csv else None})
+                        for i, sh in enumerate(shards)
+                    ]
+                while True:
+                    if stop_event.is_set() and not shard_stop.is_set():
+                        shard_stop.set()
+                        for fut in futures:
+                            fut.cancel()  # shards not started yet
+                        out_q.put({"type": "log", "msg": "Stop requested — stopping shards"})
+                    try:
+                        relay(events_q.get(timeout=STOP_POLL_SECS))
+                        continue
+                    except queue.Empty:
+                        pass
+                    if all(f.done() for f in futures):
+                        break
+                for fut in futures:
+                    if not fut.cancelled() and fut.exception() is not None:
+                        failed.add(futures.index(fut))
+                        out_q.put({"type": "log", "msg": f"Shard worker crashed: {fut.exception()!r}"})
+            while True:
+                try:
+                    relay(events_q.get_nowait())
+                except queue.Empty:
+                    break
+
+        total = merge_csv_parts(part_paths, csv_name)
+        if cards_csv:
+            merge_csv_parts(card_parts, cards_csv)
+        for fmt, paths in extra_parts.items():
+            merge_parts(paths, output_path(csv_name, fmt))
+        for path in all_parts:
+            if os.path.exists(path):
+                os.remove(path)
+        if crawl_opts.get("incremental"):
+            raise_watermarks(shards, newest, crawl_opts.get("seen_db") or SEEN_DB, out_q)
+        out_q.put({"type": "flush", "total": total, "final": True})
+        out_q.put({"type": "done", "total": total, "failed_shards": len(failed)})
+    except Exception:
+        out_q.put({"type": "error", "trace": traceback.format_exc()})
@@ -0,0 +1,346 @@
+"""
+Output sinks behind the flush step. Each flush hands every sink the same
+DataFrame from record.to_frame (text columns plus typed Price Cents, Km
+and Posted At). CSV and JSONL keep their file open for the whole run;
+Parquet closes a file per flush and assembles them on close. CSV
+writes the text columns, Excel-safe; JSONL and Parquet write everything,
+typed, so downstream jobs don't re-parse strings.
+"""
+import csv, glob, json, os, shutil, sqlite3, time
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+from .record import CATEGORICAL_COLUMNS, CSV_COLUMNS
+from .seen import listing_id
+
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet", "sqlite")
+
+def safe_for_excel(value):
+    if isinstance(value, str):
+        v = value.strip()
+        if v and (v.startswith("-") or v.startswith("+")):
+            return " " + v
+        return v
+    return value
+
+def excel_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """safe_for_excel on every value except the '-' missing sentinel."""
+    return {k: v if v == "-" else safe_for_excel(v) for k, v in row.items()}
+
+def excel_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """The CSV columns as text, '-' where missing, the rest column-wise safe_for_excel."""
+    text = frame[CSV_COLUMNS].astype("string").apply(lambda col: col.str.strip()).fillna("-")
+    risky = text.apply(lambda col: col.str.match(r"[+-]") & (col != "-"))
+    return text.mask(risky, " " + text)
+
+def output_path(csv_name: str, fmt: str) -> str:
+    """'kijiji_cars.csv', 'parquet' -> 'kijiji_cars.parquet'"""
+    return os.path.splitext(csv_name)[0] + "." + fmt
+
+# =========================
+# Sinks
+# =========================
+class CsvSink:
+    """CSV_COLUMNS as text, Excel-safe values (leading +/- padded)."""
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.append = append
+        self._f = None
+
+    def write(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        header = False
+        if self._f is None:
+            header = not (self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0)
+            self._f = open(self.path, "w" if header else "a", newline="", encoding="utf-8")
+        excel_frame(frame).to_csv(self._f, header=header, index=False, lineterminator="\r\n")
+        self._f.flush()  # the UI offers the partial file for download
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+    def backfill_phones(self, phones: Dict[str, str]) -> int:
+        return backfill_phones(self.path, phones)
+
+class JsonlSink:
+    """One typed JSON object per line (missing fields null, Posted At ISO 8601)."""
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.append = append
+        self._f = None
+
+    def write(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        if self._f is None:
+            self._f = open(self.path, "a" if self.append else "w", encoding="utf-8")
+        self._f.write(frame.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).rstrip("\n") + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+    def backfill_phones(self, phones: Dict[str, str]) -> int:
+        if not phones or not os.path.exists(self.path):
+            return 0
+        updated = 0
+        tmp = self.path + ".tmp"
+        with open(self.path, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for line in src:
+                obj = json.loads(line)
+                phone = phones.get(obj.get("Listing Link"))
+                if phone and phone != "-" and not obj.get("Phone"):
+                    obj["Phone"] = phone
+                    updated += 1
+                dst.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        return updated
+
+class ParquetSink:
+    """
+    Streaming Parquet, schema fixed by the first batch (text as strings,
+    Price Cents/Km int64, Posted At timestamp, Body Style/Fuel
+    dictionary-encoded). A Parquet file is only readable once closed, so
+    each flush goes to its own closed file beside the output
+    (<path>.flushNNNNN); close() streams the output's earlier rows (when
+    appending) and every flush file into <path>, one row group per flush,
+    and removes them. A crash thus loses no written flush: the resumed run
+    (append=True) finds the flush files and assembles them with its own.
+    """
+    def __init__(self, path: str, append: bool = False):
+        if pa is None:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.append = append
+        self._schema = None
+        if not append:
+            # left by another run that never closed
+            for old in self._flush_paths():
+                os.remove(old)
+
+    def _flush_paths(self) -> List[str]:
+        return sorted(glob.glob(glob.escape(self.path) + ".flush[0-9]*[0-9]"))
+
+    def write(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        if self._schema is None:
+            schema = pa.Schema.from_pandas(frame, preserve_index=False)
+            for col in CATEGORICAL_COLUMNS:
+                # fixed index width so every row group shares the schema
+                i = schema.get_field_index(col)
+                schema = schema.set(i, pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+            self._schema = schema.remove_metadata()
+        flushes = self._flush_paths()
+        n = int(flushes[-1].rsplit(".flush", 1)[1]) + 1 if flushes else 1
+        path = f"{self.path}.flush{n:05d}"
+        pq.write_table(pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False), path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        flushes = self._flush_paths()
+        if not flushes:
+            return
+        # an earlier output that doesn't read fails the close rather than being left out
+        sources = ([self.path] if self.append and os.path.exists(self.path) else []) + flushes
+        schema = self._schema or pq.read_schema(flushes[0]).remove_metadata()
+        tmp = self.path + ".tmp"
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for src in sources:
+                f = pq.ParquetFile(src)
+                for i in range(f.num_row_groups):
+                    writer.write_table(f.read_row_group(i).cast(schema))
+        os.replace(tmp, self.path)
+        for path in flushes:
+            os.remove(path)
+        self.append = True  # a later write adds to what is now in the file
+
+    def backfill_phones(self, phones: Dict[str, str]) -> int:
+        if not phones or not os.path.exists(self.path):
+            return 0
+        table = pq.read_table(self.path)
+        links, current = table.column("Listing Link").to_pylist(), table.column("Phone").to_pylist()
+        updated, merged = 0, []
+        for link, phone in zip(links, current):
+            new = phones.get(link)
+            if new and new != "-" and not phone:
+                phone = new
+                updated += 1
+            merged.append(phone)
+        i = table.schema.get_field_index("Phone")
+        table = table.set_column(i, table.schema.field(i), pa.array(merged, table.schema.field(i).type))
+        pq.write_table(table, self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        return updated
+
+# CSV column -> listings column (Price/Kilometres also get typed columns)
+SQLITE_COLUMNS = {
+    'Listing Link': "href", 'Name': "name", 'Price': "price_text", 'Duration Posted': "duration_posted",
+    'Location': "location", 'Seller Name': "seller", 'Phone': "phone", 'Seats': "seats",
+    'Kilometres': "kilometres_text", 'Body Style': "body_style", 'Doors': "doors",
+    'Transmission': "transmission", 'Model': "model", 'Extra Info': "extra_info", 'Fuel': "fuel",
+}
+
+class SqliteSink:
+    """
+    Listings upserted by listing ID into a WAL-mode SQLite file, one
+    transaction per flush. A listing whose price or kilometres differ
+    from the stored values gets a price_history row (old -> new). Fields
+    a later visit failed to read keep their stored values. Shard
+    processes share one file, like SeenIndex.
+    """
+    def __init__(self, path: str, category: Optional[str] = None):
+        self.path = path
+        self.category = category
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        text_cols = "".join(f", {c} TEXT" for c in SQLITE_COLUMNS.values() if c != "href")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            " listing_id TEXT PRIMARY KEY, href TEXT NOT NULL, category TEXT,"
+            " price REAL, kilometres INTEGER, posted_at REAL" + text_cols + ","
+            " first_seen REAL NOT NULL, last_seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS price_history ("
+            " listing_id TEXT NOT NULL, changed_at REAL NOT NULL,"
+            " old_price REAL, new_price REAL, old_kilometres INTEGER, new_kilometres INTEGER);"
+            "CREATE INDEX IF NOT EXISTS idx_listings_category ON listings (category);"
+            "CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price);"
+            "CREATE INDEX IF NOT EXISTS idx_listings_posted_at ON listings (posted_at);"
+            "CREATE INDEX IF NOT EXISTS idx_listings_last_seen ON listings (last_seen);"
+            "CREATE INDEX IF NOT EXISTS idx_price_history_listing ON price_history (listing_id, changed_at);"
+        )
+        cols = ["listing_id", "category", "price", "kilometres", "posted_at", *SQLITE_COLUMNS.values(),
+                "first_seen", "last_seen"]
+        keep = {"listing_id", "first_seen"}
+        self._upsert = (
+            f"INSERT INTO listings ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+            " ON CONFLICT(listing_id) DO UPDATE SET "
+            + ", ".join(f"{c} = COALESCE(excluded.{c}, {c})" for c in cols if c not in keep)
+        )
+
+    def write(self, frame: pd.DataFrame):
+        now = time.time()
+        records = []
+        cols = frame[list(SQLITE_COLUMNS)].astype(object)
+        price = (frame["Price Cents"] / 100).astype(object)
+        posted = frame["Posted At"].map(lambda ts: ts.timestamp(), na_action="ignore").astype(object)
+        for i, row in enumerate(cols.where(cols.notna(), None).itertuples(index=False, name=None)):
+            lid = listing_id(row[0] or "")
+            if not lid:
+                continue
+            km, p, ts = frame["Km"].iat[i], price.iat[i], posted.iat[i]
+            records.append((lid, self.category, None if pd.isna(p) else p, None if pd.isna(km) else int(km),
+                            None if pd.isna(ts) else ts, *row, now, now))
+        if not records:
+            return
+        ids = [r[0] for r in records]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = {lid: (old_price, old_km) for lid, old_price, old_km in self.conn.execute(
+                f"SELECT listing_id, price, kilometres FROM listings WHERE listing_id IN ({', '.join('?' * len(ids))})",
+                ids)}
+            changes = []
+            for r in records:
+                old = stored.get(r[0])
+                if old is None:
+                    continue
+                new_price = r[2] if r[2] is not None else old[0]
+                new_km = r[3] if r[3] is not None else old[1]
+                if (new_price, new_km) != old:
+                    changes.append((r[0], now, old[0], new_price, old[1], new_km))
+            self.conn.executemany("INSERT INTO price_history VALUES (?, ?, ?, ?, ?, ?)", changes)
+            self.conn.executemany(self._upsert, records)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def backfill_phones(self, phones: Dict[str, str]) -> int:
+        conn = sqlite3.connect(self.path, timeout=30)
+        with conn:
+            updated = sum(
+                conn.execute("UPDATE listings SET phone = ? WHERE listing_id = ? AND phone IS NULL",
+                             (phone, listing_id(href))).rowcount
+                for href, phone in phones.items() if phone and phone != "-" and listing_id(href)
+            )
+        conn.close()
+        return updated
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink, "sqlite": SqliteSink}
+
+def open_sinks(csv_name: str, formats: Iterable[str] = ("csv",), category: Optional[str] = None,
+               db_path: Optional[str] = None, append: bool = False) -> List[Any]:
+    """
+    CSV at csv_name (always), plus one sink per extra format next to it.
+    The SQLite sink writes to db_path when given (shards share one file).
+    append=True adds to existing files instead of replacing them (resume);
+    SQLite always upserts.
+    """
+    sinks: List[Any] = [CsvSink(csv_name, append)]
+    for fmt in dict.fromkeys(formats):
+        if fmt == "sqlite":
+            sinks.append(SqliteSink(db_path or output_path(csv_name, fmt), category))
+        elif fmt != "csv":
+            sinks.append(SINKS[fmt](output_path(csv_name, fmt), append))
+    return sinks
+
+# =========================
+# Post-run file helpers
+# =========================
+def backfill_phones(csv_name: str, phones: Dict[str, str]) -> int:
+    """Rewrite csv_name with Phone filled in from {Listing Link: phone}; returns rows updated."""
+    if not phones or not os.path.exists(csv_name):
+        return 0
+    with open(csv_name, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        rows = list(reader)
+    updated = 0
+    for row in rows:
+        phone = phones.get(row.get('Listing Link'))
+        if phone and phone != '-' and row.get('Phone') in (None, '', '-'):
+            row['Phone'] = safe_for_excel(phone)
+            updated += 1
+    tmp = csv_name + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=header)
+        w.writeheader()
+        w.writerows(rows)
+    os.replace(tmp, csv_name)
+    return updated
+
+def merge_parts(part_paths: List[str], out_path: str) -> int:
+    """Concatenate JSONL or Parquet part files into out_path; returns rows written."""
+    parts = [p for p in part_paths if os.path.exists(p)]
+    if out_path.endswith(".parquet"):
+        tables = [pq.read_table(p) for p in parts]
+        if not tables:
+            return 0
+        pq.write_table(pa.concat_tables(tables, promote_options="default"), out_path)
+        return sum(t.num_rows for t in tables)
+    total = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for p in parts:
+            with open(p, encoding="utf-8") as f:
+                total += sum(1 for _ in f)
+                f.seek(0)
+                shutil.copyfileobj(f, out)
+    return total
@@ -0,0 +1,141 @@
+"""
+An in-process stand-in for Playwright (and the HTTP engine) so scrape_kijiji
+runs end to end without Chromium or the network. FakeSite serves
+`pages` results pages of `per_page` listings and logs every navigation with
+its start/end time; listing visits take `listing_secs`.
+"""
+import asyncio, csv, os, queue, re, threading, time
+
+from kijiji_scraper import scraper
+
+class FakeSite:
+    def __init__(self, pages=3, per_page=4, listing_secs=0.0, search_secs=0.0):
+        self.pages, self.per_page = pages, per_page
+        self.listing_secs, self.search_secs = listing_secs, search_secs
+        self.launches = 0
+        self.visits = []  # (kind, url, started, finished)
+
+    def page_no(self, url):
+        m = re.search(r"/page-(\d+)/", url)
+        return int(m.group(1)) if m else 1
+
+    def search(self, url):
+        n = self.page_no(url)
+        cards = [{"href": f"/v-cars-trucks/x/car-{n}-{i}/17{n:04d}{i:04d}", "date": "2 hrs ago",
+                  "title": f"Car {n}-{i}", "price": "$1,000", "location": "Ottawa"} for i in range(self.per_page)]
+        return {"cards": cards, "next": scraper.page_url(url, n + 1) if n < self.pages else None}
+
+    def listing(self, url):
+        return {"date": "2 hrs ago", "name": "Car " + url.rsplit("/", 1)[1], "price": "$1,000",
+                "location": "Ottawa", "seller": "Owner", "attributes": [{"label": "Kilometres", "values": ["1,000 km"]}]}
+
+    async def visit(self, url):
+        t0 = time.monotonic()
+        kind = "search" if "/b-" in url else "listing" if "/v-" in url else "other"
+        await asyncio.sleep({"search": self.search_secs, "listing": self.listing_secs}.get(kind, 0))
+        self.visits.append((kind, url, t0, time.monotonic()))
+
+class Response:
+    status = 200
+
+class Page:
+    def __init__(self, context):
+        self.context, self.url = context, "about:blank"
+
+    async def goto(self, url, **kwargs):
+        self.url = url
+        await self.context.site.visit(url)
+        return Response()
+
+    async def wait_for_selector(self, *args, **kwargs):
+        return None
+
+    async def evaluate(self, js, *args):
+        if js == scraper.SEARCH_PAGE_JS:
+            return self.context.site.search(self.url)
+        return self.context.site.listing(self.url)
+
+    async def query_selector(self, sel):
+        return None
+
+    async def close(self):
+        pass
+
+class CDPSession:
+    def on(self, event, handler):
+        pass
+
+    async def send(self, method, params=None):
+        return {}
+
+class Context:
+    def __init__(self, site):
+        self.site = site
+
+    async def new_page(self):
+        return Page(self)
+
+    async def new_cdp_session(self, page):
+        return CDPSession()
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def close(self):
+        pass
+
+class Browser:
+    async def close(self):
+        pass
+
+class Playwright:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+class HttpEngine:
+    """scraper.HttpEngine over the same FakeSite."""
+    def __init__(self, site):
+        self.site = site
+
+    async def search_page(self, url):
+        await self.site.visit(url)
+        return self.site.search(url)
+
+    async def listing_fields(self, href, referer):
+        await self.site.visit(href)
+        return self.site.listing(href)
+
+    async def aclose(self):
+        pass
+
+def install(monkeypatch, site):
+    """Point scraper at `site`: no Chromium, no network, no politeness delays."""
+    async def create_context(p, **kwargs):
+        site.launches += 1
+        return Browser(), Context(site)
+
+    rate_controller = scraper.RateController
+    monkeypatch.setattr(scraper, "async_playwright", lambda: Playwright())
+    monkeypatch.setattr(scraper, "create_context", create_context)
+    monkeypatch.setattr(scraper, "HttpEngine", lambda *args, **kwargs: HttpEngine(site))
+    monkeypatch.setattr(scraper, "RateController",
+                        lambda n, **kw: rate_controller(n, **{**kw, "start_delay": 0.0, "min_delay": 0.0}))
+
+def crawl(csv_path, max_pages=3, timeout=30, stop_event=None, **opts):
+    """Run scrape_kijiji to the end (or until stop_event); returns (events, CSV rows; none if no CSV was written)."""
+    out_q: queue.Queue = queue.Queue()
+    run = scraper.scrape_kijiji(scraper.DEFAULT_URL, max_pages, str(csv_path), lambda m: None,
+                                stop_event or threading.Event(), out_q, **opts)
+    asyncio.run(asyncio.wait_for(run, timeout))
+    events = []
+    while not out_q.empty():
+        events.append(out_q.get())
+    errors = [e["trace"] for e in events if e["type"] == "error"]
+    assert not errors, errors[0]
+    if not os.path.exists(csv_path):
+        return events, []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return events, list(csv.DictReader(f))
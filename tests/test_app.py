@@ -0,0 +1,176 @@
+import os, sys, threading, time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import kijiji_scraper
+from kijiji_scraper import jobs
+from kijiji_scraper.scraper import PREVIEW_ROWS
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+class FakeCrawls:
+    """run_crawl for the app's JobManager: writes `csv_text`, sends `events`, then runs until finish()."""
+    def __init__(self):
+        self.csv_text = "Name\nx\n"
+        self.events = []
+        self.emit = None
+        self.gate = threading.Event()
+
+    def __call__(self, urls, max_pages, csv_name, stop_event=None, on_event=None, **kwargs):
+        with open(csv_name, "w", encoding="utf-8") as f:
+            f.write(self.csv_text)
+        self.emit = on_event
+        for evt in self.events:
+            on_event(evt)
+        self.gate.wait(10)
+        on_event({"type": "done", "total": self.csv_text.count("\n") - 1})
+        return {"status": "completed"}
+
+    def finish(self):
+        self.gate.set()
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """(AppTest factory, JobManager, FakeCrawls): app.py over a job table in tmp_path, no Chromium."""
+    home = tmp_path / "home"
+    (home / ".cache" / "ms-playwright" / "chromium-0").mkdir(parents=True)  # ensure_playwright() finds it
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])  # AppTest installs app.py there
+    crawls = FakeCrawls()
+    monkeypatch.setattr(jobs, "run_crawl", crawls)
+    manager = jobs.JobManager(str(tmp_path / "jobs"))
+    monkeypatch.setattr(kijiji_scraper, "JobManager", lambda: manager)
+    # the app's job_manager() and previews are cached per process
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    def open_app(job=None):
+        at = AppTest.from_file(APP, default_timeout=30)
+        if job:
+            at.query_params["job"] = job.id
+        return at
+    yield open_app, manager, crawls
+    crawls.finish()
+
+def start(manager, status="running"):
+    job = manager.submit({"cars": "https://example.test/b-cars/"}, 1)
+    deadline = time.monotonic() + 5
+    while job.status != status:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    return job
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Paths the page reads through pandas.read_csv or Path.read_bytes."""
+    seen = []
+    read_csv, read_bytes = pd.read_csv, Path.read_bytes
+
+    def counting_read_csv(path, *args, **kwargs):
+        seen.append(os.path.basename(path))
+        return read_csv(path, *args, **kwargs)
+
+    def counting_read_bytes(self):
+        seen.append(self.name)
+        return read_bytes(self)
+    monkeypatch.setattr(pd, "read_csv", counting_read_csv)
+    monkeypatch.setattr(Path, "read_bytes", counting_read_bytes)
+    return seen
+
+def flush(total, names):
+    return {"type": "flush", "total": total, "final": False, "rows": [{"Name": n} for n in names]}
+
+def test_running_preview_comes_from_flush_events(app, reads):
+    open_app, manager, crawls = app
+    crawls.events = [flush(40, [f"car {i}" for i in range(40)]), flush(80, [f"car {i}" for i in range(40, 80)])]
+    at = open_app(start(manager))
+    at.run()
+    assert not at.exception
+    (preview,) = at.dataframe
+    # the newest PREVIEW_ROWS rows across flushes, newest first
+    assert list(preview.value["Name"]) == [f"car {i}" for i in range(79, 79 - PREVIEW_ROWS, -1)]
+    assert f"Preview ({PREVIEW_ROWS} most recently flushed rows):" in [c.value for c in at.caption]
+    # the download button is there, but neither it nor the preview read the CSV
+    assert at.get("download_button")[0].label == "⬇️ Download CSV (rows: 80)"
+    at.run()
+    assert reads == []
+
+def test_finished_preview_is_read_once_per_change_to_the_csv(app, reads):
+    open_app, manager, crawls = app
+    crawls.csv_text = "Name,Price\nFord,100\nKia,200\n"
+    crawls.finish()
+    job = start(manager, status="completed")
+    at = open_app(job)
+    at.run()
+    assert not at.exception
+    assert list(at.dataframe[0].value["Name"]) == ["Ford", "Kia"]
+    at.run()
+    assert reads == ["kijiji_cars.csv"]
+    # a write (size/mtime change) invalidates the cached preview
+    with open(job.csv, "a", encoding="utf-8") as f:
+        f.write("Mazda,300\n")
+    at.run()
+    assert list(at.dataframe[0].value["Name"]) == ["Ford", "Kia", "Mazda"]
+    assert reads == ["kijiji_cars.csv", "kijiji_cars.csv"]
+
+@pytest.fixture
+def fragments(monkeypatch):
+    """{fragment name: run_every} for every st.fragment the page declares."""
+    declared = {}
+    fragment = st.fragment
+
+    def recording_fragment(func=None, *, run_every=None):
+        def wrap(f):
+            declared[f.__name__] = run_every
+            return fragment(f, run_every=run_every)
+        return wrap(func) if func else wrap
+    monkeypatch.setattr(st, "fragment", recording_fragment)
+    return declared
+
+LIVE = {"topbar_live", "overview_live", "logs_live", "settings_live"}
+
+def test_idle_page_has_nothing_on_a_timer(app, fragments):
+    open_app, manager, crawls = app
+    at = open_app()
+    at.run()
+    assert not at.exception
+    assert fragments == dict.fromkeys(LIVE)
+
+def test_live_widgets_refresh_as_fragments_while_a_job_runs(app, fragments, monkeypatch):
+    open_app, manager, crawls = app
+    at = open_app(start(manager))
+    # the page returns instead of sleeping UI_REFRESH_SECS and rerunning itself (AppTest polls in ms)
+    sleep = time.sleep
+    monkeypatch.setattr(time, "sleep", lambda secs: pytest.fail(f"page slept {secs}s") if secs >= 1 else sleep(secs))
+    at.run()
+    assert not at.exception
+    assert fragments == dict.fromkeys(LIVE, 5)
+
+def test_each_event_is_shown_once(app, fragments):
+    open_app, manager, crawls = app
+    crawls.events = [{"type": "log", "msg": "first"}]
+    job = start(manager)
+    at = open_app(job)
+    at.run()
+    assert [c.value for c in at.code] == ["first"]
+    crawls.emit({"type": "log", "msg": "second"})
+    at.run()
+    assert [c.value for c in at.code] == ["first\nsecond"]
+
+    crawls.finish()
+    deadline = time.monotonic() + 5
+    while job.active:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    # a session (re)attaching to the finished job replays its log, with the timers off
+    at = open_app(job)
+    at.run()
+    assert not at.exception
+    assert "Completed" in " ".join(m.value for m in at.markdown)
+    assert [c.value for c in at.code] == ["first\nsecond"]
+    assert fragments == dict.fromkeys(LIVE)
@@ -0,0 +1,167 @@
+import asyncio, os, re, threading
+
+import pytest
+
+from kijiji_scraper.asset_cache import STATIC_URL, AssetCache, freshness_secs
+from kijiji_scraper.netfilter import NetFilter
+import fake_browser
+from fake_browser import FakeSite, crawl, install
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"cache-control": "public, max-age=31536000, immutable"}, 31536000.0),
+    ({"cache-control": 'max-age="60"'}, 60.0),
+    ({"cache-control": "max-age=abc"}, 0.0),
+    ({"cache-control": "no-cache, max-age=600"}, 0.0),
+    ({"cache-control": "no-store, max-age=600"}, None),
+    ({"date": "Wed, 21 Oct 2015 07:28:00 GMT", "expires": "Wed, 21 Oct 2015 08:28:00 GMT"}, 3600.0),
+    ({"expires": "0"}, 0.0),
+    ({}, None),
+])
+def test_freshness_secs(headers, expected):
+    assert freshness_secs(headers) == expected
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status, self.headers, self._body = status, headers, body
+
+    async def body(self):
+        return self._body
+
+class Request:
+    def __init__(self, url, resource_type="script", method="GET"):
+        self.url, self.resource_type, self.method, self.headers = url, resource_type, method, {}
+
+class Route:
+    """A Playwright Route over a tiny origin: app.js lasts an hour, short.js must revalidate, nostore.css can't be kept."""
+    fetches = []
+
+    def __init__(self, url, resource_type="script"):
+        self.request = Request(url, resource_type)
+        self.outcome = None
+
+    async def fetch(self, headers=None):
+        self.fetches.append((self.request.url, dict(headers or {})))
+        if "short" in self.request.url:
+            if (headers or {}).get("if-none-match") == '"v1"':
+                return Response(304, {"cache-control": "max-age=0", "etag": '"v1"'}, b"")
+            return Response(200, {"cache-control": "max-age=0", "etag": '"v1"', "content-encoding": "gzip"}, b"short")
+        if "nostore" in self.request.url:
+            return Response(200, {"cache-control": "no-store"}, b"x")
+        return Response(200, {"cache-control": "max-age=3600", "content-length": "4"}, b"body")
+
+    async def fulfill(self, status, headers, body):
+        self.outcome = ("fulfill", status, headers, body)
+
+    async def fallback(self):
+        self.outcome = ("fallback",)
+
+def route(cache, url, resource_type="script"):
+    r = Route(url, resource_type)
+    asyncio.run(cache._route(r))
+    return r.outcome
+
+@pytest.fixture(autouse=True)
+def reset_fetches():
+    Route.fetches = []
+
+def test_fresh_entry_is_served_from_disk(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    miss = route(cache, "https://x.test/app.js")
+    hit = route(cache, "https://x.test/app.js")
+    assert miss[0] == hit[0] == "fulfill" and hit[3] == b"body"
+    assert "content-length" not in miss[2]
+    assert len(Route.fetches) == 1
+    assert cache.stats() == {"cache_hits": 1, "cache_misses": 1, "cache_revalidated": 0,
+                             "cache_stored": 1, "cache_bytes_saved": 4}
+    # entries outlive the instance
+    again = AssetCache(str(tmp_path))
+    assert route(again, "https://x.test/app.js")[3] == b"body" and again.hits == 1
+
+def test_stale_entry_is_revalidated(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    first = route(cache, "https://x.test/short.js")
+    second = route(cache, "https://x.test/short.js")
+    assert "content-encoding" not in first[2]
+    assert Route.fetches[1][1]["if-none-match"] == '"v1"'
+    assert second[:2] == ("fulfill", 200) and second[3] == b"short"
+    assert (cache.misses, cache.revalidated, cache.hits) == (1, 1, 0)
+
+def test_no_store_response_is_not_kept(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    route(cache, "https://x.test/nostore.css", "stylesheet")
+    route(cache, "https://x.test/nostore.css", "stylesheet")
+    assert (cache.misses, cache.stored) == (2, 0)
+    assert os.listdir(tmp_path) == []
+
+def test_blocked_and_non_static_requests_fall_through(tmp_path):
+    cache = AssetCache(str(tmp_path), net=NetFilter())
+    assert route(cache, "https://www.google-analytics.com/analytics.js") == ("fallback",)
+    assert route(cache, "https://x.test/app.js", "xhr") == ("fallback",)
+    assert Route.fetches == []
+
+def test_concurrent_saves_of_one_url_do_not_collide(tmp_path):
+    # crawls in the app are threads of one process and share the cache directory
+    cache = AssetCache(str(tmp_path))
+    url = "https://x.test/app.js"
+    errors = []
+
+    def store(n):
+        try:
+            for i in range(50):
+                cache.save(url, 200, {"x-writer": str(n)}, f"{n}:{i}".encode(), 3600)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=store, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    meta, body = cache.load(url)
+    assert meta["url"] == url and re.fullmatch(rb"\d:\d+", body)
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path)) == [".body", ".json"]
+
+def test_a_failed_save_still_answers_the_request(tmp_path, monkeypatch):
+    cache = AssetCache(str(tmp_path))
+
+    def disk_full(*args):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(cache, "save", disk_full)
+    assert route(cache, "https://x.test/app.js") == ("fulfill", 200, {"cache-control": "max-age=3600"}, b"body")
+    assert (cache.misses, cache.stored) == (1, 0)
+    # a revalidated entry that can't be refreshed is still served
+    monkeypatch.undo()
+    route(cache, "https://x.test/short.js")
+    monkeypatch.setattr(cache, "save", disk_full)
+    assert route(cache, "https://x.test/short.js")[:2] == ("fulfill", 200)
+    assert cache.revalidated == 1
+
+def test_a_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = AssetCache(str(tmp_path))
+
+    def no_replace(src, dst):
+        raise OSError("read-only file system")
+    monkeypatch.setattr(os, "replace", no_replace)
+    with pytest.raises(OSError):
+        cache.save("https://x.test/app.js", 200, {}, b"body", 60)
+    assert os.listdir(tmp_path) == []
+
+def test_prune_drops_oldest_entries(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    route(cache, "https://x.test/app.js")
+    assert len(os.listdir(tmp_path)) == 2
+    AssetCache(str(tmp_path), max_mb=0)
+    assert os.listdir(tmp_path) == []
+
+def test_only_static_urls_are_routed_through_python(tmp_path, monkeypatch):
+    # a callable matcher makes Playwright intercept every request; the regex is matched in the driver
+    routes = []
+
+    async def record_route(self, pattern, handler):
+        routes.append(pattern)
+    install(monkeypatch, FakeSite(pages=1, per_page=2))
+    monkeypatch.setattr(fake_browser.Context, "route", record_route)
+    crawl(tmp_path / "out.csv", max_pages=1, phones="off", asset_cache=str(tmp_path / "assets"))
+    assert routes and all(p is STATIC_URL for p in routes)
+    assert isinstance(STATIC_URL, re.Pattern)
+    assert STATIC_URL.search("https://x.test/app.js?v=1") and not STATIC_URL.search("https://x.test/app.json")
@@ -0,0 +1,23 @@
+import subprocess, sys, time
+
+from bench.run import PeakMemory, percentile
+
+def test_percentile():
+    assert percentile([], 95) == 0.0
+    assert percentile([3.0, 1.0, 2.0, 4.0], 50) == 2.0
+    assert percentile([3.0, 1.0, 2.0, 4.0], 95) == 4.0
+
+def test_peak_memory_counts_running_children():
+    # a child holding ~64 MB: rusage only reports children once they have exited
+    script = "import time; b = bytearray(64 * 1024 * 1024); b[::4096] = b'x' * (len(b) // 4096); time.sleep(5)"
+    with PeakMemory(interval=0.05) as peak:
+        proc = subprocess.Popen([sys.executable, "-c", script])
+        try:
+            deadline = time.monotonic() + 4
+            while peak.browser_mb < 64 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            proc.kill()
+            proc.wait()
+    assert peak.browser_mb >= 64
+    assert peak.total_mb > peak.browser_mb
@@ -0,0 +1,91 @@
+import asyncio, json, queue, threading
+
+import pyarrow.parquet as pq
+
+from kijiji_scraper import scraper, sinks
+from kijiji_scraper.checkpoint import checkpoint_path, clear_checkpoint, load_checkpoint, save_checkpoint
+from fake_browser import FakeSite, crawl, install
+
+def test_checkpoint_path():
+    assert checkpoint_path("out/kijiji_cars.csv") == "out/kijiji_cars.checkpoint.json"
+
+def test_save_load_clear(tmp_path):
+    path = str(tmp_path / "cars.checkpoint.json")
+    assert load_checkpoint(path) is None
+    save_checkpoint(path, {"next_page": 3, "pending": [[2, 1, 4, "https://www.kijiji.ca/v-x/1"]]})
+    state = load_checkpoint(path)
+    assert state["next_page"] == 3 and state["pending"][0][3] == "https://www.kijiji.ca/v-x/1"
+    assert "saved_at" in state
+    assert not (tmp_path / "cars.checkpoint.json.tmp").exists()
+    clear_checkpoint(path)
+    clear_checkpoint(path)  # already gone: no error
+    assert load_checkpoint(path) is None
+
+def test_unreadable_checkpoint_is_ignored(tmp_path):
+    path = tmp_path / "cars.checkpoint.json"
+    path.write_text('{"next_page": ', encoding="utf-8")
+    assert load_checkpoint(str(path)) is None
+
+class StoppingSite(FakeSite):
+    """Sets `stop` once `after` listings have loaded."""
+    def __init__(self, after, **kwargs):
+        super().__init__(**kwargs)
+        self.after, self.stop = after, threading.Event()
+
+    async def visit(self, url):
+        await super().visit(url)
+        if sum(v[0] == "listing" for v in self.visits) >= self.after:
+            self.stop.set()
+
+def test_stop_then_resume_writes_every_listing_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "FLUSH_EVERY", 2)
+    out = tmp_path / "cars.csv"
+    site = StoppingSite(after=5, pages=4, per_page=3, listing_secs=0.05)
+    install(monkeypatch, site)
+    events, rows = crawl(out, max_pages=4, concurrency=1, phones="off", stop_event=site.stop)
+    state = json.loads((tmp_path / "cars.checkpoint.json").read_text(encoding="utf-8"))
+    assert state["rows_written"] == len(rows) < 12
+    assert state["pending"], "the stop should leave queued listings behind"
+    written = {r["Listing Link"] for r in rows}
+    pending = {href for *_, href in state["pending"]}
+    assert not written & pending
+
+    resumed = FakeSite(pages=4, per_page=3)
+    install(monkeypatch, resumed)
+    events, rows = crawl(out, max_pages=4, concurrency=1, phones="off", resume=True)
+    links = [r["Listing Link"] for r in rows]
+    assert len(links) == 12 and len(set(links)) == 12
+    # pending listings go first, then the walk continues where it stopped
+    first_visits = [v[1] for v in resumed.visits if v[0] == "listing"][:len(pending)]
+    assert set(first_visits) == pending
+    assert all(scraper.page_url(scraper.DEFAULT_URL, 1) != v[1] for v in resumed.visits if v[0] == "search")
+    assert not (tmp_path / "cars.checkpoint.json").exists()
+    assert any(e["type"] == "log" and e["msg"].startswith("Resuming:") for e in events)
+
+def test_crash_then_resume_keeps_written_parquet_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "FLUSH_EVERY", 2)
+    out = tmp_path / "cars.csv"
+    install(monkeypatch, FakeSite(pages=3, per_page=3))
+    to_frame, flushes = scraper.to_frame, []
+
+    def crash_on_third_flush(rows):
+        flushes.append(len(rows))
+        if len(flushes) == 3:
+            raise MemoryError("killed")
+        return to_frame(rows)
+    monkeypatch.setattr(scraper, "to_frame", crash_on_third_flush)
+    # the process dies: nothing gets closed
+    monkeypatch.setattr(sinks.ParquetSink, "close", lambda self: None)
+    out_q: queue.Queue = queue.Queue()
+    asyncio.run(scraper.scrape_kijiji(scraper.DEFAULT_URL, 3, str(out), lambda m: None, threading.Event(), out_q,
+                                      concurrency=1, phones="off", outputs=["csv", "parquet"]))
+    assert load_checkpoint(checkpoint_path(str(out)))["rows_written"] == 4
+    monkeypatch.undo()
+
+    install(monkeypatch, FakeSite(pages=3, per_page=3))
+    monkeypatch.setattr(scraper, "FLUSH_EVERY", 2)
+    _, rows = crawl(out, max_pages=3, concurrency=1, phones="off", outputs=["csv", "parquet"], resume=True)
+    links = [r["Listing Link"] for r in rows]
+    assert len(set(links)) == 9
+    assert pq.read_table(tmp_path / "cars.parquet").column("Listing Link").to_pylist() == links
+    assert not list(tmp_path.glob("cars.parquet.*"))
@@ -0,0 +1,85 @@
+import pytest
+
+from kijiji_scraper import cli, scraper, seen
+
+PLAYWRIGHT_TRACE = """Traceback (most recent call last):
+  File "/app/kijiji_scraper/scraper.py", line 785, in scrape_kijiji
+    await host.start()
+  File "/venv/lib/python3.10/site-packages/playwright/_impl/_browser_type.py", line 94, in launch
+    Error: BrowserType.launch: Executable doesn't exist at /root/.cache/ms-playwright/chromium-1091/chrome-linux/chrome
+playwright._impl._errors.Error: BrowserType.launch: Executable doesn't exist at /root/.cache/ms-playwright/chromium-1091/chrome-linux/chrome
+╔════════════════════════════════════════════════════════════╗
+║ Looks like Playwright was just installed or updated.       ║
+║ Please run the following command to download new browsers: ║
+║                                                            ║
+║     playwright install                                     ║
+╚════════════════════════════════════════════════════════════╝
+"""
+
+CHAINED_TRACE = """Traceback (most recent call last):
+  File "a.py", line 2, in <module>
+    int("x")
+ValueError: invalid literal for int() with base 10: 'x'
+
+During handling of the above exception, another exception occurred:
+
+Traceback (most recent call last):
+  File "a.py", line 4, in <module>
+    raise RuntimeError("bad input")
+    ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+RuntimeError: bad input
+"""
+
+def test_error_line():
+    assert cli.error_line(PLAYWRIGHT_TRACE) == (
+        "playwright._impl._errors.Error: BrowserType.launch: Executable doesn't exist at "
+        "/root/.cache/ms-playwright/chromium-1091/chrome-linux/chrome")
+    assert cli.error_line(CHAINED_TRACE) == "RuntimeError: bad input"
+    assert cli.error_line("KeyboardInterrupt\n") == "KeyboardInterrupt"
+
+@pytest.fixture
+def fake_crawl(monkeypatch):
+    calls = []
+
+    async def scrape_kijiji(url, max_pages, csv_name, log, stop_event, out_q, **opts):
+        calls.append((url, max_pages, opts))
+        if opts.get("fail"):
+            out_q.put({"type": "error", "trace": PLAYWRIGHT_TRACE})
+            return
+        out_q.put({"type": "done", "total": 0})
+    monkeypatch.setattr(scraper, "scrape_kijiji", scrape_kijiji)
+    return calls
+
+def test_first_page_starts_the_walk_there(tmp_path, fake_crawl):
+    url = scraper.CATEGORIES["cars"][1]
+    cli.run_crawl({"cars": url}, 5, str(tmp_path / "c.csv"), first_page=4)
+    start, pages, opts = fake_crawl[0]
+    assert start == scraper.page_url(url, 4)
+    assert "/page-4/" in start and pages == 5 and opts["first_page"] == 4
+
+def test_url_is_kept_without_first_page(tmp_path, fake_crawl):
+    url = scraper.page_url(scraper.CATEGORIES["cars"][1], 3)
+    cli.run_crawl({"url": url}, 2, str(tmp_path / "c.csv"))
+    assert fake_crawl[0][0] == url
+
+def test_failed_run_reports_the_exception_line(tmp_path, fake_crawl):
+    stats = cli.run_crawl({"cars": scraper.DEFAULT_URL}, 1, str(tmp_path / "c.csv"), fail=True)
+    assert stats["status"] == "failed"
+    assert stats["error"].startswith("playwright._impl._errors.Error: BrowserType.launch")
+
+def test_crawl_options_from_the_command_line():
+    args = cli.build_parser().parse_args(
+        ["crawl", "--first-page", "3", "--format", "sqlite", "--format", "jsonl", "--format", "sqlite",
+         "--phones", "off", "--asset-cache"])
+    opts = cli.crawl_options(args)
+    assert opts["first_page"] == 3
+    assert opts["outputs"] == ["csv", "sqlite", "jsonl"]
+    assert opts["phones"] == "off"
+    assert opts["asset_cache"] == cli.ASSET_CACHE_DIR
+
+def test_seen_db_defaults_to_the_seen_index():
+    opts = cli.crawl_options(cli.build_parser().parse_args(["crawl", "--skip-seen", "2"]))
+    assert (opts["seen_db"], opts["seen_ttl"]) == (seen.SEEN_DB, 7200)
+    opts = cli.crawl_options(cli.build_parser().parse_args(["crawl", "--skip-seen", "1", "--seen-db", "x.sqlite"]))
+    assert opts["seen_db"] == "x.sqlite"
+    assert "seen_db" not in cli.crawl_options(cli.build_parser().parse_args(["crawl"]))
@@ -0,0 +1,105 @@
+"""
+The single page.evaluate extractors against the per-element selectors they
+replaced, on bench's fixture pages. Needs Chromium; skipped without it.
+"""
+import asyncio
+
+import pytest
+
+from bench.mock_server import LISTING_ID_BASE, MockSite
+from kijiji_scraper import scraper
+
+# the older results layout (nested .vAthl sections), including a card without a link
+VATHL_PAGE = """
+<div class="vAthl"><div class="vAthl"><div>
+<section><a data-testid="listing-link" href="/v-cars-trucks/ottawa/civic/1799000001">2015 Civic</a>
+<p data-testid="listing-date">3 hrs ago</p></section>
+<section><p data-testid="listing-date">Promoted</p></section>
+<section><a data-testid="listing-link" href="/v-cars-trucks/ottawa/golf/1799000002">2012 Golf</a></section>
+</div></div></div>
+<nav aria-label="Search Pagination"><a href="/b-cars-trucks/canada/page-1/c174l0">Previous</a>
+<a href="/b-cars-trucks/canada/page-3/c174l0">Next</a></nav>
+"""
+
+def on_page(html, extract):
+    """Load html into a Chromium page (no network) and return `await extract(page)`."""
+    async def run():
+        async with scraper.async_playwright() as p:
+            try:
+                browser = await p.chromium.launch()
+            except Exception as e:
+                pytest.skip(f"Chromium not available: {e}")
+            try:
+                page = await browser.new_page()
+                await page.route("**/*", lambda route: route.abort())
+                await page.set_content(html)
+                return await extract(page)
+            finally:
+                await browser.close()
+    return asyncio.run(run())
+
+async def selector_search_page(page):
+    """Cards and next link the way the results walk read them before SEARCH_PAGE_JS."""
+    containers = (await page.query_selector_all(".vAthl .vAthl div section")
+                  + await page.query_selector_all("[data-testid='srp-search-list'] section"))
+    cards = []
+    for container in containers:
+        duration_tag = await container.query_selector('[data-testid="listing-date"]')
+        link_tag = await container.query_selector('a[data-testid="listing-link"]')
+        cards.append({"href": await link_tag.get_attribute("href") if link_tag else None,
+                      "date": (await duration_tag.text_content()).strip() if duration_tag else None})
+    next_a = (await page.query_selector('li[data-testid="pagination-next-link"] a')
+              or await page.query_selector('nav[aria-label="Search Pagination"] a:has-text("Next")'))
+    return {"cards": cards, "next": await next_a.get_attribute("href") if next_a else None}
+
+async def both_search_extractors(page):
+    return await page.evaluate(scraper.SEARCH_PAGE_JS), await selector_search_page(page)
+
+@pytest.mark.parametrize("html", [
+    MockSite(per_page=5).search_page("/b-cars-trucks/canada/page-2/c174l0", ""),
+    MockSite(per_page=5, total_pages=2).search_page("/b-cars-trucks/canada/page-2/c174l0", ""),
+    VATHL_PAGE,
+], ids=["srp-list", "last-page", "vathl"])
+def test_search_page_js_matches_the_selectors(html):
+    js, selectors = on_page(html, both_search_extractors)
+    assert [{"href": c["href"], "date": c["date"]} for c in js["cards"]] == selectors["cards"]
+    assert js["next"] == selectors["next"]
+
+def test_search_page_js_reads_card_details():
+    js, _ = on_page(MockSite(per_page=2).search_page("/b-cars-trucks/canada/c174l0", ""), both_search_extractors)
+    values = MockSite()._listing_values(LISTING_ID_BASE)
+    assert js["cards"][0] == {"href": values["href"], "date": values["age"], "title": values["title"],
+                              "price": values["price"], "location": values["location"]}
+    assert js["next"] == "/b-cars-trucks/canada/page-2/c174l0"
+
+# the older listing layout (styled-component classes), with the date split over lines
+STYLED_LISTING = """
+<h1> 2012 Golf </h1><p data-testid="vip-price">$6,500</p>
+<div data-testid="listing-date">
+  2  hrs
+  ago</div>
+<div class="bEMmoW"><div class="iCgpsX"><button>Ottawa, ON</button></div></div>
+<h3><a href="/o-profile/1">Dealer</a></h3>
+<div class="sc-eb45309b-0 iNzWBi"><p class="sc-82669b63-0 cqjWkX">Kilometres</p><p class="sc-991ea11d-0 fgtvkm">120,000 km</p></div>
+<div class="sc-eb45309b-0 iNzWBi"><p class="sc-82669b63-0 cqjWkX">Fuel</p></div>
+"""
+
+async def both_listing_extractors(page):
+    return await page.evaluate(scraper.LISTING_JS), await scraper.extract_listing_fields(page)
+
+@pytest.mark.parametrize("html", [
+    MockSite().listing_page(LISTING_ID_BASE + 7),
+    STYLED_LISTING,
+    "<main><p>Listing removed</p></main>",
+], ids=["vip", "styled", "empty"])
+def test_listing_js_matches_the_selectors(html):
+    js, selectors = on_page(html, both_listing_extractors)
+    assert js == selectors
+
+def test_listing_js_reads_every_field():
+    js, _ = on_page(MockSite().listing_page(LISTING_ID_BASE), both_listing_extractors)
+    values = MockSite()._listing_values(LISTING_ID_BASE)
+    assert {k: js[k] for k in ("date", "name", "price", "location", "seller")} == {
+        "date": values["age"], "name": values["title"], "price": values["price"],
+        "location": values["location"], "seller": values["seller"]}
+    assert {"label": "Body Style", "values": ["Sedan", "4 doors"]} in js["attributes"]
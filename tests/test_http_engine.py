@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bench.mock_server import LISTING_ID_BASE, MockSite
+from kijiji_scraper.http_engine import (
+    _merge_split_attributes, format_price, parse_listing_html, parse_search_html, posted_age_text,
+)
+
+FIXTURES = Path(__file__).with_name("fixtures")
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+LISTING_HREF = "https://www.kijiji.ca/v-cars-trucks/ottawa/2016-honda-civic-lx/1712345678"
+
+def fixture(name):
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+def test_format_price():
+    assert format_price({"amount": 1250000}) == "$12,500"
+    assert format_price({"amount": 99}) == "$1"
+    assert format_price({"type": "CONTACT"}) is None
+    assert format_price(None) is None
+
+def test_posted_age_text():
+    assert posted_age_text("2024-05-01T11:59:30.000Z", NOW) == "30 seconds ago"
+    assert posted_age_text("2024-05-01T11:15:00Z", NOW) == "45 mins ago"
+    assert posted_age_text("2024-05-01T09:00:00.000Z", NOW) == "3 hrs ago"
+    assert posted_age_text("2024-04-28T12:00:00.000Z", NOW) == "3 days ago"
+    assert posted_age_text("yesterday", NOW) is None
+    assert posted_age_text(None, NOW) is None
+
+def test_search_page_from_apollo_state():
+    srp = parse_search_html(fixture("search_apollo.html"), NOW)
+    # the embedded state wins over the markup cards
+    assert srp["cards"] == [
+        {"href": "/v-cars-trucks/ottawa/2016-honda-civic-lx/1712345678", "date": "3 hrs ago",
+         "title": "2016 Honda Civic LX", "price": "$12,500", "location": "Ottawa"},
+        {"href": "/v-cars-trucks/calgary/2012-ford-f-150/1712345679", "date": "2 days ago",
+         "title": "2012 Ford F-150", "price": None, "location": "Calgary"},
+    ]
+    assert srp["next"] == "/b-cars-trucks/canada/page-2/c174l0?for-sale-by=ownr&view=list"
+
+def test_listing_from_apollo_state():
+    fields = parse_listing_html(fixture("listing_apollo.html"), LISTING_HREF, NOW)
+    assert fields["name"] == "2016 Honda Civic LX"
+    assert fields["date"] == "3 hrs ago"
+    assert fields["price"] == "$12,500"
+    assert fields["location"] == "Ottawa, ON K1A 0B1"
+    assert fields["seller"] == "Jamie"
+    # split Apollo attributes come back in the rows the page shows; unknown names are dropped
+    assert fields["attributes"] == [
+        {"label": "Kilometres", "values": ["85000"]},
+        {"label": "Body Style", "values": ["Sedan", "4 doors"]},
+        {"label": "Transmission", "values": ["Automatic"]},
+        {"label": "Model", "values": ["Civic", "LX"]},
+        {"label": "Fuel", "values": ["Gas"]},
+        {"label": "Seats", "values": ["5"]},
+    ]
+
+def test_listing_state_for_another_id_falls_back_to_markup():
+    fields = parse_listing_html(fixture("listing_apollo.html"), "https://www.kijiji.ca/v-cars-trucks/x/1799999999", NOW)
+    assert fields["name"] == "Markup title (ignored when the state parses)"
+    assert fields["price"] is None
+
+def test_merge_split_attributes():
+    fields = {"attributes": [
+        {"label": "Doors", "values": ["2 doors"]},
+        {"label": "Body Style", "values": ["Coupe", "ignored"]},
+        {"label": "Model", "values": ["Mustang"]},
+        {"label": "Extra Info", "values": ["GT", "Premium"]},
+        {"label": "Fuel", "values": ["Gas"]},
+    ]}
+    _merge_split_attributes(fields)
+    assert fields["attributes"] == [
+        {"label": "Body Style", "values": ["Coupe", "2 doors"]},
+        {"label": "Model", "values": ["Mustang", "GT", "Premium"]},
+        {"label": "Fuel", "values": ["Gas"]},
+    ]
+
+def test_search_page_from_markup():
+    site = MockSite(per_page=3, total_pages=2)
+    srp = parse_search_html(site.search_page("/b-cars-trucks/canada/c174l0", "view=list"))
+    assert [c["href"].rsplit("/", 1)[1] for c in srp["cards"]] == [str(LISTING_ID_BASE + i) for i in range(3)]
+    assert srp["cards"][0] == {"href": "/v-cars-trucks/toronto/2008-honda-civic/1800000000", "date": "1 mins ago",
+                               "title": "2008 Honda Civic", "price": "$8,000.00", "location": "Toronto, ON"}
+    assert srp["next"] == "/b-cars-trucks/canada/page-2/c174l0?view=list"
+    last = parse_search_html(site.search_page("/b-cars-trucks/canada/page-2/c174l0", "view=list"))
+    assert last["next"] is None
+
+def test_listing_from_markup():
+    lid = LISTING_ID_BASE + 1
+    fields = parse_listing_html(MockSite().listing_page(lid), f"https://www.kijiji.ca/v-cars-trucks/x/{lid}")
+    assert fields["name"] == "2009 Toyota Corolla"
+    assert fields["price"] == "$8,137.00"
+    assert fields["date"] == "2 mins ago"
+    assert fields["seller"] == "Owner 1"
+    assert fields["location"] == "Calgary, AB"
+    assert {"label": "Body Style", "values": ["Sedan", "4 doors"]} in fields["attributes"]
+    assert {"label": "Kilometres", "values": ["40,911 km"]} in fields["attributes"]
@@ -0,0 +1,87 @@
+import asyncio, queue, threading
+
+from kijiji_scraper import scraper
+from kijiji_scraper.seen import SeenIndex
+from kijiji_scraper.sharding import raise_watermarks
+from fake_browser import FakeSite, crawl, install
+
+SEARCH_KEY = scraper.page_url(scraper.DEFAULT_URL, 1)
+
+def watermark(db):
+    index = SeenIndex(db)
+    try:
+        return index.get_watermark(SEARCH_KEY)
+    finally:
+        index.close()
+
+def test_second_run_stops_on_page_one(tmp_path, monkeypatch):
+    site = FakeSite(pages=3, per_page=2)
+    install(monkeypatch, site)
+    db = str(tmp_path / "seen.sqlite")
+    _, rows = crawl(tmp_path / "first.csv", phones="off", incremental=True, seen_db=db)
+    assert len(rows) == 6
+    newest = max(int(scraper.listing_id(r["Listing Link"])) for r in rows)
+    assert watermark(db) == newest
+    site.visits.clear()
+    events, rows = crawl(tmp_path / "second.csv", phones="off", incremental=True, seen_db=db)
+    assert rows == []
+    assert [v[0] for v in site.visits] == ["search"]
+    assert any(e["type"] == "log" and e["msg"] == "No new listings on page 1 — stopping (incremental)" for e in events)
+
+class StopOnPageTwo(FakeSite):
+    def __init__(self, stop_event, **kwargs):
+        super().__init__(**kwargs)
+        self.stop_event = stop_event
+
+    async def visit(self, url):
+        await super().visit(url)
+        if self.page_no(url) == 2:
+            self.stop_event.set()
+            await asyncio.sleep(1)
+
+def test_stopped_run_leaves_the_mark(tmp_path, monkeypatch):
+    stop = threading.Event()
+    install(monkeypatch, StopOnPageTwo(stop, pages=3, per_page=2))
+    db = str(tmp_path / "seen.sqlite")
+    index = SeenIndex(db)
+    index.set_watermark(SEARCH_KEY, 5)
+    index.close()
+    _, rows = crawl(tmp_path / "out.csv", phones="off", incremental=True, seen_db=db, stop_event=stop)
+    assert rows
+    assert watermark(db) == 5
+
+class FailOnPageTwo(FakeSite):
+    def search(self, url):
+        if self.page_no(url) == 2:
+            raise RuntimeError("results page broke")
+        return super().search(url)
+
+def test_failed_run_leaves_the_mark(tmp_path, monkeypatch):
+    install(monkeypatch, FailOnPageTwo(pages=3, per_page=2))
+    db = str(tmp_path / "seen.sqlite")
+    out_q: queue.Queue = queue.Queue()
+    asyncio.run(scraper.scrape_kijiji(scraper.DEFAULT_URL, 3, str(tmp_path / "out.csv"), lambda m: None,
+                                      threading.Event(), out_q, phones="off", incremental=True, seen_db=db))
+    events = [out_q.get() for _ in range(out_q.qsize())]
+    assert events[-1]["type"] == "error" and "results page broke" in events[-1]["trace"]
+    assert watermark(db) == 0
+
+def test_shard_leaves_the_mark_to_run_sharded(tmp_path, monkeypatch):
+    install(monkeypatch, FakeSite(pages=2, per_page=2))
+    db = str(tmp_path / "seen.sqlite")
+    events, rows = crawl(tmp_path / "out.csv", max_pages=2, phones="off", incremental=True, seen_db=db,
+                         raise_watermark=False)
+    assert events[-1] == {"type": "done", "total": 4,
+                          "newest": max(int(scraper.listing_id(r["Listing Link"])) for r in rows)}
+    assert watermark(db) == 0
+
+def test_sharded_mark_is_raised_only_when_every_shard_finished(tmp_path):
+    db = str(tmp_path / "seen.sqlite")
+    shards = [{"url": scraper.DEFAULT_URL, "first_page": 1, "pages": 1},
+              {"url": scraper.page_url(scraper.DEFAULT_URL, 2), "first_page": 2, "pages": 1}]
+    out_q: queue.Queue = queue.Queue()
+    raise_watermarks(shards, {0: 900}, db, out_q)
+    assert watermark(db) == 0
+    assert "did not finish" in out_q.get()["msg"]
+    raise_watermarks(shards, {0: 900, 1: 800}, db, out_q)
+    assert watermark(db) == 900
@@ -0,0 +1,186 @@
+import json, os, threading, time
+
+import pytest
+
+from kijiji_scraper import jobs
+from kijiji_scraper.checkpoint import checkpoint_path, save_checkpoint
+
+SERVER = "http://127.0.0.1:9222"
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """A JobManager (2 browser slots) whose crawls run until release(job) is called."""
+    running, gates, calls = set(), {}, []
+
+    def run_crawl(urls, max_pages, csv_name, stop_event=None, **kwargs):
+        calls.append((csv_name, kwargs))
+        running.add(csv_name)
+        gates.setdefault(csv_name, threading.Event()).wait(10)
+        running.discard(csv_name)
+        return {"status": "completed"}
+
+    monkeypatch.setattr(jobs, "run_crawl", run_crawl)
+    monkeypatch.setattr(jobs, "SLOT_POLL_SECS", 0.01)
+
+    def open_manager():
+        m = jobs.JobManager(str(tmp_path), max_browsers=2)
+        m.running = lambda: {j for j in m.jobs.values() if j.csv in running}
+        m.release = lambda job: gates.setdefault(job.csv, threading.Event()).set()
+        # (job, run_crawl kwargs) in the order crawls started
+        m.started = lambda: [(next(j for j in m.jobs.values() if j.csv == csv), kw) for csv, kw in calls]
+        m.reopen = open_manager  # a new instance over the same job table, as after a restart
+        return m
+    return open_manager()
+
+def wait_for(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def submit(m, **opts):
+    return m.submit({"cars": "https://example.test/b-cars/"}, 1, **opts)
+
+def test_jobs_on_a_browser_server_share_its_slot(manager):
+    a, b = submit(manager, cdp_url=SERVER), submit(manager, cdp_url=SERVER)
+    own = submit(manager)
+    wait_for(lambda: manager.running() == {a, b, own})
+    assert manager.browsers_in_use() == 2
+    for job in (a, b, own):
+        manager.release(job)
+    wait_for(lambda: not any(j.active for j in (a, b, own)))
+    assert manager.browsers_in_use() == 0
+
+def test_contexts_per_server_are_capped_at_max_browsers(manager):
+    a, b, c = (submit(manager, cdp_url=SERVER) for _ in range(3))
+    wait_for(lambda: manager.running() == {a, b})
+    assert c.status == "queued" and manager.browsers_in_use() == 1
+    manager.release(a)
+    wait_for(lambda: manager.running() == {b, c})
+    manager.release(b)
+    manager.release(c)
+    wait_for(lambda: not c.active)
+    assert manager.browsers_in_use() == 0
+
+def test_server_job_waits_for_a_slot_when_the_server_has_none(manager):
+    own = submit(manager, workers=2)
+    on_server = submit(manager, cdp_url=SERVER)
+    wait_for(lambda: manager.running() == {own})
+    time.sleep(0.05)
+    assert on_server.status == "queued"
+    manager.release(own)
+    wait_for(lambda: manager.running() == {on_server})
+    manager.release(on_server)
+
+def test_sharded_job_does_not_count_as_a_server_job(manager):
+    job = submit(manager, workers=2, cdp_url=SERVER)
+    assert job.server is None and job.browsers == 2
+    wait_for(lambda: manager.running() == {job})
+    assert manager.browsers_in_use() == 2
+    manager.release(job)
+
+def started_jobs(m):
+    return [job for job, _ in m.started()]
+
+def test_queued_jobs_start_in_submission_order(manager):
+    a, b = submit(manager), submit(manager)
+    wait_for(lambda: manager.running() == {a, b})
+    queued = [submit(manager) for _ in range(4)]
+    time.sleep(0.05)
+    assert all(j.status == "queued" for j in queued)
+    assert manager.browsers_in_use() == 2
+    for done, nxt in zip([a, b, *queued[:2]], queued):
+        manager.release(done)
+        wait_for(lambda: nxt in manager.running())
+    started = started_jobs(manager)
+    assert set(started[:2]) == {a, b}
+    assert started[2:] == queued
+    for job in queued[2:]:
+        manager.release(job)
+
+def test_a_job_needing_more_browsers_is_not_overtaken(manager):
+    own = submit(manager)
+    wait_for(lambda: manager.running() == {own})
+    sharded = submit(manager, workers=2)
+    small = submit(manager)
+    time.sleep(0.05)
+    # a slot is free, but the sharded job is first in line
+    assert (sharded.status, small.status) == ("queued", "queued")
+    assert manager.browsers_in_use() == 1
+    manager.release(own)
+    wait_for(lambda: manager.running() == {sharded})
+    manager.release(sharded)
+    wait_for(lambda: manager.running() == {small})
+    manager.release(small)
+    assert started_jobs(manager) == [own, sharded, small]
+
+def test_stopping_a_queued_job_takes_it_out_of_line(manager):
+    a, b = submit(manager), submit(manager)
+    wait_for(lambda: manager.running() == {a, b})
+    stopped, later = submit(manager), submit(manager)
+    manager.stop(stopped.id)
+    wait_for(lambda: stopped.status == "stopped")
+    assert stopped.finished is not None
+    _, events = stopped.events_since(0)
+    assert [e["msg"] for e in events] == ["Queued: waiting for 1 of 2 browser slots", "Stopped before it started"]
+    manager.release(a)
+    wait_for(lambda: manager.running() == {b, later})
+    assert stopped not in started_jobs(manager)
+    assert manager.browsers_in_use() == 2
+    for job in (b, later):
+        manager.release(job)
+    wait_for(lambda: manager.browsers_in_use() == 0)
+
+def write_job(root, job_id, status, events=(), **spec):
+    job_dir = os.path.join(root, job_id)
+    os.makedirs(job_dir)
+    spec = {"urls": {"cars": "https://example.test/b-cars/"}, "max_pages": 1, "csv_name": "cars.csv",
+            "workers": 0, "shard_pages": None, "crawl_opts": {}, **spec}
+    with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+        json.dump({"id": job_id, "spec": spec, "status": status, "created": 1.0, "started": 2.0,
+                   "finished": None, "rows": 7, "stats": {}}, f)
+    with open(os.path.join(job_dir, "events.jsonl"), "w", encoding="utf-8") as f:
+        for evt in events:
+            f.write(json.dumps({"ts": 1.0, **evt}) + "\n")
+    return job_dir
+
+def test_load_marks_jobs_cut_off_by_a_restart_as_interrupted(tmp_path):
+    pool = {"type": "pool", "open": 2}
+    write_job(str(tmp_path), "running", "running", [{"type": "log", "msg": "hi"}, pool])
+    write_job(str(tmp_path), "queued", "queued")
+    write_job(str(tmp_path), "done", "completed")
+    m = jobs.JobManager(str(tmp_path))
+    assert {j.id: j.status for j in m.list()} == {"running": "interrupted", "queued": "interrupted",
+                                                  "done": "completed"}
+    job = m.get("running")
+    assert job.rows == 7
+    assert job.csv == os.path.join(str(tmp_path), "running", "cars.csv")
+    # the event log is replayed for sessions that reattach
+    seq, events = job.events_since(0)
+    assert seq == 2
+    assert [e["type"] for e in events] == ["log", "pool"]
+    assert job.latest["pool"]["open"] == 2
+    assert m.browsers_in_use() == 0
+
+def test_resume_continues_a_reloaded_job_in_place(manager):
+    job_dir = write_job(manager.root, "old", "running", crawl_opts={"concurrency": 3})
+    with pytest.raises(ValueError, match="no checkpoint"):
+        manager.reopen().resume("old")
+    save_checkpoint(checkpoint_path(os.path.join(job_dir, "cars.csv")),
+                    {"next_url": None, "next_page": 2, "pending": [], "phone_todo": [], "rows_written": 7})
+    m = manager.reopen()
+    job = m.get("old")
+    assert job.status == "interrupted" and job.checkpoint()["next_page"] == 2
+    assert m.resume("old") is job
+    wait_for(lambda: m.running() == {job})
+    assert job.status == "running"
+    with pytest.raises(ValueError, match="still running"):
+        m.resume("old")
+    (started, kwargs), = m.started()
+    assert started is job
+    assert kwargs["resume"] is True
+    assert kwargs["concurrency"] == 3
+    m.release(job)
+    wait_for(lambda: job.status == "completed")
+    with open(os.path.join(job_dir, "job.json"), encoding="utf-8") as f:
+        assert json.load(f)["status"] == "completed"
@@ -0,0 +1,33 @@
+import os, subprocess, sys, time
+
+import pytest
+
+from kijiji_scraper.memory import memory_stats
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc"), reason="reads /proc")
+
+# holds ~64 MB until killed
+HOG = "import time; b = bytearray(64 * 1024 * 1024); b[::4096] = b'x' * (len(b) // 4096); time.sleep(30)"
+
+def wait_for_rss(pid, mb, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while memory_stats(root=pid)["children_mb"] < mb and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def test_root_counts_one_process_tree_only():
+    # two "browsers" spawned by the same process, like two crawls' Chromiums in the app
+    procs = [subprocess.Popen([sys.executable, "-c", HOG]) for _ in range(2)]
+    try:
+        for proc in procs:
+            wait_for_rss(proc.pid, 64)
+        ours = memory_stats(root=procs[0].pid)
+        everything = memory_stats()
+    finally:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+    assert ours["children"] == 1
+    assert 64 <= ours["children_mb"] < 128
+    assert everything["children"] >= 2
+    assert everything["children_mb"] >= 128
+    assert ours["rss_mb"] == pytest.approx(everything["rss_mb"], rel=0.5)
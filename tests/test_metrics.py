@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from kijiji_scraper.metrics import (
+    STAGE_BUCKETS, StageMetrics, merge_snapshots, prometheus_text, stage_percentile,
+)
+from kijiji_scraper.rate import Throttled
+
+class FakeTimeoutError(Exception):
+    """Named like Playwright's and httpx's timeouts."""
+
+def observed(*secs, stage="goto"):
+    m = StageMetrics()
+    for s in secs:
+        m.observe(stage, s)
+    return m
+
+def test_stage_counts_outcomes_and_reraises():
+    m = StageMetrics()
+    with m.stage("goto"):
+        pass
+    for exc in (Throttled(429), asyncio.TimeoutError(), FakeTimeoutError(), ValueError("boom")):
+        with pytest.raises(type(exc)):
+            with m.stage("goto"):
+                raise exc
+    s = m.snapshot()["stages"]["goto"]
+    assert s["count"] == 5
+    assert s["outcomes"] == {"ok": 1, "throttled": 1, "timeout": 2, "error": 1}
+    assert sum(s["buckets"]) == 5
+
+def test_observe_files_calls_under_their_bucket_bound():
+    s = observed(0.01, 0.05, 0.06, 3.0, 600.0).snapshot()["stages"]["goto"]
+    by_bound = dict(zip(STAGE_BUCKETS, s["buckets"]))
+    assert by_bound[0.05] == 2  # bounds are inclusive, like Prometheus' le
+    assert by_bound[0.1] == 1
+    assert by_bound[5.0] == 1
+    assert by_bound[float("inf")] == 1
+    assert s["max_secs"] == 600.0
+
+def test_snapshot_does_not_share_state_with_the_live_metrics():
+    m = observed(0.2)
+    snap = m.snapshot(rows=3)
+    m.observe("goto", 0.2)
+    assert snap["stages"]["goto"]["count"] == 1
+    assert sum(snap["stages"]["goto"]["buckets"]) == 1
+    assert snap["rows"] == 3
+
+def test_percentiles_interpolate_within_a_bucket():
+    # 10 calls in (0.5, 1.0]: the median sits halfway through that bucket
+    s = observed(*[0.9] * 10).snapshot()["stages"]["goto"]
+    assert stage_percentile(s, 50) == pytest.approx(0.75)
+    # ... but no estimate runs past the slowest call
+    assert stage_percentile(s, 100) == pytest.approx(0.9)
+
+def test_percentiles_pick_the_bucket_holding_the_rank():
+    s = observed(*[0.03] * 90, *[8.0] * 10).snapshot()["stages"]["goto"]
+    assert stage_percentile(s, 50) <= 0.05
+    assert 5.0 < stage_percentile(s, 95) <= 8.0
+    assert stage_percentile(observed(120.0).snapshot()["stages"]["goto"], 99) == 120.0
+    assert stage_percentile({"count": 0, "max_secs": 0.0, "buckets": [0] * len(STAGE_BUCKETS)}, 95) == 0.0
+
+def test_merge_snapshots_adds_up_shards():
+    a = observed(0.02, 0.02, 2.0).snapshot(rows=10)
+    a["elapsed_secs"] = 60.0
+    b = observed(7.0).snapshot(rows=20)
+    b["elapsed_secs"] = 30.0
+    failing = StageMetrics()
+    with pytest.raises(FakeTimeoutError):
+        with failing.stage("phone"):
+            raise FakeTimeoutError()
+    c = failing.snapshot(rows=0)
+    c["elapsed_secs"] = 10.0
+
+    merged = merge_snapshots([a, b, c])
+    assert merged["rows"] == 30
+    assert merged["elapsed_secs"] == 60.0  # shards run side by side: the longest one
+    assert merged["rows_per_min"] == pytest.approx(30.0)
+    goto = merged["stages"]["goto"]
+    assert goto["count"] == 4
+    assert goto["secs"] == pytest.approx(9.04)
+    assert goto["max_secs"] == 7.0
+    assert goto["outcomes"] == {"ok": 4}
+    assert goto["buckets"] == [x + y for x, y in zip(a["stages"]["goto"]["buckets"], b["stages"]["goto"]["buckets"])]
+    assert merged["stages"]["phone"]["outcomes"] == {"timeout": 1}
+    # the merged histogram answers percentiles no single shard could
+    assert stage_percentile(goto, 50) <= 0.05
+    assert stage_percentile(goto, 100) == 7.0
+    # merging leaves the inputs alone
+    assert a["stages"]["goto"]["count"] == 3
+
+def test_prometheus_text_exposition():
+    snap = observed(0.02, 3.0).snapshot(rows=4)
+    snap["elapsed_secs"] = 120.0
+    snap["rows_per_min"] = 2.0
+    text = prometheus_text(snap)
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert "# TYPE kijiji_rows_total counter" in lines
+    assert "kijiji_rows_total 4" in lines
+    assert "kijiji_rows_per_minute 2.0" in lines
+    assert "kijiji_elapsed_seconds 120.0" in lines
+    assert 'kijiji_stage_calls_total{stage="goto",outcome="ok"} 2' in lines
+    assert 'kijiji_stage_max_seconds{stage="goto"} 3.0' in lines
+    assert "# TYPE kijiji_stage_duration_seconds histogram" in lines
+    buckets = [l for l in lines if l.startswith("kijiji_stage_duration_seconds_bucket")]
+    assert len(buckets) == len(STAGE_BUCKETS)
+    assert buckets[0] == 'kijiji_stage_duration_seconds_bucket{stage="goto",le="0.05"} 1'
+    assert 'kijiji_stage_duration_seconds_bucket{stage="goto",le="2.5"} 1' in buckets
+    assert 'kijiji_stage_duration_seconds_bucket{stage="goto",le="5.0"} 2' in buckets
+    assert buckets[-1] == 'kijiji_stage_duration_seconds_bucket{stage="goto",le="+Inf"} 2'
+    assert 'kijiji_stage_duration_seconds_count{stage="goto"} 2' in lines
+    assert 'kijiji_stage_duration_seconds_sum{stage="goto"} 3.02' in lines
+    # every sample line is "name[{labels}] value"
+    for line in lines:
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1])
+
+def test_prometheus_labels_go_on_every_sample_and_are_escaped():
+    text = prometheus_text(observed(0.1).snapshot(), labels={"job": 'C:\\out\\"cars"\nnew', "shard": 2})
+    label = 'job="C:\\\\out\\\\\\"cars\\"\\nnew",shard="2"'
+    assert 'kijiji_rows_total{' + label + '} 0' in text
+    assert 'kijiji_stage_calls_total{' + label + ',stage="goto",outcome="ok"} 1' in text
+    samples = [l for l in text.splitlines() if not l.startswith("#")]
+    assert all(label in l for l in samples)
+    # a raw newline in a label value would split the sample across lines
+    assert len(samples) == len([l for l in text.splitlines() if l.startswith("kijiji_")])
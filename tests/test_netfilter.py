@@ -0,0 +1,83 @@
+import asyncio
+
+from kijiji_scraper.netfilter import NetFilter
+
+def test_default_rules():
+    net = NetFilter()
+    assert net.should_block("https://securepubads.doubleclick.net/gampad/ads", "script")
+    assert net.should_block("https://www.google-analytics.com/analytics.js", "script")
+    assert net.should_block("https://www.kijiji.ca/static/gtm.js?id=GTM-1", "script")
+    assert net.should_block("https://media.kijiji.ca/api/v1/images/1.jpg", "image")
+    assert net.should_block("https://www.kijiji.ca/fonts/a.woff2", "font")
+    assert not net.should_block("https://www.kijiji.ca/v-cars-trucks/x/1712345678", "document")
+    assert not net.should_block("https://www.kijiji.ca/_next/static/chunks/app.js", "script")
+    assert not net.should_block("https://www.kijiji.ca/_next/static/css/app.css", "stylesheet")
+    # subdomains match, lookalike hosts don't
+    assert net.should_block("https://x.hotjar.com/c.js", "script")
+    assert not net.should_block("https://nothotjar.com/c.js", "script")
+
+def test_extra_block_rules():
+    net = NetFilter(block=["ads.example.com", "*/tracker/*", "type:stylesheet", "  "])
+    assert net.should_block("https://ads.example.com/x.js", "script")
+    assert net.should_block("https://cdn.example.com/tracker/pixel", "xhr")
+    assert net.should_block("https://www.kijiji.ca/app.css", "stylesheet")
+    assert not net.should_block("https://cdn.example.com/app.js", "script")
+
+def test_allow_rules_win():
+    net = NetFilter(block=["type:stylesheet"], allow=["googletagmanager.com", "*/keep.css*"])
+    assert not net.should_block("https://www.googletagmanager.com/gtm.js?id=1", "script")
+    assert not net.should_block("https://www.kijiji.ca/keep.css?v=2", "stylesheet")
+    assert net.should_block("https://www.kijiji.ca/other.css", "stylesheet")
+    # an allowed domain also lifts blocks on its parent or subdomains
+    assert "googletagmanager.com" not in net.domains
+
+def test_browser_patterns():
+    net = NetFilter(block=["type:media", "*/ads/*"])
+    patterns = net.browser_patterns()
+    assert "*://doubleclick.net/*" in patterns
+    assert "*://*.doubleclick.net/*" in patterns
+    assert "*/ads/*" in patterns
+    assert "*.mp4*" in patterns  # types become extension patterns
+    assert "*.png*" in patterns
+    assert not any("kijiji.ca/v-" in p for p in patterns)
+
+def test_browser_patterns_drop_allowed_rules():
+    net = NetFilter(block=["*/ads/*"], allow=["*/ads/*", "media.kijiji.ca"])
+    patterns = net.browser_patterns()
+    assert "*/ads/*" not in patterns
+    assert "*://media.kijiji.ca/*" not in patterns
+    assert "*.jpg*" in patterns
+
+def test_browser_patterns_match_allowed_domains_by_host():
+    net = NetFilter(block=["*://*.pubads.com/*", "*://ads.com.evil.net/*", "*/ads.com/*", "*://*ads.com/*"],
+                    allow=["ads.com"])
+    patterns = net.browser_patterns()
+    # hosts that merely contain the allowed domain stay blocked
+    assert "*://*.pubads.com/*" in patterns
+    assert "*://ads.com.evil.net/*" in patterns
+    assert "*/ads.com/*" in patterns
+    # a host wildcard that covers the allowed domain has to go
+    assert "*://*ads.com/*" not in patterns
+    net = NetFilter(block=["*://*.tracker.net/*", "*://tracker.net:8443/*"], allow=["cdn.tracker.net"])
+    # a broader host pattern would block the allowed subdomain too
+    assert not [p for p in net.browser_patterns() if "tracker.net" in p]
+
+def test_route_mode_counts():
+    net = NetFilter()
+
+    class Route:
+        def __init__(self, url, resource_type):
+            self.request = type("Request", (), {"url": url, "resource_type": resource_type})()
+            self.outcome = None
+
+        async def abort(self):
+            self.outcome = "abort"
+
+        async def fallback(self):
+            self.outcome = "fallback"
+
+    blocked, allowed = Route("https://clarity.ms/tag.js", "script"), Route("https://www.kijiji.ca/", "document")
+    asyncio.run(net._route(blocked))
+    asyncio.run(net._route(allowed))
+    assert (blocked.outcome, allowed.outcome) == ("abort", "fallback")
+    assert net.stats()["blocked"] == 1 and net.stats()["loaded"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+
+from kijiji_scraper import rate as rate_mod
+from kijiji_scraper.rate import RATE_DELAY_STEP, RateController
+
+def test_starts_at_half_concurrency():
+    assert RateController(8).limit == 4
+    assert RateController(1).limit == 1
+
+def test_healthy_window_adds_a_slot_and_trims_the_delay():
+    rc = RateController(4, start_delay=1.0, min_delay=0.3)
+    assert rc.limit == 2
+    for _ in range(3):
+        rc.record(200, 0.2)
+    assert (rc.limit, rc.delay) == (2, 1.0)
+    rc.record(200, 0.2)  # 2 x limit good responses
+    assert rc.limit == 3
+    assert rc.delay == 1.0 - RATE_DELAY_STEP
+
+def test_growth_stops_at_the_bounds():
+    rc = RateController(2, start_delay=0.35, min_delay=0.3)
+    for _ in range(50):
+        rc.record(200, 0.1)
+    assert rc.limit == 2
+    assert rc.delay == 0.3
+
+def test_bad_signals_halve_the_limit_and_double_the_delay(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_mod.time, "monotonic", lambda: clock[0])
+    rc = RateController(8, start_delay=1.0)
+    rc.record(429, 0.5)
+    assert (rc.limit, rc.delay, rc.throttled) == (2, 2.0, 1)
+    # more failures inside the cooldown count, but don't cut again
+    rc.record(timeout=True)
+    rc.record(200, rate_mod.RATE_SLOW_SECS + 1)
+    assert (rc.limit, rc.delay, rc.timeouts) == (2, 2.0, 1)
+    clock[0] += rate_mod.RATE_COOLDOWN_SECS + 1
+    rc.record(503, 0.5)
+    assert (rc.limit, rc.delay) == (1, 4.0)
+
+def test_delay_is_capped():
+    rc = RateController(2, start_delay=20.0, max_delay=30.0)
+    rc.record(timeout=True)
+    assert rc.delay == 30.0
+
+def test_a_failure_resets_the_healthy_streak(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_mod.time, "monotonic", lambda: clock[0])
+    rc = RateController(4, start_delay=1.0)
+    rc.record(429)
+    clock[0] += rate_mod.RATE_COOLDOWN_SECS + 1
+    rc.record(200, 0.1)
+    assert rc.limit == 1  # 2 x 1 good responses needed
+    rc.record(200, 0.1)
+    assert rc.limit == 2
+
+def test_slot_bounds_requests_in_flight():
+    rc = RateController(4, start_delay=0.0, min_delay=0.0)
+    rc.limit = 2
+    peak = [0]
+
+    async def request(i):
+        async with rc.slot(f"https://example.com/{i}"):
+            peak[0] = max(peak[0], rc.snapshot()["in_flight"])
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(request(i) for i in range(6)))
+    asyncio.run(run())
+    assert peak[0] == 2
+    assert rc.snapshot()["in_flight"] == 0
+
+def test_space_staggers_request_starts_per_domain(monkeypatch):
+    monkeypatch.setattr(rate_mod.random, "uniform", lambda a, b: 1.0)
+    rc = RateController(2, start_delay=0.05, min_delay=0.0)
+    starts = {}
+
+    async def request(url):
+        await rc.space(url)
+        starts.setdefault(url.split("/")[2], []).append(asyncio.get_running_loop().time())
+
+    async def run():
+        await asyncio.gather(*(request(u) for u in ["https://a.test/1", "https://a.test/2", "https://b.test/1"]))
+    asyncio.run(run())
+    a1, a2 = starts["a.test"]
+    assert a2 - a1 >= 0.045
+    assert starts["b.test"][0] - a1 < 0.02
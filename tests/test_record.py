@@ -0,0 +1,47 @@
+import pandas as pd
+
+from kijiji_scraper.record import CSV_COLUMNS, Listing, to_frame
+
+def make(href, scraped_at=1_700_000_000.0, **fields):
+    l = Listing(href, **fields)
+    l.scraped_at = scraped_at
+    return l
+
+def test_listing_record():
+    l = Listing("https://www.kijiji.ca/v-x/1", name="Car", price="$1")
+    assert l.ok and not Listing("https://www.kijiji.ca/v-x/2").ok
+    row = l.as_row()
+    assert list(row) == CSV_COLUMNS
+    assert (row["Name"], row["Price"], row["Phone"]) == ("Car", "$1", "-")
+
+def test_price_parsing():
+    prices = ["$12,500.00", "$ 9,999", "$0.99", "Please Contact", "-", None, "Swap/Trade", "$1,234.50"]
+    df = to_frame([make(f"h{i}", price=p) for i, p in enumerate(prices)])
+    assert df["Price Cents"].dtype == "Int64"
+    assert df["Price Cents"].tolist() == [1250000, 999900, 99, pd.NA, pd.NA, pd.NA, pd.NA, 123450]
+    # the text column keeps what the page showed, NA for missing
+    assert df["Price"].tolist() == ["$12,500.00", "$ 9,999", "$0.99", "Please Contact", pd.NA, pd.NA,
+                                    "Swap/Trade", "$1,234.50"]
+
+def test_kilometres_parsing():
+    kms = ["85,000 km", "120000", "—", "", None]
+    df = to_frame([make(f"h{i}", kilometres=k) for i, k in enumerate(kms)])
+    assert df["Km"].dtype == "Int64"
+    assert df["Km"].tolist() == [85000, 120000, pd.NA, pd.NA, pd.NA]
+
+def test_posted_at_from_age():
+    scraped = 1_700_000_000.0
+    ages = ["30 seconds ago", "25 mins ago", "3 hrs ago", "1 hour ago", "2 days ago", "1 week ago",
+            "Posted yesterday", None]
+    df = to_frame([make(f"h{i}", scraped, duration_posted=a) for i, a in enumerate(ages)])
+    assert str(df["Posted At"].dt.tz) == "UTC"
+    offsets = [scraped - ts.timestamp() if not pd.isna(ts) else None for ts in df["Posted At"]]
+    assert offsets == [30, 25 * 60, 3 * 3600, 3600, 2 * 86400, 604800, None, None]
+
+def test_categorical_and_text_columns():
+    df = to_frame([make("h1", body_style="Sedan", fuel="Gas"), make("h2", body_style="SUV", fuel="Gas"),
+                   make("h3")])
+    assert df["Body Style"].dtype == "category"
+    assert df["Fuel"].cat.categories.tolist() == ["Gas"]
+    assert df["Name"].dtype == "string"
+    assert df["Listing Link"].tolist() == ["h1", "h2", "h3"]
@@ -0,0 +1,230 @@
+import asyncio, json
+
+import pytest
+
+from kijiji_scraper import scraper
+import fake_browser
+from fake_browser import FakeSite, crawl, install
+
+def test_browser_engine_crawls_every_listing(tmp_path, monkeypatch):
+    site = FakeSite(pages=3, per_page=4)
+    install(monkeypatch, site)
+    events, rows = crawl(tmp_path / "out.csv", concurrency=2, phones="off")
+    assert len(rows) == 12
+    assert len({r["Listing Link"] for r in rows}) == 12
+    assert site.launches == 1
+    assert events[-1] == {"type": "done", "total": 12}
+
+def test_flush_events_carry_the_rows_they_wrote(tmp_path, monkeypatch):
+    install(monkeypatch, FakeSite(pages=3, per_page=5))
+    monkeypatch.setattr(scraper, "PREVIEW_ROWS", 4)
+    events, rows = crawl(tmp_path / "out.csv", concurrency=2, phones="off")
+    flushes = [e for e in events if e["type"] == "flush"]
+    assert [e["total"] for e in flushes] == [10, 15]
+    # each batch's newest PREVIEW_ROWS, in the CSV's columns and order
+    sent = [r for e in flushes for r in e["rows"]]
+    assert [len(e["rows"]) for e in flushes] == [4, 4]
+    assert [r["Listing Link"] for r in sent] == [r["Listing Link"] for r in rows[6:10] + rows[11:]]
+    assert list(sent[0]) == list(rows[0])
+    assert all(isinstance(v, str) for r in sent for v in r.values())
+    json.dumps(flushes)  # they cross process queues and the job's event log
+
+def peak_overlap(visits):
+    """Most visits in flight at once."""
+    edges = sorted([(v[2], 1) for v in visits] + [(v[3], -1) for v in visits])
+    peak = live = 0
+    for _, step in edges:
+        live += step
+        peak = max(peak, live)
+    return peak
+
+def test_listing_fetches_run_concurrently_up_to_the_worker_count(tmp_path, monkeypatch):
+    site = FakeSite(pages=4, per_page=6, listing_secs=0.05)
+    install(monkeypatch, site)
+    _, rows = crawl(tmp_path / "out.csv", max_pages=4, concurrency=3, phones="off")
+    assert len(rows) == 24
+    listings = [v for v in site.visits if v[0] == "listing"]
+    assert 1 < peak_overlap(listings) <= 3
+
+def test_listings_start_before_the_results_walk_ends(tmp_path, monkeypatch):
+    site = FakeSite(pages=4, per_page=2, listing_secs=0.02, search_secs=0.05)
+    install(monkeypatch, site)
+    _, rows = crawl(tmp_path / "out.csv", max_pages=4, concurrency=2, phones="off")
+    assert len(rows) == 8
+    first_listing = min(v[2] for v in site.visits if v[0] == "listing")
+    last_search = max(v[2] for v in site.visits if v[0] == "search")
+    assert first_listing < last_search
+
+def test_http_engine_without_phones_never_launches_chromium(tmp_path, monkeypatch):
+    install(monkeypatch, FakeSite(pages=2, per_page=5))
+
+    async def no_chromium(p, **kwargs):
+        raise RuntimeError("Executable doesn't exist")
+    monkeypatch.setattr(scraper, "create_context", no_chromium)
+    events, rows = crawl(tmp_path / "out.csv", max_pages=2, engine="http", phones="off", concurrency=2)
+    assert len(rows) == 10
+    assert not any(e["type"] == "pool" for e in events)
+
+@pytest.mark.parametrize("phones", ["off", "deferred"])
+def test_http_engine_launches_chromium_only_when_needed(tmp_path, monkeypatch, phones):
+    site = FakeSite(pages=1, per_page=2)
+    install(monkeypatch, site)
+    monkeypatch.setattr(scraper, "reveal_phone", lambda *args, **kwargs: _phone())
+    events, rows = crawl(tmp_path / "out.csv", max_pages=1, engine="http", phones=phones, outputs=["csv", "jsonl"])
+    assert len(rows) == 2
+    assert site.launches == (1 if phones == "deferred" else 0)
+    if phones == "deferred":
+        # the pass's numbers end up in every output
+        assert [r["Phone"] for r in rows] == [" +1-555-0100"] * 2
+        with open(tmp_path / "out.jsonl", encoding="utf-8") as f:
+            assert [json.loads(line)["Phone"] for line in f] == ["+1-555-0100"] * 2
+        backfilled = [e["msg"] for e in events if e["type"] == "log" and "backfilled" in e["msg"]]
+        assert backfilled == [f"Phone pass: backfilled 2 of 2 revealed in {tmp_path / name}"
+                              for name in ("out.csv", "out.jsonl")]
+    else:
+        assert [r["Phone"] for r in rows] == ["-"] * 2
+
+def test_results_walk_does_not_wait_for_listings_in_flight(tmp_path, monkeypatch):
+    # one listing worker with slow visits (like an inline phone reveal), and a queue
+    # that fills up so the walker resumes right as the worker starts a listing
+    site = FakeSite(pages=4, per_page=2, listing_secs=0.2, search_secs=0.01)
+    install(monkeypatch, site)
+    monkeypatch.setattr(scraper, "HREF_QUEUE_MAX", 2)
+    _, rows = crawl(tmp_path / "out.csv", max_pages=4, concurrency=1, phones="off")
+    assert len(rows) == 8
+    listings = [v for v in site.visits if v[0] == "listing"]
+    searches = [v for v in site.visits if v[0] == "search"]
+    overlapped = [s for s in searches if any(l[2] <= s[2] < l[3] for l in listings)]
+    assert len(overlapped) >= 2
+
+@pytest.mark.parametrize("engine", ["browser", "http"])
+def test_recycling_under_load_does_not_deadlock(tmp_path, monkeypatch, engine):
+    # a recycle after every visit, with the walker and several workers all contending for
+    # the browser while the rate controller keeps fewer slots than workers
+    site = FakeSite(pages=6, per_page=4, listing_secs=0.01, search_secs=0.01)
+    install(monkeypatch, site)
+    monkeypatch.setattr(scraper, "HREF_QUEUE_MAX", 3)
+
+    async def unparsable(self, href, referer):
+        # every listing falls back to the browser, so the HTTP engine holds use() too
+        await self.site.visit(href)
+        return {"attributes": []}
+    monkeypatch.setattr(fake_browser.HttpEngine, "listing_fields", unparsable)
+    events, rows = crawl(tmp_path / "out.csv", max_pages=6, concurrency=4, phones="off", engine=engine,
+                         recycle_listings=1, timeout=20)
+    assert len(rows) == 24 and all(r["Name"] != "-" for r in rows)
+    assert sum(1 for e in events if e["type"] == "log" and e["msg"].startswith("Recycling browser")) > 1
+
+class SlowContext:
+    """new_page() yields to the loop, like Playwright's round trip to the browser."""
+    def __init__(self):
+        self.opened = self.live = self.peak = 0
+
+    async def new_page(self):
+        self.opened += 1
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        await asyncio.sleep(0.01)
+        return SlowPage(self)
+
+class SlowPage:
+    def __init__(self, context):
+        self.context = context
+
+    async def goto(self, url):
+        await asyncio.sleep(0)
+
+    async def close(self):
+        self.context.live -= 1
+
+def test_page_pool_never_opens_more_than_size():
+    context = SlowContext()
+    pool = scraper.PagePool(context, size=2, max_uses=2)
+
+    async def visit(failed):
+        page = await pool.acquire()
+        await asyncio.sleep(0.005)
+        await pool.release(page, failed=failed)
+
+    async def run():
+        await asyncio.gather(*(visit(failed=i % 3 == 0) for i in range(12)))
+    asyncio.run(run())
+    assert pool.stats()["checkouts"] == 12
+    assert context.peak == 2
+    assert context.opened == 2 + pool.stats()["recycles"]
+
+async def _phone():
+    return "+1-555-0100"
+
+class ProcessInfoBrowser:
+    """A launched browser as BrowserHost sees it: its CDP session lists Chromium's processes."""
+    def __init__(self, process_info):
+        self.process_info = process_info
+
+    async def new_browser_cdp_session(self):
+        return self
+
+    async def send(self, method, params=None):
+        assert method == "SystemInfo.getProcessInfo"
+        if isinstance(self.process_info, Exception):
+            raise self.process_info
+        return {"processInfo": self.process_info}
+
+    async def detach(self):
+        pass
+
+    async def close(self):
+        pass
+
+def test_browser_pid_comes_from_the_browser_process():
+    info = [{"type": "renderer", "id": 11}, {"type": "browser", "id": 10}, {"type": "gpu-process", "id": 12}]
+    assert asyncio.run(scraper.browser_pid(ProcessInfoBrowser(info))) == 10
+    assert asyncio.run(scraper.browser_pid(ProcessInfoBrowser([{"type": "renderer", "id": 11}]))) is None
+    assert asyncio.run(scraper.browser_pid(ProcessInfoBrowser(RuntimeError("no SystemInfo")))) is None
+    assert asyncio.run(scraper.browser_pid(object())) is None
+
+def fake_memory_stats(roots):
+    def memory_stats(pid=None, root=None):
+        roots.append(root)
+        return {"rss_mb": 100.0, "children_mb": 5000.0, "children": 4}
+    return memory_stats
+
+def test_rss_recycling_measures_only_this_hosts_browser(monkeypatch):
+    roots = []
+    monkeypatch.setattr(scraper, "memory_stats", fake_memory_stats(roots))
+    events = []
+    host = scraper.BrowserHost(None, 1, scraper.NetFilter(), recycle_listings=0, recycle_rss_mb=1500,
+                               emit=events.append)
+    host.browser_pid = 4242
+    assert host._due() == "browser RSS 5000 MB"
+    assert roots == [4242]
+    assert events[0]["type"] == "memory"
+    assert events[0]["children_mb"] == 5000.0
+
+@pytest.mark.parametrize("cdp_url", [None, "http://127.0.0.1:9222"])
+def test_rss_recycling_is_off_without_a_browser_of_its_own(monkeypatch, cdp_url):
+    # a browser server's RSS is every crawl's, and without its own browser's pid a host would
+    # only see the whole process: other jobs' Chromiums (the app runs them as threads) included
+    roots = []
+    monkeypatch.setattr(scraper, "memory_stats", fake_memory_stats(roots))
+    events = []
+    host = scraper.BrowserHost(None, 1, scraper.NetFilter(), recycle_listings=0, recycle_rss_mb=1500,
+                               emit=events.append, cdp_url=cdp_url)
+    assert host._due() is None
+    assert host.check_memory(force=True) is None
+    assert roots == []
+    assert events == []
+
+def test_host_learns_its_browser_pid_at_launch(monkeypatch):
+    async def create_context(p, **kwargs):
+        return ProcessInfoBrowser([{"type": "browser", "id": 4242}]), None
+    monkeypatch.setattr(scraper, "create_context", create_context)
+    monkeypatch.setattr(scraper, "PagePool", lambda *args, **kwargs: None)
+    host = scraper.BrowserHost(None, 1, scraper.NetFilter())
+
+    async def run():
+        await host.start()
+        assert host.browser_pid == 4242
+        await host.close()
+        assert host.browser_pid is None
+    asyncio.run(run())
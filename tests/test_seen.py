@@ -0,0 +1,73 @@
+import asyncio, queue, threading
+
+import pytest
+
+from kijiji_scraper import scraper, seen
+from kijiji_scraper.seen import SeenIndex, listing_id
+from fake_browser import FakeSite, crawl, install
+
+@pytest.mark.parametrize("href, expected", [
+    ("/v-cars-trucks/calgary/2015-honda-civic/1712345678", "1712345678"),
+    ("https://www.kijiji.ca/v-cars-trucks/calgary/2015-honda-civic/1712345678/?src=srp", "1712345678"),
+    ("/v-cars-trucks/calgary/2015-honda-civic/123", None),
+    ("/b-cars-trucks/canada/c174l0", None),
+])
+def test_listing_id(href, expected):
+    assert listing_id(href) == expected
+
+def test_mark_is_fresh_for_the_ttl(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(seen.time, "time", lambda: now[0])
+    index = SeenIndex(str(tmp_path / "seen.sqlite"), ttl=3600)
+    href = "/v-cars-trucks/ottawa/car/1712345678"
+    assert not index.is_fresh(href)
+    index.mark(href)
+    # keyed by ID: the same listing under another slug or host is the same entry
+    assert index.is_fresh("https://www.kijiji.ca/v-cars-trucks/toronto/other/1712345678")
+    now[0] += 3599
+    assert index.is_fresh(href)
+    now[0] += 1
+    assert not index.is_fresh(href)
+    index.mark(href)
+    assert index.is_fresh(href)
+    index.close()
+
+def test_hrefs_without_an_id_are_never_fresh(tmp_path):
+    index = SeenIndex(str(tmp_path / "seen.sqlite"))
+    index.mark("/v-cars-trucks/ottawa/car/")
+    assert not index.is_fresh("/v-cars-trucks/ottawa/car/")
+    assert index.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0] == 0
+    index.close()
+
+def test_listings_seen_within_the_ttl_are_skipped(tmp_path, monkeypatch):
+    site = FakeSite(pages=2, per_page=3)
+    install(monkeypatch, site)
+    db = str(tmp_path / "seen.sqlite")
+    _, rows = crawl(tmp_path / "first.csv", max_pages=2, phones="off", seen_db=db)
+    assert len(rows) == 6
+    site.visits.clear()
+    events, rows = crawl(tmp_path / "second.csv", max_pages=2, phones="off", seen_db=db)
+    assert rows == []
+    assert not [v for v in site.visits if v[0] == "listing"]
+    assert sum(1 for e in events if e["type"] == "log" and e["msg"] == "Skipping 3 listings scraped recently") == 2
+    # past the TTL they are scraped again
+    site.visits.clear()
+    _, rows = crawl(tmp_path / "third.csv", max_pages=2, phones="off", seen_db=db, seen_ttl=0)
+    assert len(rows) == 6
+
+def test_rows_are_marked_only_once_written(tmp_path, monkeypatch):
+    install(monkeypatch, FakeSite(pages=1, per_page=4))
+    monkeypatch.setattr(scraper, "FLUSH_EVERY", 2)
+
+    def crash(rows):
+        raise OSError("disk full")
+    monkeypatch.setattr(scraper, "to_frame", crash)
+    db = str(tmp_path / "seen.sqlite")
+    out_q: queue.Queue = queue.Queue()
+    asyncio.run(scraper.scrape_kijiji(scraper.DEFAULT_URL, 1, str(tmp_path / "out.csv"), lambda m: None,
+                                      threading.Event(), out_q, phones="off", seen_db=db))
+    events = [out_q.get() for _ in range(out_q.qsize())]
+    assert events[-1]["type"] == "error" and "disk full" in events[-1]["trace"]
+    index = SeenIndex(db)
+    assert index.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0] == 0
+    index.close()
@@ -0,0 +1,79 @@
+import csv, os, queue, sys, threading, types
+
+import pytest
+
+from bench.mock_server import LISTING_ID_BASE, MockSite, serve
+from kijiji_scraper.categories import BASE_URL, CATEGORIES
+from kijiji_scraper.scraper import page_url
+from kijiji_scraper.seen import SeenIndex
+from kijiji_scraper.sharding import plan_shards, run_sharded, shard_context
+
+def test_plan_shards_splits_page_ranges():
+    shards = plan_shards({"cars": "u1", "bikes": "u2"}, 25, pages_per_shard=10)
+    assert [(s["label"], s["first_page"], s["pages"]) for s in shards] == [
+        ("cars", 1, 10), ("cars", 11, 10), ("cars", 21, 5), ("bikes", 1, 10), ("bikes", 11, 10), ("bikes", 21, 5)]
+
+def test_shard_workers_are_never_forked():
+    assert shard_context().get_start_method() in ("forkserver", "spawn")
+
+@pytest.fixture(scope="module")
+def mock_site():
+    """bench's mock kijiji.ca; shard workers are fresh interpreters, so they find it through KIJIJI_BASE_URL."""
+    site = MockSite(per_page=3, total_pages=2)
+    server = serve(site)
+    base = f"http://127.0.0.1:{server.server_port}"
+    old = os.environ.get("KIJIJI_BASE_URL")
+    os.environ["KIJIJI_BASE_URL"] = base
+    yield site, CATEGORIES["cars"][1].replace(BASE_URL, base)
+    server.shutdown()
+    if old is None:
+        del os.environ["KIJIJI_BASE_URL"]
+    else:
+        os.environ["KIJIJI_BASE_URL"] = old
+
+def run(url, csv_path, max_pages=2, **crawl_opts):
+    out_q: queue.Queue = queue.Queue()
+    run_sharded(plan_shards({"cars": url}, max_pages, 1), str(csv_path), 2, threading.Event(), out_q,
+                engine="http", phones="off", **crawl_opts)
+    events = []
+    while not out_q.empty():
+        events.append(out_q.get())
+    return events
+
+def test_sharded_run_merges_every_shard(tmp_path, mock_site):
+    _, url = mock_site
+    events = run(url, tmp_path / "out.csv")
+    assert events[-1] == {"type": "done", "total": 6, "failed_shards": 0}
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len({r["Listing Link"] for r in rows}) == 6
+    # the app's live preview: every shard's flushed rows are relayed
+    sent = [r["Listing Link"] for e in events if e["type"] == "flush" for r in e.get("rows", ())]
+    assert sorted(sent) == sorted(r["Listing Link"] for r in rows)
+    assert not any(p.name.startswith("out.part") for p in tmp_path.iterdir())
+
+def test_workers_do_not_rerun_the_parents_main_script(tmp_path, mock_site, monkeypatch):
+    # `streamlit run app.py` installs app.py as __main__; spawned workers must not execute it
+    script = tmp_path / "app.py"
+    marker = tmp_path / "ran"
+    script.write_text(f"open({str(marker)!r}, 'a').close()\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    _, url = mock_site
+    events = run(url, tmp_path / "out.csv")
+    assert sys.modules["__main__"] is main
+    assert events[-1]["total"] == 6
+    assert not marker.exists()
+
+def test_incremental_sharded_run_raises_the_mark_once(tmp_path, mock_site):
+    _, url = mock_site
+    db = str(tmp_path / "seen.sqlite")
+    events = run(url, tmp_path / "first.csv", incremental=True, seen_db=db)
+    assert events[-1]["total"] == 6
+    index = SeenIndex(db)
+    # page 2's IDs are the newest on the mock site
+    assert index.get_watermark(page_url(url, 1)) == LISTING_ID_BASE + 5
+    index.close()
+    events = run(url, tmp_path / "second.csv", incremental=True, seen_db=db)
+    assert events[-1] == {"type": "done", "total": 0, "failed_shards": 0}
@@ -0,0 +1,168 @@
+import csv, json, sqlite3
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from kijiji_scraper.record import Listing, to_frame
+from kijiji_scraper.sinks import JsonlSink, ParquetSink, SqliteSink, backfill_phones, merge_parts, open_sinks
+
+HREF = "https://www.kijiji.ca/v-cars-trucks/ottawa/2016-honda-civic/1712345678"
+OTHER = "https://www.kijiji.ca/v-cars-trucks/calgary/2012-ford-f-150/1712345679"
+
+def listing(href=HREF, **fields):
+    base = dict(name="2016 Honda Civic", price="$12,500.00", kilometres="85,000 km",
+                duration_posted="3 hrs ago", fuel="Gas")
+    return Listing(href, **{**base, **fields})
+
+def rows(db, sql):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def test_sqlite_upserts_by_listing_id(tmp_path):
+    db = str(tmp_path / "listings.sqlite")
+    sink = SqliteSink(db, category="cars-trucks")
+    sink.write(to_frame([listing(), listing(OTHER, name="2012 Ford F-150", price="$9,000")]))
+    sink.write(to_frame([listing(phone="+1-555-0100")]))
+    sink.close()
+    assert rows(db, "SELECT listing_id, category, price, kilometres, phone FROM listings ORDER BY listing_id") == [
+        ("1712345678", "cars-trucks", 12500.0, 85000, "+1-555-0100"),
+        ("1712345679", "cars-trucks", 9000.0, 85000, None),
+    ]
+    assert rows(db, "SELECT COUNT(*) FROM price_history") == [(0,)]
+    assert rows(db, "PRAGMA journal_mode") == [("wal",)]
+
+def test_sqlite_records_price_and_mileage_changes(tmp_path):
+    db = str(tmp_path / "listings.sqlite")
+    sink = SqliteSink(db)
+    sink.write(to_frame([listing()]))
+    sink.write(to_frame([listing(price="$11,900")]))
+    sink.write(to_frame([listing(price="$11,900", kilometres="86,200 km")]))
+    sink.close()
+    history = rows(db, "SELECT listing_id, old_price, new_price, old_kilometres, new_kilometres "
+                       "FROM price_history ORDER BY changed_at, rowid")
+    assert history == [
+        ("1712345678", 12500.0, 11900.0, 85000, 85000),
+        ("1712345678", 11900.0, 11900.0, 85000, 86200),
+    ]
+
+def test_sqlite_keeps_stored_fields_a_later_visit_missed(tmp_path):
+    db = str(tmp_path / "listings.sqlite")
+    sink = SqliteSink(db)
+    sink.write(to_frame([listing(seller="Jamie")]))
+    first_seen = rows(db, "SELECT first_seen FROM listings")[0][0]
+    sink.write(to_frame([listing(price="-", kilometres=None, seller=None)]))
+    sink.close()
+    assert rows(db, "SELECT price, kilometres, seller FROM listings") == [(12500.0, 85000, "Jamie")]
+    assert rows(db, "SELECT first_seen FROM listings")[0][0] == first_seen
+    # a missing price is not a change
+    assert rows(db, "SELECT COUNT(*) FROM price_history") == [(0,)]
+
+def test_sqlite_skips_links_without_an_id_and_backfills_phones(tmp_path):
+    db = str(tmp_path / "listings.sqlite")
+    sink = SqliteSink(db)
+    sink.write(to_frame([listing(), listing("https://www.kijiji.ca/b-cars-trucks/canada/c174l0")]))
+    assert sink.backfill_phones({HREF: "+1-555-0199", OTHER: "+1-555-0100"}) == 1
+    assert sink.backfill_phones({HREF: "+1-555-0111"}) == 0  # already set
+    sink.close()
+    assert rows(db, "SELECT listing_id, phone FROM listings") == [("1712345678", "+1-555-0199")]
+
+def test_open_sinks_writes_every_format(tmp_path):
+    out = str(tmp_path / "cars.csv")
+    sinks = open_sinks(out, ["csv", "jsonl", "sqlite"], "cars-trucks")
+    for sink in sinks:
+        sink.write(to_frame([listing(phone="+1-555-0100")]))
+        sink.close()
+    with open(out, newline="", encoding="utf-8") as f:
+        row = next(csv.DictReader(f))
+    assert row["Phone"] == " +1-555-0100"  # Excel-safe padding, CSV only
+    assert row["Seller Name"] == "-"
+    with open(tmp_path / "cars.jsonl", encoding="utf-8") as f:
+        obj = json.loads(f.readline())
+    assert (obj["Phone"], obj["Price Cents"], obj["Km"], obj["Seller Name"]) == ("+1-555-0100", 1250000, 85000, None)
+    assert rows(str(tmp_path / "cars.sqlite"), "SELECT COUNT(*) FROM listings") == [(1,)]
+
+def test_csv_phone_backfill(tmp_path):
+    out = str(tmp_path / "cars.csv")
+    sink = open_sinks(out)[0]
+    sink.write(to_frame([listing(), listing(OTHER)]))
+    sink.close()
+    assert backfill_phones(out, {HREF: "+1-555-0100", OTHER: "-"}) == 1
+    with open(out, newline="", encoding="utf-8") as f:
+        phones = [r["Phone"] for r in csv.DictReader(f)]
+    assert phones == [" +1-555-0100", "-"]
+
+THIRD = "https://www.kijiji.ca/v-cars-trucks/halifax/2019-mazda-3/1712345680"
+
+def jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_parquet_schema_and_one_row_group_per_flush(tmp_path):
+    out = str(tmp_path / "cars.parquet")
+    sink = ParquetSink(out)
+    sink.write(to_frame([listing(), listing(OTHER, fuel="Diesel")]))
+    sink.write(to_frame([listing(THIRD, price="Please Contact", fuel=None)]))
+    sink.close()
+    meta = pq.ParquetFile(out)
+    assert meta.metadata.num_row_groups == 2
+    schema = meta.schema_arrow
+    # string or large_string, depending on the pandas string dtype
+    assert pa.types.is_string(schema.field("Name").type) or pa.types.is_large_string(schema.field("Name").type)
+    assert schema.field("Price Cents").type == pa.int64()
+    assert schema.field("Km").type == pa.int64()
+    assert pa.types.is_timestamp(schema.field("Posted At").type)
+    assert schema.field("Fuel").type == pa.dictionary(pa.int32(), pa.string())
+    table = pq.read_table(out)
+    assert table.column("Listing Link").to_pylist() == [HREF, OTHER, THIRD]
+    assert table.column("Price Cents").to_pylist() == [1250000, 1250000, None]
+    assert table.column("Fuel").to_pylist() == ["Gas", "Diesel", None]
+
+def test_parquet_append_keeps_earlier_rows_and_backfills(tmp_path):
+    out = str(tmp_path / "cars.parquet")
+    sink = ParquetSink(out)
+    sink.write(to_frame([listing()]))
+    sink.close()
+    sink = ParquetSink(out, append=True)
+    sink.write(to_frame([listing(OTHER)]))
+    sink.close()
+    assert pq.read_table(out).column("Listing Link").to_pylist() == [HREF, OTHER]
+    assert sink.backfill_phones({OTHER: "+1-555-0100", HREF: "-"}) == 1
+    assert pq.read_table(out).column("Phone").to_pylist() == [None, "+1-555-0100"]
+    # without append the file starts over
+    sink = ParquetSink(out)
+    sink.write(to_frame([listing(THIRD)]))
+    sink.close()
+    assert pq.read_table(out).column("Listing Link").to_pylist() == [THIRD]
+
+def test_jsonl_append_and_backfill(tmp_path):
+    out = str(tmp_path / "cars.jsonl")
+    sink = JsonlSink(out)
+    sink.write(to_frame([listing()]))
+    sink.close()
+    sink = JsonlSink(out, append=True)
+    sink.write(to_frame([listing(OTHER, phone="+1-555-0111")]))
+    sink.close()
+    objs = jsonl(out)
+    assert [o["Listing Link"] for o in objs] == [HREF, OTHER]
+    assert objs[0]["Posted At"].endswith("Z") and objs[0]["Fuel"] == "Gas"
+    assert sink.backfill_phones({HREF: "+1-555-0100", OTHER: "+1-555-0199"}) == 1
+    assert [o["Phone"] for o in jsonl(out)] == ["+1-555-0100", "+1-555-0111"]
+
+def test_merge_parts(tmp_path):
+    parts = {fmt: [str(tmp_path / f"cars.part{i:03d}.{fmt}") for i in range(3)] for fmt in ("jsonl", "parquet")}
+    batches = [[listing()], [listing(OTHER), listing(THIRD, fuel=None)]]
+    for fmt, sink_cls in (("jsonl", JsonlSink), ("parquet", ParquetSink)):
+        # the last shard never wrote anything
+        for path, batch in zip(parts[fmt], batches):
+            sink = sink_cls(path)
+            sink.write(to_frame(batch))
+            sink.close()
+        assert merge_parts(parts[fmt], str(tmp_path / f"cars.{fmt}")) == 3
+    assert [o["Listing Link"] for o in jsonl(tmp_path / "cars.jsonl")] == [HREF, OTHER, THIRD]
+    table = pq.read_table(tmp_path / "cars.parquet")
+    assert table.column("Listing Link").to_pylist() == [HREF, OTHER, THIRD]
+    assert table.column("Km").to_pylist() == [85000] * 3
+    assert merge_parts([], str(tmp_path / "none.parquet")) == 0